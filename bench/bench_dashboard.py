@@ -0,0 +1,71 @@
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+
+# Dashboard render times (src/dashboard.py): the single figure, the cached
+# panel mode from scratch (1 and all workers), with nothing changed, and
+# after a change to the daily KPIs only.
+#
+#   python bench/bench_dashboard.py [reviews] [apps]
+
+WORK_DIR = BENCH_DIR / ".work" / "dashboard"
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    os.chdir(WORK_DIR)
+    raw = Path("data/raw")
+    if not (raw / "reviews.jsonl").exists() or len(sys.argv) > 1:
+        generate(raw, reviews, apps)
+
+    import dashboard
+    import sentiment
+    import serve
+    import transform
+
+    transform.REVIEWS_FORMATS = ("csv",)
+    transform.TEXT_INDEX = False
+    transform.main()
+    sentiment.main()
+    serve.SKETCH_KPIS = False
+    serve.main()
+
+    app_rows = dashboard.load_app_kpis()
+    daily_rows = dashboard.load_daily_kpis()
+    inputs = (app_rows, daily_rows, dashboard.load_cube(), dashboard.load_complaints())
+
+    seconds, _ = timed(
+        lambda: dashboard.save_dashboard(dashboard.draw_dashboard(*inputs))
+    )
+    print(f"single figure:              {seconds:.2f}s")
+    for workers in sorted({1, os.cpu_count() or 1}):
+        shutil.rmtree(dashboard.PANEL_DIR, ignore_errors=True)
+        dashboard.WORKERS = workers
+        seconds, drawn = timed(dashboard.render_cached, *inputs)
+        print(f"cached, cold, {workers} worker(s):  {seconds:.2f}s ({len(drawn)} panels)")
+    seconds, drawn = timed(dashboard.render_cached, *inputs)
+    print(f"cached, nothing changed:    {seconds:.2f}s ({len(drawn)} panels)")
+    daily_rows[-1]["daily_avg_rating"] = 1.0
+    seconds, drawn = timed(dashboard.render_cached, *inputs)
+    print(f"cached, daily KPIs changed: {seconds:.2f}s ({', '.join(drawn)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+
+# Decoding raw reviews in transform.py: the previous per-row path (one
+# json.loads per line, then parse_int / normalize_timestamp per field)
+# against the schema-driven batch decoder (rawlog.decode_lines +
+# schema.Decoder), on synthetic reviews with a share of malformed ones.
+#
+#   python bench/bench_decode.py [reviews] [apps] [malformed share]
+
+WORK_DIR = BENCH_DIR / ".work" / "decode"
+BATCH_SIZE = 5000
+
+
+# transform.py's per-row functions before the schema decoder.
+def parse_int(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    if isinstance(value, str):
+        cleaned = value.replace(",", "").replace("+", "").strip()
+        if cleaned == "":
+            return None
+        try:
+            return int(cleaned)
+        except ValueError:
+            return None
+    return None
+
+
+def normalize_timestamp(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, str):
+        try:
+            dt = datetime.fromisoformat(value)
+            return dt.strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return value
+    return str(value)
+
+
+def review_row(obj, app_name_by_id):
+    app_id = obj.get("appId")
+    return {
+        "app_id": app_id,
+        "app_name": app_name_by_id.get(app_id),
+        "reviewId": obj.get("reviewId"),
+        "userName": obj.get("userName"),
+        "score": parse_int(obj.get("score")),
+        "content": obj.get("content"),
+        "thumbsUpCount": parse_int(obj.get("thumbsUpCount")),
+        "at": normalize_timestamp(obj.get("at")),
+    }
+
+
+MALFORMED = [
+    ("score", "five"),
+    ("score", 9),
+    ("thumbsUpCount", -3),
+    ("at", "last tuesday"),
+    ("reviewId", None),
+]
+
+
+def corrupt(lines, share, rng):
+    picked = np.flatnonzero(rng.random(len(lines)) < share)
+    for k, i in enumerate(picked):
+        obj = json.loads(lines[i])
+        field, value = MALFORMED[k % len(MALFORMED)]
+        obj[field] = value
+        lines[i] = json.dumps(obj).encode()
+    return len(picked)
+
+
+def per_row(lines, names):
+    rows = []
+    for line in lines:
+        rows.append(review_row(json.loads(line), names))
+    return rows
+
+
+def batched(lines, names):
+    import rawlog
+    import transform
+
+    rows, rejected = [], 0
+    for start in range(0, len(lines), BATCH_SIZE):
+        objs = rawlog.decode_lines(lines[start : start + BATCH_SIZE])
+        decoded, rejects = transform.REVIEW_DECODER.decode(objs)
+        for row in decoded:
+            row["app_name"] = names.get(row["app_id"])
+        rows += decoded
+        rejected += len(rejects)
+    return rows, rejected
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    share = float(sys.argv[3]) if len(sys.argv) > 3 else 0.001
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    os.chdir(WORK_DIR)
+    raw = Path("data/raw")
+    generate(raw, reviews, apps)
+    lines = (raw / "reviews.jsonl").read_bytes().splitlines()
+    names = {f"com.synthetic.notes{i:06d}": f"Synthetic Notes {i}" for i in range(apps)}
+    malformed = corrupt(lines, share, np.random.default_rng(7))
+
+    old, old_s = timed(per_row, lines, names)
+    (new, rejected), new_s = timed(batched, lines, names)
+    kept = [row for row in old if row["reviewId"] is not None]
+    assert rejected == malformed, (rejected, malformed)
+    assert len(new) == len(lines) - malformed
+    # The valid rows come out the same; the per-row path kept the malformed
+    # ones too, with None or the raw value in place of the bad field.
+    bad_ids = {row["reviewId"] for row in kept} - {row["reviewId"] for row in new}
+    assert [r for r in kept if r["reviewId"] not in bad_ids] == new
+
+    n = len(lines)
+    print(f"{n} reviews, {malformed} malformed:")
+    print(f"  per-row decode: {old_s:6.2f}s ({n / old_s:,.0f} rows/s), malformed kept")
+    print(f"  batch decode:   {new_s:6.2f}s ({n / new_s:,.0f} rows/s), {rejected} quarantined")
+    print(f"  speedup: {old_s / new_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+WORK_DIR = BENCH_DIR / ".work" / "ingest_cache"
+os.environ["BENCH_STUB_DATA"] = str(WORK_DIR / "stub")
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR / "stub"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+
+# Ingest (src/ingest.py) against the offline stub under a request rate limit:
+# recording into an empty response cache, a second run inside the TTLs, and
+# a replay of the recording with the scraper removed.
+#
+#   python bench/bench_ingest_cache.py [reviews] [apps] [requests/s]
+
+
+def run(**overrides):
+    import ingest
+
+    for name, value in overrides.items():
+        setattr(ingest, name, value)
+    shutil.rmtree(ingest.RAW_DIR, ignore_errors=True)
+    ingest.RAW_DIR.mkdir(parents=True)
+    started = time.perf_counter()
+    ingest.main()
+    return time.perf_counter() - started
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 20.0
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    os.chdir(WORK_DIR)
+    generate(Path("stub"), reviews, apps)
+
+    import ingest
+
+    with open("stub/apps.jsonl", encoding="utf-8") as f:
+        first_app = json.loads(f.readline())
+    base = {
+        "NUM_APPS": apps,
+        "TEST_APP_ID": first_app["appId"],
+        "MAX_REVIEWS_PER_APP": None,
+        "SLEEP_SECONDS": 0,
+        "CONCURRENT": True,
+        "REQUESTS_PER_SECOND": rate,
+    }
+    shutil.rmtree(ingest.RESPONSE_CACHE.parent, ignore_errors=True)
+    results = [("record", run(**base))]
+    results.append(("within TTL", run(**base)))
+    scraper = ingest.search, ingest.gp_app, ingest.reviews
+    ingest.search = ingest.gp_app = ingest.reviews = None
+    results.append(("replay", run(**base, REPLAY=True)))
+    ingest.search, ingest.gp_app, ingest.reviews = scraper
+
+    print()
+    print(f"{reviews} reviews, {apps} apps, {rate:g} requests/s:")
+    for name, seconds in results:
+        print(f"  {name:<11} {seconds:6.2f}s ({reviews / seconds:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+WORK_DIR = BENCH_DIR / ".work" / "ingest_queue"
+os.environ["BENCH_STUB_DATA"] = str(WORK_DIR / "stub")
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR / "stub"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+
+# Queue-backed ingestion (src/ingest_queue.py) against the offline stub:
+# the same markets drained by 1, 2 and 4 worker processes sharing one
+# request rate. Once the rate is the bottleneck, more workers must not add
+# throughput; below it, throughput shows how far adding workers scales.
+# Overrides reach the workers by fork, so this runs on Linux/macOS only.
+#
+#   python bench/bench_ingest_queue.py [reviews] [apps] [markets] [requests/s]
+
+
+def drain(workers):
+    import ingest
+    import ingest_queue
+
+    shutil.rmtree(ingest_queue.MARKETS_DIR, ignore_errors=True)
+    ingest_queue.JobQueue.reset(ingest_queue.QUEUE_DB)
+    started = time.perf_counter()
+    ingest_queue.run(workers)
+    return time.perf_counter() - started
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    markets = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    rate = float(sys.argv[4]) if len(sys.argv) > 4 else 10.0
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    os.chdir(WORK_DIR)
+    generate(Path("stub"), reviews, apps)
+
+    import ingest
+    import ingest_queue
+
+    ingest.NUM_APPS = apps
+    ingest.MAX_REVIEWS_PER_APP = None
+    ingest.CACHE_RESPONSES = False
+    ingest.REQUEST_BURST = 1
+    ingest_queue.COUNTRIES = [f"c{i}" for i in range(markets)]
+    ingest_queue.REQUESTS_PER_SECOND = rate
+
+    results = [(workers, drain(workers)) for workers in (1, 2, 4)]
+    rows = 0
+    for market in ingest_queue.MARKETS_DIR.iterdir():
+        with (market / "reviews_log" / "index.jsonl").open(encoding="utf-8") as f:
+            rows += sum(json.loads(line)["rows"] for line in f)
+
+    print()
+    print(f"{markets} markets x {apps} apps, {rows} reviews, {rate:g} requests/s shared:")
+    for workers, seconds in results:
+        print(f"  {workers} worker(s): {seconds:6.2f}s ({rows / seconds:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import http.client
+import sys
+import threading
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+
+import kpi_service  # noqa: E402
+
+
+# Throughput of src/kpi_service.py: in-process query latency, then HTTP
+# requests per second from keep-alive clients, over the KPI CSVs in the
+# current directory.
+#
+#   python bench/bench_kpi_service.py [seconds] [clients]
+
+QUERIES = [
+    "/top?metric=reviews_count&k=10",
+    "/top?metric=avg_thumbs_up&k=10",
+    "/top?metric=avg_review_length&k=10",
+    "/top?metric=rating_std_dev&k=10",
+    "/top?metric=review_velocity&k=10",
+    "/top?metric=avg_rating&k=10&order=asc",
+    "/daily?start=2025-01-01&end=2025-03-31",
+]
+
+
+def direct_latency(service, repeat=20_000):
+    service.cache.clear()
+    started = time.perf_counter()
+    for i in range(repeat):
+        service.handle(QUERIES[i % len(QUERIES)])
+    return (time.perf_counter() - started) / repeat
+
+
+def client(port, deadline, counts, i):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    n = 0
+    while time.perf_counter() < deadline:
+        conn.request("GET", QUERIES[n % len(QUERIES)])
+        resp = conn.getresponse()
+        resp.read()
+        n += 1
+    conn.close()
+    counts[i] = n
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    service = kpi_service.KpiService(kpi_service.KpiStore())
+    app_ids = [row["app_id"] for row in service.store.apps[:50]]
+    QUERIES.extend(f"/apps/{app_id}" for app_id in app_ids)
+    print(f"in-process query (cached): {direct_latency(service) * 1e6:.1f} us")
+
+    server = kpi_service.make_server(port=0, service=service)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    counts = [0] * clients
+    deadline = time.perf_counter() + seconds
+    threads = [
+        threading.Thread(target=client, args=(port, deadline, counts, i))
+        for i in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    server.shutdown()
+    print(f"HTTP: {sum(counts) / seconds:.0f} requests/s ({clients} clients)")
+
+
+if __name__ == "__main__":
+    main()
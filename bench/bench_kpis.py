@@ -0,0 +1,170 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import serve  # noqa: E402
+
+
+# Compares serve.compute_app_kpis with the previous groupby/apply version
+# on synthetic reviews and checks that the CSV output is byte-identical.
+#
+#   python bench/bench_kpis.py [rows] [apps]
+
+SEED = 7
+
+
+def synthetic_reviews(rows, apps):
+    rng = np.random.default_rng(SEED)
+    # Heavy-tailed review counts per app, a few single-review apps.
+    app_idx = np.minimum(rng.zipf(1.3, rows) - 1, apps - 1)
+    score = rng.integers(1, 6, rows).astype(float)
+    score[rng.random(rows) < 0.01] = np.nan
+    content_length = rng.integers(0, 400, rows)
+    content_length[rng.random(rows) < 0.05] = 0
+    at = pd.Timestamp("2022-01-01") + pd.to_timedelta(
+        rng.integers(0, 4 * 365 * 86400, rows), unit="s"
+    )
+    at = pd.Series(at)
+    at[rng.random(rows) < 0.001] = pd.NaT
+    app_ids = np.array([f"com.bench.app{i:05d}" for i in range(apps)], dtype=object)
+    return pd.DataFrame(
+        {
+            "app_id": app_ids[app_idx],
+            "app_name": np.char.add("App ", app_idx.astype(str)).astype(object),
+            "score": score,
+            "thumbsUpCount": rng.geometric(0.3, rows) - 1,
+            "content_length": content_length,
+            "at_dt": at,
+        }
+    )
+
+
+def compact(df):
+    # The frame serve.py computes from, plus the app names it joins per app.
+    at = df["at_dt"].to_numpy().astype("datetime64[s]").view(np.int64)
+    reviews = serve.compact_reviews(
+        df["app_id"],
+        df["score"].fillna(serve.SCORE_MISSING),
+        df["thumbsUpCount"],
+        df["content_length"],
+        at,
+    )
+    return reviews, dict(zip(df["app_id"], df["app_name"]))
+
+
+def legacy_rating_std(series):
+    s = series.dropna()
+    if len(s) <= 1:
+        return 0.0
+    return float(s.std(ddof=0))
+
+
+def legacy_app_kpis(df):
+    g = df.groupby("app_id", dropna=False)
+
+    reviews_count = g.size().rename("reviews_count")
+    app_name = g["app_name"].first().rename("app_name")
+
+    score_sum = g["score"].sum().rename("score_sum")
+    low_count = g["score"].apply(lambda s: (s <= 2).sum()).rename("low_count")
+
+    avg_rating = (score_sum / reviews_count).rename("avg_rating")
+    low_rating_pct = (low_count / reviews_count * 100).rename("low_rating_pct")
+
+    total_thumbs_up = g["thumbsUpCount"].sum().rename("total_thumbs_up")
+    avg_thumbs_up = (total_thumbs_up / reviews_count).rename("avg_thumbs_up")
+    median_thumbs_up = g["thumbsUpCount"].quantile(
+        0.5, interpolation="higher"
+    ).rename("median_thumbs_up")
+
+    avg_review_length = g["content_length"].mean().rename("avg_review_length")
+    empty_review_pct = g["content_length"].apply(
+        lambda s: (s == 0).mean() * 100
+    ).rename("empty_review_pct")
+
+    rating_std_dev = g["score"].apply(legacy_rating_std).rename("rating_std_dev")
+
+    first_dt = g["at_dt"].min().rename("first_review_dt")
+    last_dt = g["at_dt"].max().rename("last_review_dt")
+
+    days_active = (last_dt - first_dt).dt.days.rename("days_active")
+    review_velocity = serve.compute_review_velocity(
+        reviews_count, days_active
+    ).rename("review_velocity")
+
+    app_kpis = pd.concat(
+        [
+            app_name,
+            reviews_count,
+            avg_rating,
+            low_rating_pct,
+            first_dt,
+            last_dt,
+            total_thumbs_up,
+            avg_thumbs_up,
+            median_thumbs_up,
+            avg_review_length,
+            empty_review_pct,
+            rating_std_dev,
+            review_velocity,
+        ],
+        axis=1,
+    )
+
+    app_kpis["first_review_date"] = app_kpis["first_review_dt"].dt.strftime(
+        "%Y-%m-%d"
+    )
+    app_kpis["last_review_date"] = app_kpis["last_review_dt"].dt.strftime("%Y-%m-%d")
+    app_kpis = app_kpis.drop(columns=["first_review_dt", "last_review_dt"])
+
+    app_kpis["avg_rating"] = app_kpis["avg_rating"].round(4)
+    app_kpis["low_rating_pct"] = app_kpis["low_rating_pct"].round(2)
+    app_kpis["avg_thumbs_up"] = app_kpis["avg_thumbs_up"].round(2)
+    app_kpis["avg_review_length"] = app_kpis["avg_review_length"].round(1)
+    app_kpis["empty_review_pct"] = app_kpis["empty_review_pct"].round(2)
+    app_kpis["rating_std_dev"] = app_kpis["rating_std_dev"].round(3)
+    app_kpis["review_velocity"] = app_kpis["review_velocity"].round(2)
+
+    app_kpis["total_thumbs_up"] = app_kpis["total_thumbs_up"].astype(int)
+    app_kpis["median_thumbs_up"] = app_kpis["median_thumbs_up"].astype(int)
+
+    app_kpis = app_kpis.reset_index()
+    app_kpis = app_kpis.sort_values(["app_name", "app_id"], na_position="last")
+    return app_kpis[serve.APP_KPI_COLUMNS]
+
+
+def best_of(fn, df, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(df)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    df = synthetic_reviews(rows, apps)
+    print(f"{rows} reviews, {df['app_id'].nunique()} apps")
+
+    legacy_s, legacy = best_of(legacy_app_kpis, df)
+    reviews, app_names = compact(df)
+    new_s, new = best_of(lambda d: serve.compute_app_kpis(d, app_names), reviews)
+    same = legacy.to_csv(index=False) == new.to_csv(index=False)
+
+    print(f"legacy apply:   {legacy_s:.3f}s")
+    print(f"vectorized agg: {new_s:.3f}s ({legacy_s / new_s:.1f}x)")
+    print(f"identical CSV:  {same}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import json
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+import rawlog  # noqa: E402
+
+
+# Disk usage and read times of the segmented review log (src/rawlog.py)
+# against a plain reviews.jsonl: full scan, one app, and one month.
+#
+#   python bench/bench_rawlog.py [reviews] [apps]
+
+WORK_DIR = BENCH_DIR / ".work" / "rawlog"
+
+
+def scan_jsonl(path, app_id=None, since=None, until=None):
+    n = 0
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            if app_id is not None and row.get("appId") != app_id:
+                continue
+            if rawlog.in_range(rawlog.row_time(row), since, until):
+                n += 1
+    return n
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    raw = WORK_DIR / "raw"
+    src = raw / "reviews.jsonl"
+    log = raw / "reviews_log"
+    if not src.exists() or len(sys.argv) > 1:
+        generate(raw, reviews, apps)
+
+    import_s, rows = timed(rawlog.import_jsonl, src, log)
+    src_mb = src.stat().st_size / 1e6
+    log_mb = rawlog.disk_bytes(log) / 1e6
+    print(f"{rows} reviews, import {import_s:.1f}s")
+    print(f"disk: {src_mb:.1f} MB jsonl -> {log_mb:.1f} MB log ({src_mb / log_mb:.1f}x)")
+
+    entries, _ = rawlog.read_index(log)
+    app_id = entries[len(entries) // 2]["app"]
+    month = sorted(e["max_at"] for e in entries if e["max_at"])[-1][:7]
+    queries = [
+        ("all reviews", None, None, None),
+        (f"one app ({app_id})", app_id, None, None),
+        (f"one month ({month})", None, month, month + "-99"),
+    ]
+    for label, app, since, until in queries:
+        apps_sel = None if app is None else [app]
+        jsonl_s, n = timed(scan_jsonl, src, app, since, until)
+        log_s, m = timed(
+            lambda: sum(1 for _ in rawlog.read(log, apps_sel, since, until))
+        )
+        assert n == m, (n, m)
+        print(f"{label:40s} {n:>9} rows  jsonl {jsonl_s:6.2f}s  log {log_s:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+
+# Throughput of the sentiment stage (src/sentiment.py): batched scoring vs a
+# per-review loop applying the same rules, a cold run with 1 and with all
+# workers, and a warm run where every review is served from the cache.
+#
+#   python bench/bench_sentiment.py [reviews] [apps]
+
+WORK_DIR = BENCH_DIR / ".work" / "sentiment"
+LOOP_SAMPLE = 20_000
+
+
+def score_loop(contents):
+    import sentiment
+
+    out = []
+    for text in contents:
+        text = "" if not isinstance(text, str) else text
+        tokens = sentiment.TOKEN_RE.findall(text.replace("’", "'").lower())
+        total = 0.0
+        for i, token in enumerate(tokens):
+            weight = sentiment.LEXICON.get(token, 0.0)
+            if i and tokens[i - 1] in sentiment.INTENSIFIERS:
+                weight *= 1 + sentiment.INTENSIFIER_BOOST
+            scope = tokens[max(0, i - sentiment.NEGATION_SCOPE) : i]
+            if any(t in sentiment.NEGATORS for t in scope):
+                weight *= sentiment.NEGATION_FACTOR
+            total += weight
+        out.append(total / (total * total + 15) ** 0.5)
+    return np.array(out, dtype=np.float32)
+
+
+def cold_run(workers):
+    import sentiment
+
+    sentiment.SentimentCache.reset(sentiment.CACHE)
+    sentiment.WORKERS = workers
+    started = time.perf_counter()
+    sentiment.compute_sentiment()
+    return time.perf_counter() - started
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    os.chdir(WORK_DIR)
+    raw = Path("data/raw")
+    if not (raw / "reviews.jsonl").exists() or len(sys.argv) > 1:
+        generate(raw, reviews, apps)
+
+    import sentiment
+    import transform
+
+    transform.REVIEWS_FORMATS = ("csv",)
+    transform.TEXT_INDEX = False
+    transform.main()
+
+    sample = pd.read_csv(sentiment.REVIEWS_IN, usecols=["content", "app_id", "score"],
+                         dtype={"content": str, "app_id": str}, nrows=LOOP_SAMPLE)
+    contents = sample["content"].tolist()
+    started = time.perf_counter()
+    expected = score_loop(contents)
+    loop_s = time.perf_counter() - started
+    started = time.perf_counter()
+    got, _ = sentiment.score_batch(
+        contents, sample["app_id"].tolist(), sample["score"].to_numpy(dtype=float)
+    )
+    batch_s = time.perf_counter() - started
+    assert np.allclose(got, expected, atol=1e-6)
+    print(
+        f"{len(sample)} reviews: per-review loop {len(sample) / loop_s:,.0f} rows/s,"
+        f" one batch (with n-grams) {len(sample) / batch_s:,.0f} rows/s"
+    )
+
+    total = sum(1 for _ in open(sentiment.REVIEWS_IN, "rb")) - 1
+    for workers in sorted({1, os.cpu_count() or 1}):
+        seconds = cold_run(workers)
+        print(f"cold run, {workers} worker(s): {seconds:.2f}s ({total / seconds:,.0f} rows/s)")
+    started = time.perf_counter()
+    sentiment.compute_sentiment()
+    seconds = time.perf_counter() - started
+    print(f"warm run (all cached): {seconds:.2f}s ({total / seconds:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
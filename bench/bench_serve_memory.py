@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+
+# Measures the in-memory size of the reviews frame serve.py computes KPIs
+# from: the previous full-object load of reviews.csv against the compact
+# typed frame, on synthetic data run through transform.py.
+#
+#   python bench/bench_serve_memory.py [reviews] [apps]
+
+WORK_DIR = BENCH_DIR / ".work" / "serve_memory"
+
+
+def legacy_load(path):
+    # serve.load_reviews before the compact representation.
+    df = pd.read_csv(path)
+    df["score"] = pd.to_numeric(df["score"], errors="coerce")
+    df["thumbsUpCount"] = (
+        pd.to_numeric(df["thumbsUpCount"], errors="coerce").fillna(0).astype(int)
+    )
+    df["content"] = df["content"].fillna("")
+    df["content_length"] = df["content"].str.strip().str.len()
+    df["at_dt"] = pd.to_datetime(df["at"], errors="coerce")
+    return df
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    os.chdir(WORK_DIR)
+    raw = Path("data/raw")
+    if not (raw / "reviews.jsonl").exists() or len(sys.argv) > 1:
+        generate(raw, reviews, apps)
+
+    import serve
+    import transform
+
+    transform.REVIEWS_FORMATS = ("csv",)
+    transform.DEDUP_REVIEWS = False
+    transform.main()
+
+    legacy_s, legacy = timed(legacy_load, serve.REVIEWS_IN)
+    legacy_mb = frame_mb(legacy)
+    del legacy
+    compact_s, (compact, _) = timed(serve.load_reviews)
+    compact_mb = frame_mb(compact)
+
+    print(f"{len(compact)} reviews")
+    print(f"legacy frame:  {legacy_mb:8.1f} MB  (load {legacy_s:.2f}s)")
+    print(f"compact frame: {compact_mb:8.1f} MB  (load {compact_s:.2f}s)")
+    print(f"reduction:     {legacy_mb / compact_mb:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+
+# Error of the sketch KPIs (serve.compute_sketch_kpis) against exact values
+# computed with pandas from the full reviews.csv, per app and per day, for a
+# single pass and for SHARDS sketches merged afterwards.
+#
+#   python bench/bench_sketches.py [reviews] [apps]
+#
+# Distinct reviewers: relative error. Quantiles: rank error, i.e. how far
+# the returned value's rank is from q, as a fraction of the key's reviews
+# (a value inside a run of ties counts as exact).
+
+WORK_DIR = BENCH_DIR / ".work" / "sketches"
+SHARDS = 4
+
+
+def exact_kpis(df, key, qs):
+    groups = df.groupby(key, sort=False)
+    exact = pd.DataFrame({"distinct_reviewers": groups["userName"].nunique()})
+    return exact, {name: groups[name] for name in ("thumbs", "length")}
+
+
+def rank_error(values, estimate, q):
+    values = np.sort(values)
+    lo = np.searchsorted(values, estimate, side="left") / len(values)
+    hi = np.searchsorted(values, estimate, side="right") / len(values)
+    return max(lo - q, q - hi, 0.0)
+
+
+def errors(sketch, df, key, qs):
+    exact, groups = exact_kpis(df, key, qs)
+    sketch = sketch.set_index(key)
+    common = exact.index.intersection(sketch.index)
+    est = sketch.loc[common, "distinct_reviewers"].to_numpy(dtype=float)
+    true = exact.loc[common, "distinct_reviewers"].to_numpy(dtype=float)
+    out = {"distinct": np.abs(est - true) / np.maximum(true, 1)}
+    for name, grouped in groups.items():
+        ranks = []
+        for k, values in grouped:
+            if k not in sketch.index:
+                continue
+            for q in qs:
+                col = f"{name}_p{round(q * 100)}"
+                ranks.append(rank_error(values.to_numpy(), sketch.at[k, col], q))
+        out[name] = np.array(ranks)
+    return out
+
+
+def report(label, errs):
+    d = errs["distinct"]
+    print(
+        f"{label:28s} distinct: mean {d.mean():.2%}  p99 {np.quantile(d, 0.99):.2%}"
+        f"  max {d.max():.2%}"
+    )
+    for name in ("thumbs", "length"):
+        r = errs[name]
+        print(
+            f"{'':28s} {name:8s}  rank error mean {r.mean():.2%}"
+            f"  p99 {np.quantile(r, 0.99):.2%}  max {r.max():.2%}"
+        )
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    os.chdir(WORK_DIR)
+    raw = Path("data/raw")
+    if not (raw / "reviews.jsonl").exists() or len(sys.argv) > 1:
+        generate(raw, reviews, apps)
+
+    import serve
+    import sketches
+    import transform
+
+    transform.REVIEWS_FORMATS = ("csv",)
+    transform.DEDUP_REVIEWS = False
+    transform.main()
+
+    qs = serve.SKETCH_QUANTILES
+    started = time.perf_counter()
+    app_sketch, daily_sketch = serve.compute_sketch_kpis(serve.load_app_names())
+    print(f"sketch pass: {time.perf_counter() - started:.2f}s")
+
+    # The same input folded into SHARDS independent sketch sets, then merged.
+    shards = [sketches.SketchSet() for _ in range(SHARDS)]
+    for i, (app_id, users, thumbs, length, _) in enumerate(serve.sketch_batches()):
+        for k, shard in enumerate(shards):
+            rows = slice(k, None, SHARDS)
+            shard.update(app_id[rows], users[rows], thumbs[rows], length[rows])
+    merged = shards[0]
+    for shard in shards[1:]:
+        merged.merge(shard)
+    merged = serve.finish_sketch_kpis(merged.summary(qs), "app_id")
+
+    df = pd.read_csv(serve.REVIEWS_IN, dtype={"app_id": str, "userName": str})
+    df = df.rename(columns={"thumbsUpCount": "thumbs"})
+    df["thumbs"] = pd.to_numeric(df["thumbs"], errors="coerce").fillna(0)
+    df["length"] = df["content"].fillna("").astype(str).str.strip().str.len()
+    at = pd.to_datetime(df["at"], errors="coerce")
+    df["date"] = at.dt.strftime("%Y-%m-%d")
+
+    hll = sketches.HyperLogLog()
+    kll = sketches.KllSketch()
+    kll.update(df["length"].to_numpy())
+    kll_items = sum(len(level) for level in kll.levels)
+    print(
+        f"{len(df)} reviews, {len(app_sketch)} apps, {len(daily_sketch)} days;"
+        f" per key: HLL {hll.registers.nbytes} B,"
+        f" KLL {kll_items} values after {kll.n}"
+    )
+    report("per app", errors(app_sketch, df, "app_id", qs))
+    report(f"per app ({SHARDS} shards merged)", errors(merged, df, "app_id", qs))
+    report("per day", errors(daily_sketch, df.dropna(subset=["date"]), "date", qs))
+
+
+if __name__ == "__main__":
+    main()
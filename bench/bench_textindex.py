@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import generate  # noqa: E402
+
+
+# Build cost, size and query latency of the review text index
+# (src/textindex.py) against a pandas scan of reviews.csv, on synthetic data.
+#
+#   python bench/bench_textindex.py [reviews] [apps]
+
+WORK_DIR = BENCH_DIR / ".work" / "textindex"
+QUERIES = [
+    ("transcription", None),
+    ("accurate", 2),
+    ('"meeting notes"', None),
+    ("crashes OR freezes", 2),
+    ("sync -premium", None),
+]
+
+
+def pandas_scan(df, query, max_score):
+    # Whole-word regex scan; what answering the query took before.
+    import textindex
+
+    groups = textindex.parse_query(query)
+    tokens = df["content"].fillna("").str.lower()
+    hit = np.zeros(len(df), dtype=bool)
+    for group in groups:
+        keep = np.ones(len(df), dtype=bool)
+        for negate, terms in group:
+            pattern = r"\b" + r"\W+".join(terms) + r"\b"
+            found = tokens.str.contains(pattern, regex=True).to_numpy()
+            keep &= ~found if negate else found
+        hit |= keep
+    if max_score is not None:
+        hit &= (df["score"] <= max_score).to_numpy()
+    return np.flatnonzero(hit)
+
+
+def dir_mb(path):
+    return sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file()) / 1e6
+
+
+def main():
+    reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    apps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    os.chdir(WORK_DIR)
+    raw = Path("data/raw")
+    if not (raw / "reviews.jsonl").exists() or len(sys.argv) > 1:
+        generate(raw, reviews, apps)
+
+    import textindex
+    import transform
+
+    transform.REVIEWS_FORMATS = ("csv",)
+    transform.DEDUP_REVIEWS = False
+    textindex.IndexWriter.reset(transform.TEXT_INDEX_DIR)
+    transform.TEXT_INDEX = False
+    transform.main()
+    transform.TEXT_INDEX = True
+    transform.main()
+
+    csv_mb = transform.REVIEWS_OUT.stat().st_size / 1e6
+    print(f"index: {dir_mb(transform.TEXT_INDEX_DIR):.1f} MB (reviews.csv {csv_mb:.1f} MB)")
+
+    started = time.perf_counter()
+    index = textindex.ReviewIndex(transform.TEXT_INDEX_DIR)
+    print(f"open: {(time.perf_counter() - started) * 1000:.1f} ms")
+    df = pd.read_csv(transform.REVIEWS_OUT, usecols=["content", "score"])
+    for query, max_score in QUERIES:
+        started = time.perf_counter()
+        rows = index.search(query, max_score=max_score)
+        index_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        expected = pandas_scan(df, query, max_score)
+        scan_ms = (time.perf_counter() - started) * 1000
+        assert np.array_equal(rows, expected), query
+        label = query + ("" if max_score is None else f" (score <= {max_score})")
+        print(
+            f"{label:40s} {len(rows):>8} rows  index {index_ms:8.1f} ms"
+            f"  pandas {scan_ms:9.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+
+# Writes synthetic apps.jsonl / reviews.jsonl with the same schema (and the
+# same JSON encoding) that ingest.py produces from google_play_scraper:
+# reviews grouped by app, newest first, heavy-tailed review counts per app.
+#
+#   python bench/generate.py --reviews 1000000 --apps 1000 --out data/raw
+
+GENRES = ["Productivity", "Education", "Business", "Tools", "Communication"]
+POSITIVE = [
+    "great", "love", "excellent", "accurate", "helpful", "easy", "fast",
+    "amazing", "useful", "perfect", "reliable", "intuitive",
+]
+NEGATIVE = [
+    "crash", "crashes", "slow", "bug", "buggy", "expensive", "subscription",
+    "ads", "broken", "useless", "terrible", "freezes", "lost", "refund",
+]
+NEUTRAL = [
+    "app", "notes", "meeting", "transcription", "recording", "summary",
+    "audio", "the", "it", "and", "for", "my", "with", "after", "update",
+    "sync", "account", "premium", "feature", "lecture", "text", "voice",
+    "ai", "works", "time", "every", "when", "to", "is", "but", "not",
+]
+CONTENT_POOL = 20_000
+USER_POOL = 200_000
+
+
+def make_sentences(rng, count):
+    pools = [POSITIVE, NEGATIVE, NEUTRAL]
+    sentences = []
+    for _ in range(count):
+        # Review length is heavy-tailed; a few reviews are empty.
+        n_words = 0 if rng.random() < 0.05 else min(1 + int(rng.pareto(1.5) * 8), 120)
+        mood = rng.choice(3, p=[0.45, 0.25, 0.30])
+        words = []
+        for _ in range(n_words):
+            pool = pools[mood] if rng.random() < 0.3 else NEUTRAL
+            words.append(pool[rng.integers(len(pool))])
+        text = " ".join(words)
+        sentences.append(text[:1].upper() + text[1:] + ("." if text else ""))
+    return sentences
+
+
+def reviews_per_app(rng, total, apps, skew):
+    weights = 1.0 / np.arange(1, apps + 1) ** skew
+    rng.shuffle(weights)
+    return rng.multinomial(total, weights / weights.sum())
+
+
+def app_record(rng, i, app_id, n_reviews, now):
+    histogram = rng.multinomial(max(n_reviews * 10, 1), [0.1, 0.05, 0.1, 0.25, 0.5])
+    installs = int(10 ** rng.integers(3, 8))
+    title = f"Synthetic Notes {i}"
+    return {
+        "title": title,
+        "description": f"{title} turns your meetings into notes.",
+        "descriptionHTML": f"<b>{title}</b> turns your meetings into notes.",
+        "summary": "AI note taking",
+        "installs": f"{installs:,}+",
+        "minInstalls": installs,
+        "realInstalls": int(installs * (1 + rng.random())),
+        "score": float(np.dot(histogram, [1, 2, 3, 4, 5]) / histogram.sum()),
+        "ratings": int(histogram.sum()),
+        "reviews": int(n_reviews),
+        "histogram": histogram.tolist(),
+        "price": 0,
+        "free": True,
+        "currency": "USD",
+        "sale": False,
+        "saleTime": None,
+        "originalPrice": None,
+        "saleText": None,
+        "offersIAP": bool(rng.random() < 0.7),
+        "inAppProductPrice": "$4.99 - $99.99 per item",
+        "developer": f"Synthetic Labs {i % 97}",
+        "developerId": str(10**18 + i),
+        "developerEmail": f"support{i}@example.com",
+        "developerWebsite": f"https://example.com/{i}",
+        "developerAddress": None,
+        "privacyPolicy": f"https://example.com/{i}/privacy",
+        "genre": GENRES[i % len(GENRES)],
+        "genreId": GENRES[i % len(GENRES)].upper(),
+        "categories": [{"name": GENRES[i % len(GENRES)], "id": GENRES[i % len(GENRES)].upper()}],
+        "icon": f"https://example.com/{i}/icon.png",
+        "headerImage": f"https://example.com/{i}/header.png",
+        "screenshots": [f"https://example.com/{i}/shot{k}.png" for k in range(4)],
+        "video": None,
+        "videoImage": None,
+        "contentRating": "Everyone",
+        "contentRatingDescription": None,
+        "adSupported": False,
+        "containsAds": bool(rng.random() < 0.3),
+        "released": "Jan 1, 2022",
+        "lastUpdatedOn": now.strftime("%b %d, %Y"),
+        "updated": int(now.timestamp()),
+        "version": f"{rng.integers(1, 9)}.{rng.integers(0, 20)}.{rng.integers(0, 99)}",
+        "comments": [],
+        "appId": app_id,
+        "url": f"https://play.google.com/store/apps/details?id={app_id}",
+    }
+
+
+def write_app_reviews(f, rng, app_id, n, now, sentences, dup_rate, serial):
+    # Newest first, the order the scraper returns with sort=Sort.NEWEST
+    # (which ingest asks for); recent days are more active than older ones.
+    ages = np.sort(rng.exponential(200 * 86400, n).astype(np.int64))
+    scores = rng.choice(5, n, p=[0.15, 0.07, 0.08, 0.2, 0.5]) + 1
+    thumbs = rng.geometric(0.4, n) - 1
+    thumbs[rng.random(n) < 0.002] *= 100
+    content_idx = rng.integers(0, len(sentences), n)
+    users = np.minimum(rng.zipf(1.2, n), USER_POOL)
+    versions = rng.integers(0, 20, n)
+    written = 0
+    for k in range(n):
+        at = now - timedelta(seconds=int(ages[k]))
+        version = f"1.{versions[k]}.0" if versions[k] else None
+        row = {
+            "reviewId": f"{serial + k:08x}-{app_id[-6:]}-synthetic",
+            "userName": f"User {users[k]}",
+            "userImage": f"https://example.com/u/{users[k]}.png",
+            "content": sentences[content_idx[k]],
+            "score": int(scores[k]),
+            "thumbsUpCount": int(thumbs[k]),
+            "reviewCreatedVersion": version,
+            "at": at,
+            "replyContent": None,
+            "repliedAt": None,
+            "appVersion": version,
+            "appId": app_id,
+        }
+        line = json.dumps(row, ensure_ascii=False, default=str) + "\n"
+        f.write(line)
+        written += 1
+        if dup_rate and rng.random() < dup_rate:
+            # Overlapping pages repeat a review verbatim.
+            f.write(line)
+            written += 1
+    return written
+
+
+def generate(out_dir, reviews, apps, skew=1.1, dup_rate=0.0, seed=1):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    now = datetime(2026, 2, 1, 12, 0, 0)
+    sentences = make_sentences(rng, CONTENT_POOL)
+    counts = reviews_per_app(rng, reviews, apps, skew)
+    app_ids = [f"com.synthetic.notes{i:06d}" for i in range(apps)]
+
+    with (out_dir / "apps.jsonl").open("w", encoding="utf-8") as f:
+        for i, app_id in enumerate(app_ids):
+            record = app_record(rng, i, app_id, counts[i], now)
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    written = 0
+    with (out_dir / "reviews.jsonl").open("w", encoding="utf-8") as f:
+        for app_id, n in zip(app_ids, counts):
+            written += write_app_reviews(
+                f, rng, app_id, int(n), now, sentences, dup_rate, written
+            )
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic raw data")
+    parser.add_argument("--reviews", type=int, default=100_000)
+    parser.add_argument("--apps", type=int, default=200)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--dup-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="data/raw")
+    args = parser.parse_args()
+    written = generate(
+        args.out, args.reviews, args.apps, args.skew, args.dup_rate, args.seed
+    )
+    print(f"Wrote {args.apps} apps and {written} reviews to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
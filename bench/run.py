@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import generate  # noqa: E402
+import rawlog  # noqa: E402
+
+
+# End-to-end benchmark of the four pipeline stages on synthetic data, fully
+# offline (ingest runs against bench/stub/google_play_scraper). Each stage
+# runs in its own process inside bench/.work/<scale>/, and its wall time,
+# peak RSS and rows/sec are compared with bench/baselines.json. The run
+# fails on a regression, and on a stage without a baseline unless
+# --allow-missing-baselines is given.
+#
+#   python bench/run.py --scale small
+#   python bench/run.py --scale medium --stages transform,serve --allow-missing-baselines
+#   python bench/run.py --scale small --update-baselines
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+SRC_DIR = REPO_DIR / "src"
+WORK_DIR = BENCH_DIR / ".work"
+BASELINES = BENCH_DIR / "baselines.json"
+
+SCALES = {
+    "tiny": {"reviews": 10_000, "apps": 30},
+    "small": {"reviews": 100_000, "apps": 200},
+    "medium": {"reviews": 1_000_000, "apps": 1_000},
+    "large": {"reviews": 10_000_000, "apps": 5_000},
+    "huge": {"reviews": 100_000_000, "apps": 20_000},
+}
+STAGES = ["ingest", "transform", "sentiment", "serve", "dashboard"]
+# Module constants overridden for benchmark runs (no sleeps, no caps, and no
+# response cache, which would serve later runs without calling the stub).
+OVERRIDES = {
+    "ingest": {"SLEEP_SECONDS": 0, "MAX_REVIEWS_PER_APP": None, "CACHE_RESPONSES": False},
+}
+# A stage regresses when it is this much slower / larger than its baseline.
+TOLERANCE = 0.25
+# ...and at least this many seconds slower, so sub-second stages at small
+# scales don't fail on noise.
+MIN_SLOWDOWN_SECONDS = 0.25
+
+CHILD = """
+import json, sys, time
+try:
+    import resource
+except ImportError:
+    resource = None
+sys.path.insert(0, {src!r})
+import {module} as stage
+for name, value in json.loads({overrides!r}).items():
+    setattr(stage, name, value)
+started = time.perf_counter()
+stage.main()
+elapsed = time.perf_counter() - started
+peak = None
+if resource is not None:
+    # Largest of the stage process and any worker processes it started.
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    peak = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+with open({result!r}, "w") as f:
+    json.dump({{"seconds": elapsed, "peak_rss_mb": peak}}, f)
+"""
+
+
+def count_lines(path):
+    with Path(path).open("rb") as f:
+        return sum(1 for _ in f)
+
+
+def stage_rows(stage, work):
+    # Reviews flowing through each stage (apps for the dashboard), for rows/sec.
+    if stage == "dashboard":
+        return count_lines(work / "data/processed/app_kpis.csv") - 1
+    log = work / "data/raw/reviews_log"
+    if rawlog.exists(log):
+        return sum(block["rows"] for block in rawlog.read_index(log)[0])
+    return count_lines(work / "data/raw/reviews.jsonl")
+
+
+def prepare(scale, seed):
+    params = dict(SCALES[scale], seed=seed)
+    work = WORK_DIR / scale
+    source = work / "source"
+    marker = source / "params.json"
+    if not marker.exists() or json.loads(marker.read_text()) != params:
+        print(f"Generating {params['reviews']} reviews for {params['apps']} apps")
+        shutil.rmtree(source, ignore_errors=True)
+        generate.generate(source, params["reviews"], params["apps"], seed=seed)
+        marker.write_text(json.dumps(params))
+    return work, source
+
+
+def run_stage(stage, work, source, extra_overrides):
+    overrides = dict(OVERRIDES.get(stage, {}))
+    env = dict(os.environ)
+    if stage == "ingest":
+        shutil.rmtree(work / "data/raw", ignore_errors=True)
+        first_app = json.loads(
+            (source / "apps.jsonl").open(encoding="utf-8").readline()
+        )["appId"]
+        overrides.update(
+            {"NUM_APPS": count_lines(source / "apps.jsonl"), "TEST_APP_ID": first_app}
+        )
+        env["PYTHONPATH"] = os.pathsep.join(
+            [str(BENCH_DIR / "stub"), env.get("PYTHONPATH", "")]
+        )
+        env["BENCH_STUB_DATA"] = str(source.resolve())
+    # Time cold runs, not ones served from the previous run's caches.
+    if stage == "sentiment":
+        for path in (work / "data/processed").glob("sentiment_cache.sqlite*"):
+            path.unlink()
+    if stage == "dashboard":
+        shutil.rmtree(work / "data/processed/dashboard_panels", ignore_errors=True)
+    overrides.update(extra_overrides.get(stage, {}))
+
+    result = work / f"{stage}.result.json"
+    code = CHILD.format(
+        src=str(SRC_DIR),
+        module=stage,
+        overrides=json.dumps(overrides),
+        result=str(result),
+    )
+    log = work / f"{stage}.log"
+    with log.open("w") as out:
+        proc = subprocess.run(
+            [sys.executable, "-c", code], cwd=work, env=env, stdout=out, stderr=out
+        )
+    if proc.returncode != 0:
+        raise SystemExit(f"{stage} failed, see {log}")
+    metrics = json.loads(result.read_text())
+    rows = stage_rows(stage, work)
+    metrics["rows"] = rows
+    metrics["rows_per_sec"] = rows / metrics["seconds"] if metrics["seconds"] else None
+    return metrics
+
+
+def compare(stage, metrics, baseline, tolerance):
+    problems = []
+    for key in ("seconds", "peak_rss_mb"):
+        base = baseline.get(key)
+        value = metrics.get(key)
+        slack = MIN_SLOWDOWN_SECONDS if key == "seconds" else 0
+        if base and value and value > max(base * (1 + tolerance), base + slack):
+            problems.append(f"{key} {value:.2f} > baseline {base:.2f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument(
+        "--allow-missing-baselines",
+        action="store_true",
+        help="report stages without a baseline instead of failing",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="STAGE.NAME=JSON",
+        help="override a stage module constant, e.g. transform.PARALLEL=true",
+    )
+    args = parser.parse_args()
+
+    extra = {}
+    for item in args.set:
+        target, _, value = item.partition("=")
+        stage, _, name = target.partition(".")
+        extra.setdefault(stage, {})[name] = json.loads(value)
+
+    stages = [s for s in args.stages.split(",") if s]
+    work, source = prepare(args.scale, args.seed)
+    if "ingest" not in stages:
+        raw = work / "data/raw"
+        if not (raw / "reviews.jsonl").exists():
+            raw.mkdir(parents=True, exist_ok=True)
+            for name in ("apps.jsonl", "reviews.jsonl"):
+                shutil.copy(source / name, raw / name)
+
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    scale_baselines = baselines.setdefault(args.scale, {})
+    failures = []
+
+    print(f"{'stage':<10} {'seconds':>9} {'peak MB':>9} {'rows/s':>12}  status")
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        metrics = run_stage(stage, work, source, extra)
+        problems = compare(
+            stage, metrics, scale_baselines.get(stage, {}), args.tolerance
+        )
+        status = "REGRESSION: " + "; ".join(problems) if problems else "ok"
+        if stage not in scale_baselines:
+            status = "no baseline"
+            if not args.allow_missing_baselines:
+                problems = ["no baseline (run with --update-baselines)"]
+                status = "MISSING BASELINE"
+        peak = metrics["peak_rss_mb"]
+        print(
+            f"{stage:<10} {metrics['seconds']:>9.2f} "
+            f"{peak if peak is not None else float('nan'):>9.1f} "
+            f"{metrics['rows_per_sec'] or 0:>12.0f}  {status}"
+        )
+        failures.extend(f"{stage}: {p}" for p in problems)
+        if args.update_baselines:
+            scale_baselines[stage] = {
+                k: metrics[k] for k in ("seconds", "peak_rss_mb", "rows_per_sec")
+            }
+
+    if args.update_baselines:
+        BASELINES.write_text(json.dumps(baselines, indent=2) + "\n")
+        print(f"Updated {BASELINES}")
+    elif failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+
+# Offline stand-in for google_play_scraper, serving the raw files written by
+# bench/generate.py from BENCH_STUB_DATA (default: bench/.work/stub). Put
+# bench/stub on PYTHONPATH to run ingest.py without network access.
+
+DATA_DIR = Path(os.environ.get("BENCH_STUB_DATA", "bench/.work/stub"))
+
+_apps = None
+_reviews = {}
+_relevant = {}
+
+
+class Sort:
+    MOST_RELEVANT = 1
+    NEWEST = 2
+    RATING = 3
+
+
+class _ContinuationToken:
+    def __init__(self, token, lang, country, sort, count, filter_score_with, filter_device_with):
+        self.token = token
+        self.lang = lang
+        self.country = country
+        self.sort = sort
+        self.count = count
+        self.filter_score_with = filter_score_with
+        self.filter_device_with = filter_device_with
+
+
+def _load_apps():
+    global _apps
+    if _apps is None:
+        with (DATA_DIR / "apps.jsonl").open(encoding="utf-8") as f:
+            _apps = {}
+            for line in f:
+                obj = json.loads(line)
+                _apps[obj["appId"]] = obj
+    return _apps
+
+
+def _load_reviews(app_id):
+    # Loaded per app on first use, like paging through one app at a time.
+    if not _reviews:
+        with (DATA_DIR / "reviews.jsonl").open(encoding="utf-8") as f:
+            for line in f:
+                obj = json.loads(line)
+                _reviews.setdefault(obj.pop("appId"), []).append(obj)
+    return _reviews.get(app_id, [])
+
+
+def _load_sorted(app_id, sort):
+    # reviews.jsonl is newest first. Like the real scraper, anything but
+    # NEWEST gets another order: most thumbs up first.
+    rows = _load_reviews(app_id)
+    if sort == Sort.NEWEST:
+        return rows
+    if app_id not in _relevant:
+        _relevant[app_id] = sorted(rows, key=lambda r: -r.get("thumbsUpCount", 0))
+    return _relevant[app_id]
+
+
+def search(query, n_hits=30, lang="en", country="us"):
+    return [
+        {"appId": app_id, "title": obj["title"]}
+        for app_id, obj in list(_load_apps().items())[:n_hits]
+    ]
+
+
+def app(app_id, lang="en", country="us"):
+    apps = _load_apps()
+    if app_id not in apps:
+        raise LookupError(f"App not found(404): {app_id}")
+    return dict(apps[app_id])
+
+
+def reviews(
+    app_id,
+    lang="en",
+    country="us",
+    sort=Sort.MOST_RELEVANT,
+    count=100,
+    filter_score_with=None,
+    filter_device_with=None,
+    continuation_token=None,
+):
+    if continuation_token is not None:
+        if continuation_token.token is None:
+            return [], continuation_token
+        start = int(continuation_token.token)
+        count = continuation_token.count
+        sort = continuation_token.sort
+    else:
+        start = 0
+    rows = _load_sorted(app_id, sort)
+    end = min(start + count, len(rows))
+    page = []
+    for obj in rows[start:end]:
+        obj = dict(obj)
+        obj["at"] = datetime.fromisoformat(obj["at"])
+        page.append(obj)
+    token = _ContinuationToken(
+        str(end) if end < len(rows) else None,
+        lang,
+        country,
+        sort,
+        count,
+        filter_score_with,
+        filter_device_with,
+    )
+    return page, token
@@ -0,0 +1,3 @@
+# Same place as in the real package, where checkpoints.py imports the token
+# class from.
+from google_play_scraper import _ContinuationToken, reviews  # noqa: F401
@@ -0,0 +1,228 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Online per-app anomaly detection over the daily series of the KPI cube
+# (cube.py). Per app and metric the state holds an EWMA mean and variance
+# and a one-sided CUSUM of standardized deviations, so folding in a new day
+# is O(1) per app however long the history is. All apps are updated at once
+# per day (NumPy over the app axis), and the state is persisted between
+# runs, so each run only folds the days it hasn't seen.
+#
+#   rating  mean score of the day, only on days with at least
+#           MIN_RATED_REVIEWS scored reviews; alerts on drops
+#   volume  log(1 + reviews that day), from the app's first review on;
+#           alerts on spikes of at least MIN_SPIKE_REVIEWS reviews (a quiet
+#           app going from 0 to 1 review a day is not one)
+#
+# A day is flagged when its z-score against the EWMA (std floored per
+# metric, see METRICS) is at least Z_THRESHOLD in the alerting direction, or
+# when the CUSUM (slack CUSUM_K) exceeds CUSUM_H; the CUSUM then starts over.
+# Nothing is flagged during an app's first WARMUP_DAYS observations.
+#
+# The newest day of the cube may still be filling up: it is checked against
+# the state without being folded in (a "provisional" alert) and is folded on
+# a later run, once a newer day exists. Folded days are not revisited.
+
+ALPHA = 0.1
+Z_THRESHOLD = 3.0
+CUSUM_K = 0.5
+CUSUM_H = 5.0
+WARMUP_DAYS = 14
+MIN_RATED_REVIEWS = 5
+MIN_SPIKE_REVIEWS = 10
+# metric -> (alerting direction, std floor)
+METRICS = {"rating": (-1, 0.1), "volume": (1, 0.1)}
+STATS = ("n", "mean", "var", "cusum")
+
+ALERT_COLUMNS = [
+    "date",
+    "app_id",
+    "app_name",
+    "metric",
+    "value",
+    "expected",
+    "z_score",
+    "cusum",
+    "rule",
+    "provisional",
+]
+
+
+def empty_state(app_ids=()):
+    app_ids = np.asarray(app_ids, dtype=str)
+    state = {
+        "app_ids": app_ids,
+        "last_day": np.full(len(app_ids), -1, dtype=np.int64),
+    }
+    for metric in METRICS:
+        state[metric] = {
+            "n": np.zeros(len(app_ids), dtype=np.int64),
+            "mean": np.zeros(len(app_ids)),
+            "var": np.zeros(len(app_ids)),
+            "cusum": np.zeros(len(app_ids)),
+        }
+    return state
+
+
+def align(state, app_ids):
+    # State rows for `app_ids` (sorted, as in the cube); apps not seen
+    # before start empty. Apps missing from `app_ids` are carried over.
+    ids = np.union1d(state["app_ids"], app_ids)
+    out = empty_state(ids)
+    rows = np.searchsorted(ids, state["app_ids"])
+    out["last_day"][rows] = state["last_day"]
+    for metric in METRICS:
+        for stat in STATS:
+            out[metric][stat][rows] = state[metric][stat]
+    return out, np.searchsorted(ids, app_ids)
+
+
+def daily_values(kpi_cube, day):
+    # metric -> (value, observed?, may alert?) of every app on cube column
+    # `day`; None means every app.
+    count = kpi_cube["score_count"][:, day].astype(np.float64)
+    rated = count >= MIN_RATED_REVIEWS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rating = np.where(rated, kpi_cube["score_sum"][:, day] / count, np.nan)
+    reviews = kpi_cube["reviews"][:, day]
+    volume = np.log1p(reviews.astype(np.float64))
+    return {
+        "rating": (rating, rated, None),
+        "volume": (volume, None, reviews >= MIN_SPIKE_REVIEWS),
+    }
+
+
+def check(stats, metric, x, mask, alertable):
+    # z-scores, next CUSUM values and alert rules of observations x (where
+    # mask) against the current stats, without changing them.
+    direction, floor = METRICS[metric]
+    std = np.maximum(np.sqrt(stats["var"]), floor)
+    z = np.where(mask, (x - stats["mean"]) / std, 0.0)
+    warm = mask & (stats["n"] >= WARMUP_DAYS)
+    cusum = np.maximum(0.0, stats["cusum"] + direction * z - CUSUM_K)
+    cusum = np.where(warm, cusum, 0.0)
+    if alertable is not None:
+        warm = warm & alertable
+    z_alert = warm & (direction * z >= Z_THRESHOLD)
+    cusum_alert = warm & (cusum > CUSUM_H)
+    return z, cusum, z_alert, cusum_alert
+
+
+def fold(stats, x, mask, cusum, cusum_alert):
+    first = mask & (stats["n"] == 0)
+    later = mask & ~first
+    diff = np.where(later, x - stats["mean"], 0.0)
+    stats["mean"] = np.where(first, x, stats["mean"] + ALPHA * diff)
+    var = (1 - ALPHA) * (stats["var"] + ALPHA * diff**2)
+    stats["var"] = np.where(later, var, stats["var"])
+    stats["cusum"] = np.where(mask, np.where(cusum_alert, 0.0, cusum), stats["cusum"])
+    stats["n"] = stats["n"] + mask
+
+
+def alert_rows(metric, day, rows, x, stats, z, cusum, z_alert, cusum_alert, provisional):
+    flagged = np.flatnonzero(z_alert | cusum_alert)
+    if metric == "volume":
+        x, expected = np.expm1(x), np.expm1(stats["mean"])
+    else:
+        expected = stats["mean"]
+    date = str(np.datetime64(int(day), "D"))
+    for i in flagged:
+        rule = "+".join(
+            r for r, hit in (("z", z_alert[i]), ("cusum", cusum_alert[i])) if hit
+        )
+        yield {
+            "date": date,
+            "row": rows[i],
+            "metric": metric,
+            "value": round(float(x[i]), 4),
+            "expected": round(float(expected[i]), 4),
+            "z_score": round(float(z[i]), 2),
+            "cusum": round(float(cusum[i]), 2),
+            "rule": rule,
+            "provisional": provisional,
+        }
+
+
+def update(state, kpi_cube):
+    # Folds the cube's days not yet in the state (all but the newest) and
+    # checks the newest. Returns (state, alerts frame without app_name).
+    app_ids = kpi_cube["app_ids"]
+    days = kpi_cube["reviews"].shape[1]
+    if not len(app_ids) or not days:
+        return state, pd.DataFrame(columns=[c for c in ALERT_COLUMNS if c != "app_name"])
+    state, rows = align(state, app_ids)
+    day0 = int(kpi_cube["day0"])
+    last_day = state["last_day"][rows]
+    # An app's volume series starts at its first review.
+    active = np.cumsum(kpi_cube["reviews"] > 0, axis=1) > 0
+    view = {m: {s: state[m][s][rows] for s in STATS} for m in METRICS}
+    alerts = []
+
+    start = max(0, int(last_day.min()) + 1 - day0)
+    for col in range(start, days):
+        provisional = col == days - 1
+        pending = (last_day < day0 + col) & active[:, col]
+        for metric, (x, mask, alertable) in daily_values(kpi_cube, col).items():
+            mask = pending if mask is None else pending & mask
+            stats = view[metric]
+            z, cusum, z_alert, cusum_alert = check(stats, metric, x, mask, alertable)
+            alerts.extend(
+                alert_rows(
+                    metric, day0 + col, rows, x, stats, z, cusum, z_alert,
+                    cusum_alert, provisional,
+                )
+            )
+            if not provisional:
+                fold(stats, x, mask, cusum, cusum_alert)
+
+    state["last_day"][rows] = np.maximum(last_day, day0 + days - 2)
+    for metric in METRICS:
+        for stat in STATS:
+            state[metric][stat][rows] = view[metric][stat]
+    frame = pd.DataFrame(alerts, columns=["date", "row"] + ALERT_COLUMNS[3:])
+    app_rows = frame.pop("row").to_numpy(dtype=np.int64)
+    frame.insert(1, "app_id", state["app_ids"][app_rows])
+    return state, frame
+
+
+def merge_alerts(previous, new):
+    # Alert history: earlier alerts stay, provisional ones are replaced by
+    # the latest run's.
+    if previous is not None and not previous.empty:
+        previous = previous[~previous["provisional"].astype(bool)]
+        frames = [f for f in (previous, new) if not f.empty]
+        if frames:
+            new = pd.concat(frames, ignore_index=True)
+    return new.sort_values(["date", "app_id", "metric"], kind="stable")[ALERT_COLUMNS]
+
+
+def save(state, path):
+    payload = {
+        "app_ids": state["app_ids"].tolist(),
+        "last_day": state["last_day"].tolist(),
+    }
+    for metric in METRICS:
+        payload[metric] = {stat: state[metric][stat].tolist() for stat in STATS}
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(payload), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load(path):
+    path = Path(path)
+    if not path.exists():
+        return None
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    state = empty_state(payload["app_ids"])
+    state["last_day"] = np.asarray(payload["last_day"], dtype=np.int64)
+    for metric in METRICS:
+        for stat in STATS:
+            dtype = np.int64 if stat == "n" else np.float64
+            state[metric][stat] = np.asarray(payload[metric][stat], dtype=dtype)
+    return state
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+try:
+    from google_play_scraper.features.reviews import _ContinuationToken
+except ImportError:
+    # Replay mode runs without the scraper, the only reader of the tokens.
+    _ContinuationToken = None
+
+
+# Checkpoint layout (JSON):
+# {
+#   "run": {"complete": bool, "app_ids": [...]},
+#   "apps": {
+#     "<appId>": {
+#       "watermark": newest review `at` from completed runs (ISO string),
+#       "backfill": {"token": {...}, "newest": ISO string} or absent,
+#       "pass": {"meta": bool, "token": {...}, "exhausted": bool,
+#                "fetched": int, "newest": ISO string, "done": bool}
+#     }
+#   }
+# }
+
+
+# The scraper's continuation token fields, in _ContinuationToken's
+# constructor order.
+TOKEN_FIELDS = (
+    "token",
+    "lang",
+    "country",
+    "sort",
+    "count",
+    "filter_score_with",
+    "filter_device_with",
+)
+
+
+def token_to_state(token):
+    # google_play_scraper continuation tokens are plain objects; only their
+    # fields are kept.
+    if token is None or getattr(token, "token", None) is None:
+        return None
+    fields = {name: getattr(token, name, None) for name in TOKEN_FIELDS}
+    fields = json.loads(
+        json.dumps(fields, default=lambda v: getattr(v, "value", str(v)))
+    )
+    return {"fields": fields}
+
+
+def token_from_state(state):
+    # Always the scraper's own token class: nothing named in the file is
+    # imported, and unknown fields are ignored.
+    if not state:
+        return None
+    fields = [state["fields"].get(name) for name in TOKEN_FIELDS]
+    if _ContinuationToken is None:
+        return SimpleNamespace(**dict(zip(TOKEN_FIELDS, fields)))
+    return _ContinuationToken(*fields)
+
+
+def as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+class CheckpointStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.data = {"run": None, "apps": {}}
+        if self.path.exists():
+            self.data = json.loads(self.path.read_text(encoding="utf-8"))
+
+    def save(self):
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.data, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def reset(self):
+        with self.lock:
+            self.data = {"run": None, "apps": {}}
+            self.save()
+
+    def has_history(self):
+        return any(a.get("watermark") for a in self.data["apps"].values())
+
+    def run_in_progress(self):
+        run = self.data.get("run")
+        return bool(run) and not run.get("complete")
+
+    def run_app_ids(self):
+        return list(self.data["run"]["app_ids"])
+
+    def start_run(self, app_ids):
+        with self.lock:
+            self.data["run"] = {"complete": False, "app_ids": list(app_ids)}
+            for app_id in app_ids:
+                app = self.data["apps"].setdefault(app_id, {"watermark": None})
+                # A pass cut short by the per-app cap is continued from where
+                # it stopped before anything newer is fetched.
+                backfill = app.get("backfill") or {}
+                app["pass"] = {
+                    "meta": False,
+                    "token": backfill.get("token"),
+                    "exhausted": False,
+                    "fetched": 0,
+                    "newest": backfill.get("newest"),
+                    "done": False,
+                }
+            self.save()
+
+    def finish_run(self):
+        with self.lock:
+            self.data["run"]["complete"] = True
+            self.save()
+
+    def _pass(self, app_id):
+        return self.data["apps"][app_id]["pass"]
+
+    def is_done(self, app_id):
+        return self._pass(app_id)["done"]
+
+    def meta_written(self, app_id):
+        return self._pass(app_id)["meta"]
+
+    def mark_meta(self, app_id):
+        with self.lock:
+            self._pass(app_id)["meta"] = True
+            self.save()
+
+    def resume_point(self, app_id):
+        # (continuation token, reviews fetched so far, watermark, exhausted)
+        p = self._pass(app_id)
+        watermark = as_datetime(self.data["apps"][app_id].get("watermark"))
+        return token_from_state(p["token"]), p["fetched"], watermark, p["exhausted"]
+
+    def page_written(self, app_id, batch, token):
+        with self.lock:
+            p = self._pass(app_id)
+            p["fetched"] += len(batch)
+            p["token"] = token_to_state(token)
+            p["exhausted"] = p["token"] is None
+            stamps = [as_datetime(r.get("at")) for r in batch]
+            stamps = [s for s in stamps if s is not None]
+            if p["newest"]:
+                stamps.append(as_datetime(p["newest"]))
+            if stamps:
+                p["newest"] = max(stamps).isoformat()
+            self.save()
+
+    def finish_app(self, app_id, cap=None):
+        with self.lock:
+            app = self.data["apps"][app_id]
+            p = app["pass"]
+            watermark = as_datetime(app.get("watermark"))
+            capped = cap is not None and p["token"] is not None and p["fetched"] >= cap
+            if capped and watermark is not None:
+                # Reviews between here and the watermark are still to come;
+                # the watermark only moves once they are fetched. (A first
+                # pass keeps just the newest reviews.)
+                app["backfill"] = {"token": p["token"], "newest": p["newest"]}
+                p["done"] = True
+                self.save()
+                return
+            app.pop("backfill", None)
+            newest = as_datetime(p["newest"])
+            if newest is not None and (watermark is None or newest > watermark):
+                app["watermark"] = newest.isoformat()
+            p["done"] = True
+            self.save()
@@ -0,0 +1,231 @@
+import json
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+
+# App-partitioned column store for processed tables.
+#
+# <root>/_schema.json              {"columns": {name: dtype}, "partition": ...}
+# <root>/_apps.json                {app_id: app_name}
+# <root>/app_id=<id>/<part>/<col>.npy              numeric columns
+# <root>/app_id=<id>/<part>/<col>.bin|.offsets.npy string columns (UTF-8)
+# <root>/app_id=<id>/<part>/<col>.null.npy         null mask (strings, if any)
+#
+# Missing numeric values are stored as the dtype's minimum value, which for
+# int64 timestamps is also numpy's NaT.
+
+PARTITION_KEY = "app_id"
+NULL_PARTITION = "__null__"
+
+
+def missing_value(dtype):
+    return np.iinfo(dtype).min
+
+
+def partition_name(value):
+    encoded = NULL_PARTITION if value is None else quote(value, safe="")
+    return f"{PARTITION_KEY}={encoded}"
+
+
+def partition_value(name):
+    value = name.split("=", 1)[1]
+    return None if value == NULL_PARTITION else unquote(value)
+
+
+def write_meta(root, schema, app_names):
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "_schema.json").write_text(
+        json.dumps({"columns": schema, "partition": PARTITION_KEY}, indent=1),
+        encoding="utf-8",
+    )
+    (root / "_apps.json").write_text(
+        json.dumps(app_names, ensure_ascii=False), encoding="utf-8"
+    )
+
+
+def read_meta(root):
+    root = Path(root)
+    schema = json.loads((root / "_schema.json").read_text(encoding="utf-8"))
+    app_names = json.loads((root / "_apps.json").read_text(encoding="utf-8"))
+    return schema["columns"], app_names
+
+
+def exists(root):
+    return (Path(root) / "_schema.json").exists()
+
+
+def numeric_array(values, dtype):
+    fill = missing_value(dtype)
+    return np.array([fill if v is None else v for v in values], dtype=dtype)
+
+
+def write_part(part_dir, columns, schema):
+    part_dir.mkdir(parents=True, exist_ok=True)
+    for name, dtype in schema.items():
+        values = columns[name]
+        if dtype == "str":
+            encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+            (part_dir / f"{name}.bin").write_bytes(b"".join(encoded))
+            np.save(part_dir / f"{name}.offsets.npy", offsets)
+            nulls = np.array([v is None for v in values], dtype=bool)
+            if nulls.any():
+                np.save(part_dir / f"{name}.null.npy", nulls)
+        else:
+            np.save(part_dir / f"{name}.npy", numeric_array(values, dtype))
+
+
+def read_column(part_dir, name, dtype):
+    if dtype != "str":
+        return np.load(part_dir / f"{name}.npy")
+    blob = (part_dir / f"{name}.bin").read_bytes()
+    offsets = np.load(part_dir / f"{name}.offsets.npy")
+    values = np.empty(len(offsets) - 1, dtype=object)
+    for i in range(len(values)):
+        values[i] = blob[offsets[i] : offsets[i + 1]].decode("utf-8")
+    null_path = part_dir / f"{name}.null.npy"
+    if null_path.exists():
+        values[np.load(null_path)] = None
+    return values
+
+
+def list_partitions(root, app_ids=None):
+    wanted = None if app_ids is None else set(app_ids)
+    partitions = []
+    for path in Path(root).glob(f"{PARTITION_KEY}=*"):
+        value = partition_value(path.name)
+        if wanted is None or value in wanted:
+            partitions.append((value, path))
+    partitions.sort(key=lambda p: (p[0] is None, p[0] or ""))
+    return partitions
+
+
+def list_parts(partitions):
+    # (partition value, part dir) for every part of the given partitions.
+    return [
+        (value, part_dir)
+        for value, path in partitions
+        for part_dir in sorted(p for p in path.iterdir() if p.is_dir())
+    ]
+
+
+def read_table(root, columns, app_ids=None):
+    # Reads only the requested columns of the selected partitions. The
+    # partition key comes back as integer codes into table["app_ids"]
+    # (-1 for the null partition), ready for a pandas Categorical.
+    schema, _ = read_meta(root)
+    partitions = list_partitions(root, app_ids)
+    app_values = [value for value, _ in partitions if value is not None]
+    code_by_app = {value: i for i, value in enumerate(app_values)}
+
+    chunks = {name: [] for name in columns}
+    codes = []
+    for value, part_dir in list_parts(partitions):
+        first = None
+        for name in columns:
+            arr = read_column(part_dir, name, schema[name])
+            chunks[name].append(arr)
+            first = arr if first is None else first
+        if first is not None:
+            codes.append(np.full(len(first), code_by_app.get(value, -1), np.int32))
+
+    table = {"app_ids": app_values}
+    table["app_code"] = np.concatenate(codes) if codes else np.empty(0, np.int32)
+    for name in columns:
+        dtype = object if schema[name] == "str" else schema[name]
+        parts = chunks[name]
+        table[name] = np.concatenate(parts) if parts else np.empty(0, dtype)
+    return table
+
+
+class PartitionedWriter:
+    # Buffers rows per app. An app's buffer becomes a part once it reaches
+    # part_rows; all buffers are flushed once 2 * part_rows rows are held,
+    # so memory stays bounded even when apps are interleaved.
+    def __init__(self, root, schema, part_rows, prefix="part-00000"):
+        self.root = Path(root)
+        self.schema = schema
+        self.part_rows = part_rows
+        self.prefix = prefix
+        self.buffers = {}
+        self.part_counts = {}
+        self.buffered = 0
+
+    def add(self, app_id, row):
+        buf = self.buffers.get(app_id)
+        if buf is None:
+            buf = self.buffers[app_id] = {name: [] for name in self.schema}
+        for name in self.schema:
+            buf[name].append(row.get(name))
+        self.buffered += 1
+        if len(buf[next(iter(self.schema))]) >= self.part_rows:
+            self.flush_app(app_id)
+        elif self.buffered >= 2 * self.part_rows:
+            self.flush()
+
+    def flush_app(self, app_id):
+        buf = self.buffers.pop(app_id)
+        n = self.part_counts.get(app_id, 0)
+        part_dir = self.root / partition_name(app_id) / f"{self.prefix}-{n:05d}"
+        write_part(part_dir, buf, self.schema)
+        self.part_counts[app_id] = n + 1
+        self.buffered -= len(buf[next(iter(self.schema))])
+
+    def flush(self):
+        for app_id in list(self.buffers):
+            self.flush_app(app_id)
+
+
+class MemoryTable:
+    # Same add/flush interface as PartitionedWriter, but keeps the selected
+    # numeric columns in memory and returns them in read_table's layout, so
+    # an in-process consumer skips the write/read round trip.
+    def __init__(self, schema, columns, chunk_rows=100_000):
+        self.schema = {name: schema[name] for name in columns}
+        self.chunk_rows = chunk_rows
+        self.code_by_app = {}
+        self.codes = []
+        self.buffers = {name: [] for name in self.schema}
+        self.chunks = {name: [] for name in self.schema}
+        self.code_chunks = []
+
+    def add(self, app_id, row):
+        code = -1
+        if app_id is not None:
+            code = self.code_by_app.setdefault(app_id, len(self.code_by_app))
+        self.codes.append(code)
+        for name in self.schema:
+            self.buffers[name].append(row.get(name))
+        if len(self.codes) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.codes:
+            return
+        self.code_chunks.append(np.array(self.codes, dtype=np.int32))
+        self.codes = []
+        for name, dtype in self.schema.items():
+            self.chunks[name].append(numeric_array(self.buffers[name], dtype))
+            self.buffers[name] = []
+
+    def table(self):
+        self.flush()
+        # Recode apps in sorted order, as read_table does.
+        app_values = sorted(self.code_by_app)
+        remap = np.full(len(app_values) + 1, -1, dtype=np.int32)
+        for new, value in enumerate(app_values):
+            remap[self.code_by_app[value]] = new
+        codes = (
+            np.concatenate(self.code_chunks)
+            if self.code_chunks
+            else np.empty(0, np.int32)
+        )
+        table = {"app_ids": app_values, "app_code": remap[codes]}
+        for name, dtype in self.schema.items():
+            parts = self.chunks[name]
+            table[name] = np.concatenate(parts) if parts else np.empty(0, dtype)
+        return table
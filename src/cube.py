@@ -0,0 +1,145 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Per-app x day KPI cube, built from (app_id, day) aggregates:
+#
+#   app_ids              (A,)    str, "" for reviews without an app_id
+#   day0                 ()      epoch day of column 0; columns are contiguous
+#   reviews              (A, D)  int32
+#   score_count          (A, D)  int32 reviews with a score
+#   score_sum            (A, D)  int32
+#   reviews_7d/_30d      (A, D)  int32 rolling sums ending on each day
+#   rating_7d/_30d       (A, D)  float32 rolling mean score, NaN without scores
+#
+# Week (Monday-based) and month rollups are summed from the day columns on
+# demand. Stored with np.savez_compressed; empty cells compress away.
+
+FIELDS = ["reviews", "score_count", "score_sum"]
+WINDOWS = (7, 30)
+
+
+def rolling_sum(values, window):
+    # Trailing `window`-day sums for every app at once: one cumulative sum
+    # along the day axis, then a difference of two shifted views.
+    apps, days = values.shape
+    csum = np.zeros((apps, days + 1), dtype=np.int64)
+    np.cumsum(values, axis=1, out=csum[:, 1:])
+    lo = np.maximum(np.arange(1, days + 1) - window, 0)
+    return csum[:, 1:] - csum[:, lo]
+
+
+def mean_rating(score_sum, score_count):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rating = score_sum / score_count
+    return np.where(score_count > 0, rating, np.nan).astype(np.float32)
+
+
+def build(app_daily):
+    # app_daily: frame indexed by (app_id, day) with FIELDS columns, day in
+    # epoch days.
+    df = app_daily.reset_index()
+    if df.empty:
+        cube = {"app_ids": np.array([], dtype=str), "day0": np.int64(0)}
+        for name in FIELDS:
+            cube[name] = np.zeros((0, 0), dtype=np.int32)
+        return with_windows(cube)
+
+    app_id = df["app_id"].astype(object).where(df["app_id"].notna(), "")
+    app_ids, rows = np.unique(app_id.to_numpy(dtype=str), return_inverse=True)
+    day = df["day"].to_numpy(dtype=np.int64)
+    day0 = int(day.min())
+    shape = (len(app_ids), int(day.max()) - day0 + 1)
+
+    cube = {"app_ids": app_ids, "day0": np.int64(day0)}
+    for name in FIELDS:
+        values = np.zeros(shape, dtype=np.int32)
+        values[rows, day - day0] = df[name].to_numpy()
+        cube[name] = values
+    return with_windows(cube)
+
+
+def with_windows(cube):
+    for window in WINDOWS:
+        reviews = rolling_sum(cube["reviews"], window)
+        cube[f"reviews_{window}d"] = reviews.astype(np.int32)
+        cube[f"rating_{window}d"] = mean_rating(
+            rolling_sum(cube["score_sum"], window),
+            rolling_sum(cube["score_count"], window),
+        )
+    return cube
+
+
+def dates(cube):
+    days = cube["reviews"].shape[1]
+    return (int(cube["day0"]) + np.arange(days)).astype("datetime64[D]")
+
+
+def bucket_starts(cube, freq):
+    # First day column of each week/month bucket and the bucket's label.
+    day = dates(cube)
+    if freq == "day":
+        return np.arange(len(day)), day.astype(str)
+    if freq == "week":
+        # Epoch day 0 was a Thursday; shift so buckets start on Mondays.
+        bucket = (day.astype(np.int64) + 3) // 7
+    elif freq == "month":
+        bucket = day.astype("datetime64[M]").astype(np.int64)
+    else:
+        raise ValueError(f"unknown frequency {freq!r}")
+    if not len(bucket):
+        return np.array([], dtype=np.int64), np.array([], dtype=str)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    if freq == "week":
+        labels = (bucket[starts] * 7 - 3).astype("datetime64[D]")
+    else:
+        labels = bucket[starts].astype("datetime64[M]")
+    return starts, labels.astype(str)
+
+
+def rollup(cube, freq):
+    # Sums FIELDS into week/month buckets (all apps at once) and adds the
+    # bucket's mean rating.
+    starts, labels = bucket_starts(cube, freq)
+    out = {"app_ids": cube["app_ids"], "labels": labels}
+    for name in FIELDS:
+        values = cube[name]
+        if values.shape[1] and freq != "day":
+            values = np.add.reduceat(values, starts, axis=1)
+        out[name] = values
+    out["rating"] = mean_rating(out["score_sum"], out["score_count"])
+    return out
+
+
+def app_series(cube, app_id, freq="day"):
+    # One app's trend as a frame (labels x reviews/rating, plus the rolling
+    # windows for daily series).
+    rows = np.flatnonzero(cube["app_ids"] == ("" if app_id is None else app_id))
+    if not len(rows):
+        return None
+    row = slice(rows[0], rows[0] + 1)
+    table = rollup({k: v[row] if v.ndim == 2 else v for k, v in cube.items()}, freq)
+    series = {
+        "date": table["labels"],
+        "reviews": table["reviews"][0],
+        "rating": table["rating"][0],
+    }
+    if freq == "day":
+        for window in WINDOWS:
+            series[f"reviews_{window}d"] = cube[f"reviews_{window}d"][row][0]
+            series[f"rating_{window}d"] = cube[f"rating_{window}d"][row][0]
+    return pd.DataFrame(series)
+
+
+def save(cube, path):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez_compressed(tmp, **cube)
+    tmp.replace(path)
+
+
+def load(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
@@ -1,157 +1,570 @@
 import csv
+import hashlib
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import matplotlib.dates as mdates  # noqa: E402
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import cube  # noqa: E402
+import metrics  # noqa: E402
 
 
 PROCESSED_DIR = Path("data/processed")
 APP_KPI_IN = PROCESSED_DIR / "app_kpis.csv"
 DAILY_KPI_IN = PROCESSED_DIR / "daily_kpis.csv"
+CUBE_IN = PROCESSED_DIR / "kpi_cube.npz"
+COMPLAINTS_IN = PROCESSED_DIR / "complaint_terms.csv"
+ALERTS_IN = PROCESSED_DIR / "alerts.csv"
 OUT_IMG = PROCESSED_DIR / "dashboard.png"
+TREND_APPS = 5
+COMPLAINT_PHRASES = 12
+ALERT_APPS = 3
+ALERT_WINDOW_DAYS = 90
+TITLE = "AI Note-Taking Apps Analytics Dashboard"
+
+# PANEL_CACHE = True draws every panel into its own PNG under PANEL_DIR,
+# named after a hash of the panel's input data (and of this file). Only
+# panels whose hash changed are redrawn, in up to WORKERS processes; the
+# cached PNGs are then pasted into OUT_IMG, and THUMBNAIL_WIDTHS-wide copies
+# are written next to it as dashboard-<width>.png in the same pass.
+# PANEL_CACHE = False draws the whole figure in one go, as before.
+PANEL_CACHE = True
+PANEL_DIR = PROCESSED_DIR / "dashboard_panels"
+PANEL_SIZE = (8, 4.6)
+DPI = 150
+WORKERS = os.cpu_count() or 1
+THUMBNAIL_WIDTHS = (800, 320)
+
+
+# field -> (type, fallback when missing or unparsable)
+APP_KPI_FIELDS = {
+    "reviews_count": (int, 0),
+    "avg_rating": (float, None),
+    "avg_thumbs_up": (float, 0),
+    "avg_review_length": (float, 0),
+    "rating_std_dev": (float, 0),
+    "review_velocity": (float, 0),
+    "avg_sentiment": (float, None),
+    "negative_review_pct": (float, None),
+}
+DAILY_KPI_FIELDS = {
+    "daily_reviews": (int, 0),
+    "daily_avg_rating": (float, None),
+}
+ALERT_FIELDS = {
+    "value": (float, None),
+    "expected": (float, None),
+    "z_score": (float, 0),
+}
+
+
+def coerce_row(row, fields):
+    for name, (kind, fallback) in fields.items():
+        try:
+            row[name] = kind(row[name])
+        except (KeyError, TypeError, ValueError):
+            row[name] = fallback
+    return row
+
+
+def read_rows(path, fields):
+    with path.open(encoding="utf-8", newline="") as f:
+        return [coerce_row(row, fields) for row in csv.DictReader(f)]
+
+
+def rows_from_frame(df, fields):
+    # KPI frames handed over in-process: missing values become "", as in an
+    # empty CSV cell, before the same coercion as the CSV path.
+    records = df.astype(object).where(df.notna(), "").to_dict("records")
+    return [coerce_row(row, fields) for row in records]
 
 
 def load_app_kpis():
-    rows = []
-    with APP_KPI_IN.open(encoding="utf-8", newline="") as f:
-        for row in csv.DictReader(f):
-            try:
-                row["reviews_count"] = int(row["reviews_count"])
-            except Exception:
-                row["reviews_count"] = 0
-            try:
-                row["avg_rating"] = float(row["avg_rating"])
-            except Exception:
-                row["avg_rating"] = None
-            try:
-                row["avg_thumbs_up"] = float(row["avg_thumbs_up"])
-            except Exception:
-                row["avg_thumbs_up"] = 0
-            try:
-                row["avg_review_length"] = float(row["avg_review_length"])
-            except Exception:
-                row["avg_review_length"] = 0
-            try:
-                row["rating_std_dev"] = float(row["rating_std_dev"])
-            except Exception:
-                row["rating_std_dev"] = 0
-            try:
-                row["review_velocity"] = float(row["review_velocity"])
-            except Exception:
-                row["review_velocity"] = 0
-            rows.append(row)
-    return rows
+    return read_rows(APP_KPI_IN, APP_KPI_FIELDS)
 
 
 def load_daily_kpis():
-    rows = []
-    with DAILY_KPI_IN.open(encoding="utf-8", newline="") as f:
-        for row in csv.DictReader(f):
-            try:
-                row["daily_reviews"] = int(row["daily_reviews"])
-            except Exception:
-                row["daily_reviews"] = 0
-            try:
-                row["daily_avg_rating"] = float(row["daily_avg_rating"])
-            except Exception:
-                row["daily_avg_rating"] = None
-            rows.append(row)
-    return rows
+    return read_rows(DAILY_KPI_IN, DAILY_KPI_FIELDS)
 
 
-def main():
-    app_rows = load_app_kpis()
-    daily_rows = load_daily_kpis()
-
-    # Create a 3x2 grid for 6 visualizations
-    fig, axes = plt.subplots(3, 2, figsize=(16, 14))
-    fig.suptitle("AI Note-Taking Apps Analytics Dashboard", fontsize=16, fontweight="bold")
-
-    # ============ Plot 1: Top apps by review volume with avg rating ============
-    ax1 = axes[0, 0]
-    app_rows.sort(key=lambda r: r["reviews_count"], reverse=True)
-    top = app_rows[:10]
-    names = [r["app_name"] or r["app_id"] for r in top]
-    avg = [r["avg_rating"] or 0 for r in top]
-    counts = [r["reviews_count"] for r in top]
-
-    ax1.barh(names, avg, color="#1f77b4")
-    ax1.set_title("Top 10 Apps by Review Volume (Avg Rating)", fontweight="bold")
-    ax1.set_xlabel("Average Rating")
-    ax1.set_xlim(0, 5)
-    ax1.invert_yaxis()
-    for i, c in enumerate(counts):
-        ax1.text(avg[i] + 0.05, i, f"{c} reviews", va="center", fontsize=7)
-
-    # ============ Plot 2: Daily average rating over time ============
-    ax2 = axes[0, 1]
-    daily_rows.sort(key=lambda r: r["date"])
-    dates = [datetime.fromisoformat(r["date"]) for r in daily_rows if r.get("date")]
-    daily_avg = [r["daily_avg_rating"] or 0 for r in daily_rows]
-
-    ax2.plot(dates, daily_avg, color="#ff7f0e", linewidth=2)
-    ax2.set_title("Daily Average Rating Over Time", fontweight="bold")
-    ax2.set_xlabel("Date")
-    ax2.set_ylabel("Average Rating")
-    ax2.set_ylim(0, 5)
-    ax2.xaxis.set_major_locator(mdates.MonthLocator(interval=2))
-    ax2.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
-    ax2.tick_params(axis="x", labelrotation=45)
-    ax2.grid(alpha=0.3)
-
-    # ============ Plot 3: Top apps by engagement (avg thumbs up) ============
-    ax3 = axes[1, 0]
-    app_rows.sort(key=lambda r: r["avg_thumbs_up"], reverse=True)
-    top_engagement = app_rows[:10]
-    eng_names = [r["app_name"] or r["app_id"] for r in top_engagement]
-    eng_thumbs = [r["avg_thumbs_up"] for r in top_engagement]
-
-    ax3.barh(eng_names, eng_thumbs, color="#2ca02c")
-    ax3.set_title("Top 10 Apps by User Engagement (Avg Thumbs Up)", fontweight="bold")
-    ax3.set_xlabel("Average Thumbs Up per Review")
-    ax3.invert_yaxis()
-
-    # ============ Plot 4: Review quality - avg review length ============
-    ax4 = axes[1, 1]
-    app_rows.sort(key=lambda r: r["avg_review_length"], reverse=True)
-    top_quality = app_rows[:10]
-    qual_names = [r["app_name"] or r["app_id"] for r in top_quality]
-    qual_lengths = [r["avg_review_length"] for r in top_quality]
-
-    ax4.barh(qual_names, qual_lengths, color="#d62728")
-    ax4.set_title("Top 10 Apps by Review Detail (Avg Review Length)", fontweight="bold")
-    ax4.set_xlabel("Average Review Length (characters)")
-    ax4.invert_yaxis()
-
-    # ============ Plot 5: Rating volatility (std dev) ============
-    ax5 = axes[2, 0]
-    app_rows.sort(key=lambda r: r["rating_std_dev"], reverse=True)
-    top_volatile = app_rows[:10]
-    vol_names = [r["app_name"] or r["app_id"] for r in top_volatile]
-    vol_std = [r["rating_std_dev"] for r in top_volatile]
-
-    ax5.barh(vol_names, vol_std, color="#9467bd")
-    ax5.set_title("Most Polarizing Apps (Rating Std Dev)", fontweight="bold")
-    ax5.set_xlabel("Rating Standard Deviation")
-    ax5.invert_yaxis()
-
-    # ============ Plot 6: Review velocity (most active apps) ============
-    ax6 = axes[2, 1]
-    app_rows.sort(key=lambda r: r["review_velocity"], reverse=True)
-    top_velocity = app_rows[:10]
-    vel_names = [r["app_name"] or r["app_id"] for r in top_velocity]
-    vel_values = [r["review_velocity"] for r in top_velocity]
-
-    ax6.barh(vel_names, vel_values, color="#8c564b")
-    ax6.set_title("Most Active Apps (Review Velocity)", fontweight="bold")
-    ax6.set_xlabel("Reviews per Day")
-    ax6.invert_yaxis()
-
-    # Save the dashboard
+def load_cube():
+    return cube.load(CUBE_IN) if CUBE_IN.exists() else None
+
+
+def load_complaints():
+    if not COMPLAINTS_IN.exists():
+        return None
+    return read_rows(COMPLAINTS_IN, {"count": (int, 0)})
+
+
+def load_alerts():
+    if not ALERTS_IN.exists():
+        return None
+    return read_rows(ALERTS_IN, ALERT_FIELDS)
+
+
+def complaint_totals(complaints):
+    # Phrase -> count summed over apps (of each app's top phrases).
+    totals = {}
+    for row in complaints:
+        totals[row["ngram"]] = totals.get(row["ngram"], 0) + row["count"]
+    ranked = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))
+    return ranked[:COMPLAINT_PHRASES]
+
+
+def app_label(row):
+    return row["app_name"] or row["app_id"]
+
+
+def top_apps(app_rows, field):
+    return sorted(app_rows, key=lambda r: r[field] or 0, reverse=True)[:10]
+
+
+def bar_data(app_rows, field, title, xlabel, color):
+    top = top_apps(app_rows, field)
+    return {
+        "names": [app_label(r) for r in top],
+        "values": [r[field] for r in top],
+        "title": title,
+        "xlabel": xlabel,
+        "color": color,
+    }
+
+
+def trend_rows(kpi_cube, app_rows):
+    # Cube rows of the TREND_APPS apps with the most reviews, with labels.
+    names = {r["app_id"]: app_label(r) for r in app_rows}
+    totals = kpi_cube["reviews"].sum(axis=1)
+    top = np.argsort(-totals, kind="stable")[:TREND_APPS]
+    return [(i, names.get(kpi_cube["app_ids"][i], kpi_cube["app_ids"][i])) for i in top]
+
+
+# ============ Panel data ============
+# Each panel draws only from the (small, picklable) data built here, which
+# is also what its cache key is computed from.
+
+
+def volume_data(app_rows):
+    top = top_apps(app_rows, "reviews_count")
+    return {
+        "names": [app_label(r) for r in top],
+        "avg": [r["avg_rating"] or 0 for r in top],
+        "counts": [r["reviews_count"] for r in top],
+    }
+
+
+def daily_data(daily_rows):
+    rows = sorted((r for r in daily_rows if r.get("date")), key=lambda r: r["date"])
+    return {
+        "dates": [r["date"] for r in rows],
+        "avg": [r["daily_avg_rating"] or 0 for r in rows],
+    }
+
+
+def trend_data(kpi_cube, app_rows):
+    # (rolling 30-day volume, monthly rating) panel data; None without a cube.
+    if kpi_cube is None or not kpi_cube["reviews"].size:
+        return None, None
+    trend = trend_rows(kpi_cube, app_rows)
+    monthly = cube.rollup(kpi_cube, "month")
+    rolling = {
+        "days": cube.dates(kpi_cube),
+        "series": [(name, kpi_cube["reviews_30d"][i]) for i, name in trend],
+    }
+    months = {
+        "months": monthly["labels"].astype("datetime64[M]"),
+        "series": [(name, monthly["rating"][i]) for i, name in trend],
+    }
+    return rolling, months
+
+
+def alert_data(kpi_cube, alerts, app_rows):
+    # Daily rating over the last ALERT_WINDOW_DAYS of the ALERT_APPS apps
+    # with the strongest alerts (by |z|) in that window, with their alerts.
+    if kpi_cube is None or not kpi_cube["reviews"].size or not alerts:
+        return None
+    days = cube.dates(kpi_cube)[-ALERT_WINDOW_DAYS:]
+    start = str(days[0])
+    rows = {app: i for i, app in enumerate(kpi_cube["app_ids"])}
+    alerts = [a for a in alerts if a["date"] >= start and a["app_id"] in rows]
+    strongest = {}
+    for a in alerts:
+        strongest[a["app_id"]] = max(strongest.get(a["app_id"], 0), abs(a["z_score"]))
+    ranked = sorted(strongest, key=lambda app: (-strongest[app], app))
+    names = {r["app_id"]: app_label(r) for r in app_rows}
+    series = []
+    for app in ranked[:ALERT_APPS]:
+        i = rows[app]
+        count = kpi_cube["score_count"][i, -len(days):].astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rating = kpi_cube["score_sum"][i, -len(days):] / count
+        hits = [a for a in alerts if a["app_id"] == app]
+        series.append({
+            "name": names.get(app, app),
+            "rating": rating,
+            "rating_alerts": [
+                (np.datetime64(a["date"]), a["value"]) for a in hits if a["metric"] == "rating"
+            ],
+            "volume_alerts": [
+                np.datetime64(a["date"]) for a in hits if a["metric"] == "volume"
+            ],
+        })
+    return {"days": days, "series": series} if series else None
+
+
+def sentiment_data(app_rows):
+    top = top_apps(app_rows, "reviews_count")
+    scored = [r for r in top if r["avg_sentiment"] is not None]
+    if not scored:
+        return None
+    labels = []
+    for r in scored:
+        label = f"{r['negative_review_pct'] or 0:.0f}% negative"
+        if r.get("top_complaints"):
+            label += f" | {r['top_complaints'].split('; ')[0]}"
+        labels.append(label)
+    return {
+        "names": [app_label(r) for r in scored],
+        "values": [r["avg_sentiment"] for r in scored],
+        "labels": labels,
+    }
+
+
+def panel_data(app_rows, daily_rows, kpi_cube=None, complaints=None, alerts=None):
+    # Panel name -> data, in grid order (row by row, two per row).
+    rolling, monthly = trend_data(kpi_cube, app_rows)
+    return {
+        "alerts": alert_data(kpi_cube, alerts, app_rows),
+        "volume": volume_data(app_rows),
+        "daily_rating": daily_data(daily_rows),
+        "engagement": bar_data(
+            app_rows, "avg_thumbs_up",
+            "Top 10 Apps by User Engagement (Avg Thumbs Up)",
+            "Average Thumbs Up per Review", "#2ca02c",
+        ),
+        "review_length": bar_data(
+            app_rows, "avg_review_length",
+            "Top 10 Apps by Review Detail (Avg Review Length)",
+            "Average Review Length (characters)", "#d62728",
+        ),
+        "volatility": bar_data(
+            app_rows, "rating_std_dev",
+            "Most Polarizing Apps (Rating Std Dev)",
+            "Rating Standard Deviation", "#9467bd",
+        ),
+        "velocity": bar_data(
+            app_rows, "review_velocity",
+            "Most Active Apps (Review Velocity)", "Reviews per Day", "#8c564b",
+        ),
+        "rolling_volume": rolling,
+        "monthly_rating": monthly,
+        "sentiment": sentiment_data(app_rows),
+        "complaints": complaint_totals(complaints) if complaints else None,
+    }
+
+
+# ============ Panel drawing ============
+
+
+def draw_placeholder(ax, text):
+    ax.text(0.5, 0.5, text, ha="center", va="center")
+    ax.set_axis_off()
+
+
+def draw_alerts(ax, data):
+    if data is None:
+        return draw_placeholder(ax, "No rating or volume alerts")
+    for s in data["series"]:
+        (line,) = ax.plot(data["days"], s["rating"], linewidth=1.2, label=s["name"])
+        color = line.get_color()
+        if s["rating_alerts"]:
+            dates, values = zip(*s["rating_alerts"])
+            ax.scatter(dates, values, s=60, marker="X", color=color, edgecolor="black", zorder=3)
+        for day in s["volume_alerts"]:
+            ax.axvline(day, color=color, linestyle="--", linewidth=0.8, alpha=0.6)
+    # Stands out from the other panels.
+    for spine in ax.spines.values():
+        spine.set_edgecolor("#d62728")
+        spine.set_linewidth(2)
+    ax.set_title(
+        "Anomaly Alerts: Daily Rating (X = rating drop, -- = volume spike)",
+        fontweight="bold", color="#d62728",
+    )
+    ax.set_ylabel("Average Rating")
+    ax.set_ylim(0, 5.2)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.legend(fontsize=7)
+    ax.grid(alpha=0.3)
+
+
+def draw_volume(ax, data):
+    ax.barh(data["names"], data["avg"], color="#1f77b4")
+    ax.set_title("Top 10 Apps by Review Volume (Avg Rating)", fontweight="bold")
+    ax.set_xlabel("Average Rating")
+    ax.set_xlim(0, 5)
+    ax.invert_yaxis()
+    for i, c in enumerate(data["counts"]):
+        ax.text(data["avg"][i] + 0.05, i, f"{c} reviews", va="center", fontsize=7)
+
+
+def draw_daily_rating(ax, data):
+    dates = [datetime.fromisoformat(d) for d in data["dates"]]
+    ax.plot(dates, data["avg"], color="#ff7f0e", linewidth=2)
+    ax.set_title("Daily Average Rating Over Time", fontweight="bold")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Average Rating")
+    ax.set_ylim(0, 5)
+    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=2))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.grid(alpha=0.3)
+
+
+def draw_bars(ax, data):
+    ax.barh(data["names"], data["values"], color=data["color"])
+    ax.set_title(data["title"], fontweight="bold")
+    ax.set_xlabel(data["xlabel"])
+    ax.invert_yaxis()
+
+
+def draw_rolling_volume(ax, data):
+    if data is None:
+        return draw_placeholder(ax, "No KPI cube (run serve.py)")
+    for name, values in data["series"]:
+        ax.plot(data["days"], values, linewidth=1.5, label=name)
+    ax.set_title("30-Day Rolling Review Volume (Top Apps)", fontweight="bold")
+    ax.set_ylabel("Reviews (trailing 30 days)")
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.legend(fontsize=7)
+    ax.grid(alpha=0.3)
+
+
+def draw_monthly_rating(ax, data):
+    if data is None:
+        return draw_placeholder(ax, "No KPI cube (run serve.py)")
+    for name, values in data["series"]:
+        ax.plot(data["months"], values, marker=".", linewidth=1.5, label=name)
+    ax.set_title("Monthly Average Rating (Top Apps)", fontweight="bold")
+    ax.set_ylabel("Average Rating")
+    ax.set_ylim(0, 5)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.legend(fontsize=7)
+    ax.grid(alpha=0.3)
+
+
+def draw_sentiment(ax, data):
+    if data is None:
+        return draw_placeholder(ax, "No sentiment scores (run sentiment.py)")
+    values = data["values"]
+    colors = ["#2ca02c" if v >= 0 else "#d62728" for v in values]
+    ax.barh(data["names"], values, color=colors)
+    ax.axvline(0, color="black", linewidth=0.8)
+    ax.set_title("Review Sentiment (Top 10 Apps by Volume)", fontweight="bold")
+    ax.set_xlabel("Average Sentiment (-1 to 1)")
+    ax.set_xlim(-1, 1)
+    ax.invert_yaxis()
+    for i, label in enumerate(data["labels"]):
+        x = values[i] + 0.02 if values[i] >= 0 else 0.02
+        ax.text(x, i, label, va="center", fontsize=7)
+
+
+def draw_complaints(ax, data):
+    if not data:
+        return draw_placeholder(ax, "No complaint terms (run sentiment.py)")
+    ax.barh([p for p, _ in data], [c for _, c in data], color="#e377c2")
+    ax.set_title("Top Complaint Phrases (Low-Rated Reviews)", fontweight="bold")
+    ax.set_xlabel("Mentions")
+    ax.invert_yaxis()
+
+
+PANELS = {
+    "alerts": draw_alerts,
+    "volume": draw_volume,
+    "daily_rating": draw_daily_rating,
+    "engagement": draw_bars,
+    "review_length": draw_bars,
+    "volatility": draw_bars,
+    "velocity": draw_bars,
+    "rolling_volume": draw_rolling_volume,
+    "monthly_rating": draw_monthly_rating,
+    "sentiment": draw_sentiment,
+    "complaints": draw_complaints,
+}
+
+
+def draw_dashboard(app_rows, daily_rows, kpi_cube=None, complaints=None, alerts=None):
+    # Create a 6x2 grid for 11 visualizations
+    fig, axes = plt.subplots(6, 2, figsize=(16, 27.6))
+    fig.suptitle(TITLE, fontsize=16, fontweight="bold")
+    data = panel_data(app_rows, daily_rows, kpi_cube, complaints, alerts)
+    for ax, (name, draw) in zip(axes.flat, PANELS.items()):
+        draw(ax, data[name])
+    for ax in axes.flat[len(PANELS):]:
+        ax.set_axis_off()
     fig.tight_layout()
-    fig.savefig(OUT_IMG, dpi=150, bbox_inches="tight")
-    print(f"Wrote enhanced dashboard to {OUT_IMG}")
+    return fig
+
+
+def save_dashboard(fig):
+    fig.savefig(OUT_IMG, dpi=DPI, bbox_inches="tight")
+    plt.close(fig)
+
+
+# ============ Cached panel rendering ============
+
+
+def code_digest():
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def panel_key(name, data, code):
+    h = hashlib.sha256()
+    h.update(pickle.dumps((name, data, PANEL_SIZE, DPI), protocol=4))
+    h.update(code.encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+def panel_path(name, key):
+    return PANEL_DIR / f"{name}-{key}.png"
+
+
+def save_png(fig, path):
+    tmp = path.with_name(path.name + ".tmp")
+    fig.savefig(tmp, dpi=DPI, format="png")
+    plt.close(fig)
+    os.replace(tmp, path)
+
+
+def render_panel(name, data, path):
+    fig, ax = plt.subplots(figsize=PANEL_SIZE)
+    PANELS[name](ax, data)
+    fig.tight_layout()
+    save_png(fig, path)
+    return name
+
+
+def render_title(path):
+    fig = plt.figure(figsize=(PANEL_SIZE[0] * 2, 0.6))
+    fig.text(0.5, 0.5, TITLE, ha="center", va="center", fontsize=16, fontweight="bold")
+    save_png(fig, path)
+    return "title"
+
+
+def composite(paths, columns=2):
+    # Pastes the title strip and the equally sized panels into one image.
+    title, panels = Image.open(paths[0]), [Image.open(p) for p in paths[1:]]
+    width, height = panels[0].size
+    rows = -(-len(panels) // columns)
+    out = Image.new("RGB", (width * columns, title.height + height * rows), "white")
+    out.paste(title.convert("RGB"), (0, 0))
+    for i, panel in enumerate(panels):
+        x, y = (i % columns) * width, title.height + (i // columns) * height
+        out.paste(panel.convert("RGB"), (x, y))
+    return out
+
+
+def thumbnail_path(width):
+    return OUT_IMG.with_name(f"{OUT_IMG.stem}-{width}.png")
+
+
+def output_stats(paths):
+    stats = {}
+    for path in paths:
+        if path.exists():
+            st = path.stat()
+            stats[path.name] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def render_cached(app_rows, daily_rows, kpi_cube=None, complaints=None, alerts=None):
+    # Returns the names of the panels that had to be drawn.
+    PANEL_DIR.mkdir(parents=True, exist_ok=True)
+    code = code_digest()
+    data = panel_data(app_rows, daily_rows, kpi_cube, complaints, alerts)
+    keys = {"title": panel_key("title", TITLE, code)}
+    keys.update((name, panel_key(name, data[name], code)) for name in PANELS)
+    paths = [panel_path(name, key) for name, key in keys.items()]
+
+    jobs = [(name, key) for name, key in keys.items() if not panel_path(name, key).exists()]
+    if len(jobs) > 1 and WORKERS > 1:
+        with ProcessPoolExecutor(max_workers=min(WORKERS, len(jobs))) as pool:
+            futures = [
+                pool.submit(render_title, panel_path(name, key))
+                if name == "title"
+                else pool.submit(render_panel, name, data[name], panel_path(name, key))
+                for name, key in jobs
+            ]
+            for fut in futures:
+                fut.result()
+    else:
+        for name, key in jobs:
+            if name == "title":
+                render_title(panel_path(name, key))
+            else:
+                render_panel(name, data[name], panel_path(name, key))
+
+    # The composite is only redone when a panel changed or an output was
+    # replaced (e.g. by a PANEL_CACHE = False run) or removed.
+    manifest = PANEL_DIR / "manifest.json"
+    outputs = [OUT_IMG] + [thumbnail_path(w) for w in THUMBNAIL_WIDTHS]
+    state = {"panels": keys, "outputs": output_stats(outputs)}
+    previous = json.loads(manifest.read_text(encoding="utf-8")) if manifest.exists() else None
+    if previous != state:
+        image = composite(paths)
+        image.save(OUT_IMG)
+        for width in THUMBNAIL_WIDTHS:
+            height = round(image.height * width / image.width)
+            image.resize((width, height), Image.LANCZOS).save(thumbnail_path(width))
+        state["outputs"] = output_stats(outputs)
+        manifest.write_text(json.dumps(state, indent=1), encoding="utf-8")
+
+    current = {p.name for p in paths}
+    for path in PANEL_DIR.glob("*.png"):
+        if path.name not in current:
+            path.unlink()
+    return [name for name, _ in jobs if name != "title"]
+
+
+def render(app_rows, daily_rows, kpi_cube=None, complaints=None, alerts=None):
+    # Writes OUT_IMG in the configured mode; returns the panels drawn.
+    if PANEL_CACHE:
+        with metrics.step("render_panels"):
+            return render_cached(app_rows, daily_rows, kpi_cube, complaints, alerts)
+    with metrics.step("draw"):
+        fig = draw_dashboard(app_rows, daily_rows, kpi_cube, complaints, alerts)
+    with metrics.step("savefig"):
+        save_dashboard(fig)
+    return list(PANELS)
+
+
+def main():
+    with metrics.stage("dashboard") as m:
+        with metrics.step("load"):
+            app_rows = load_app_kpis()
+            daily_rows = load_daily_kpis()
+            kpi_cube = load_cube()
+            complaints = load_complaints()
+            alerts = load_alerts()
+        m.rows_in = len(app_rows) + len(daily_rows)
+        drawn = render(app_rows, daily_rows, kpi_cube, complaints, alerts)
+        m.count("panels_drawn", len(drawn))
+        m.rows_out = 1
+        print(f"Drew {len(drawn)} of {len(PANELS)} panels: {', '.join(drawn) or 'none'}")
+        print(f"Wrote enhanced dashboard to {OUT_IMG}")
 
 
 if __name__ == "__main__":
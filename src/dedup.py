@@ -0,0 +1,268 @@
+import hashlib
+import math
+import mmap
+import os
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+
+# Persistent reviewId index: a memory-mapped Bloom filter answers "never
+# seen" in O(1) without touching disk, and an SQLite table of seen IDs is
+# the source of truth for the (rare) "maybe seen" answers. Memory use is
+# the filter's page cache plus SQLite's cache, independent of the ID count.
+# New IDs are staged until commit(), which callers call once the rows are
+# stored; rollback() (or close() without a commit) forgets them, so the
+# filter only ever holds committed IDs.
+#
+# The committed ID count and the filter's capacity are kept in SQLite. Once
+# the count passes the capacity (where the false positive rate, and with it
+# the disk lookups, starts to climb) the filter is rebuilt from the IDs
+# table at GROWTH_FACTOR times the size; so is a missing or resized one.
+
+DEFAULT_CAPACITY = 10_000_000
+DEFAULT_ERROR_RATE = 0.01
+ABSORB_BATCH = 100_000
+GROWTH_FACTOR = 2
+
+
+class BloomFilter:
+    # Bits live in a memory-mapped file; lookups and inserts work on whole
+    # batches of keys with NumPy.
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        size = (self.num_bits + 7) // 8
+        path = Path(path)
+        # A new (empty) filter knows none of the IDs already stored.
+        self.created = not path.exists() or path.stat().st_size != size
+        if self.created:
+            with path.open("wb") as f:
+                f.truncate(size)
+        self.file = path.open("r+b")
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.bits = np.frombuffer(self.mm, dtype=np.uint8)
+        self.rounds = np.arange(self.num_hashes, dtype=np.uint64)
+
+    def positions(self, keys):
+        digests = b"".join(
+            hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+            for key in keys
+        )
+        h = np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+        # Double hashing; uint64 arithmetic wraps around, which is fine here.
+        return (h[:, :1] + self.rounds * (h[:, 1:] | np.uint64(1))) % np.uint64(
+            self.num_bits
+        )
+
+    def contains(self, positions):
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        return (self.bits[positions >> np.uint64(3)] & masks).all(axis=1)
+
+    def add(self, positions):
+        flat = positions.ravel()
+        masks = np.left_shift(1, flat & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, flat >> np.uint64(3), masks)
+
+    def close(self):
+        del self.bits
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
+
+
+class ReviewIdIndex:
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Writes are serialized by callers (the ingest writer lock).
+        self.db = sqlite3.connect(
+            self.path.with_suffix(".sqlite"), check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS ids (id TEXT PRIMARY KEY) WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)"
+        )
+        meta = dict(self.db.execute("SELECT key, value FROM meta"))
+        self.count = meta.get("count")
+        if self.count is None:  # an index from before the count was kept
+            self.count = self.db.execute("SELECT COUNT(*) FROM ids").fetchone()[0]
+        # A filter that grew stays grown.
+        self.capacity = max(capacity, meta.get("capacity", 0))
+        self.error_rate = error_rate
+        self.write_meta()
+        self.db.commit()
+        self.bloom = BloomFilter(
+            self.path.with_suffix(".bloom"), self.capacity, error_rate
+        )
+        if self.bloom.created and self.count:
+            self.rebuild(self.capacity)
+        self.staged = set()
+        self.staged_positions = []
+        self.checked = 0
+        self.dropped = 0
+        self.disk_lookups = 0
+
+    @classmethod
+    def reset(cls, path):
+        path = Path(path)
+        for suffix in (".bloom", ".bloom-tmp", ".sqlite", ".sqlite-wal", ".sqlite-shm"):
+            path.with_suffix(suffix).unlink(missing_ok=True)
+
+    def _seen_on_disk(self, ids):
+        if not ids:
+            return set()
+        self.disk_lookups += len(ids)
+        seen = set()
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            seen.update(
+                row[0]
+                for row in self.db.execute(f"SELECT id FROM ids WHERE id IN ({marks})", chunk)
+            )
+        return seen
+
+    def filter_new(self, rows, key="reviewId"):
+        # Returns rows whose key was not seen before (rows without a key are
+        # kept). New keys are staged; call commit() once the rows are stored.
+        self.checked += len(rows)
+        keyed = [i for i, row in enumerate(rows) if row.get(key)]
+        if not keyed:
+            return list(rows)
+        ids = [rows[i][key] for i in keyed]
+        positions = self.bloom.positions(ids)
+        maybe = self.bloom.contains(positions)
+        seen = self._seen_on_disk({ids[j] for j in np.flatnonzero(maybe)})
+
+        drop = set()
+        new_rows = []
+        for i, review_id in zip(keyed, ids):
+            if review_id in seen or review_id in self.staged:
+                drop.add(i)
+            else:
+                seen.add(review_id)
+                new_rows.append(i)
+        self.dropped += len(drop)
+        if new_rows:
+            new_idx = np.searchsorted(keyed, new_rows)
+            self.staged.update(rows[i][key] for i in new_rows)
+            self.staged_positions.append(positions[new_idx])
+            self.db.executemany(
+                "INSERT OR IGNORE INTO ids VALUES (?)",
+                ((rows[i][key],) for i in new_rows),
+            )
+        if not drop:
+            return list(rows)
+        return [row for i, row in enumerate(rows) if i not in drop]
+
+    def mark_seen(self, ids):
+        # Records `ids` as seen without checking them.
+        ids = list(ids)
+        for i in range(0, len(ids), ABSORB_BATCH):
+            chunk = ids[i : i + ABSORB_BATCH]
+            self.staged.update(chunk)
+            self.staged_positions.append(self.bloom.positions(chunk))
+            self.db.executemany("INSERT OR IGNORE INTO ids VALUES (?)", ((v,) for v in chunk))
+
+    def absorb(self, path):
+        # Adds the IDs of the (closed) index at `path` and returns the ones
+        # that were already here, e.g. one shard's IDs seen in earlier shards.
+        # The new IDs are copied inside SQLite and reach the filter in
+        # ABSORB_BATCH chunks, so memory doesn't grow with the shard.
+        self.commit()
+        self.db.execute(
+            "ATTACH DATABASE ? AS other", (str(Path(path).with_suffix(".sqlite")),)
+        )
+        try:
+            seen = [
+                row[0]
+                for row in self.db.execute(
+                    "SELECT id FROM other.ids WHERE id IN (SELECT id FROM main.ids)"
+                )
+            ]
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO main.ids SELECT id FROM other.ids"
+            )
+            self.count += cursor.rowcount
+            self.write_meta()
+            self.db.commit()
+            # Adding an ID that is already in the filter changes nothing.
+            self.add_ids(self.db.execute("SELECT id FROM other.ids"), self.bloom)
+        finally:
+            self.db.execute("DETACH DATABASE other")
+        self.grow_if_full()
+        return seen
+
+    def add_ids(self, cursor, bloom):
+        while True:
+            chunk = [row[0] for row in cursor.fetchmany(ABSORB_BATCH)]
+            if not chunk:
+                return
+            bloom.add(bloom.positions(chunk))
+
+    def write_meta(self):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            [("count", self.count), ("capacity", self.capacity)],
+        )
+
+    def rebuild(self, capacity):
+        # Refills a filter of the given capacity from the IDs table, next to
+        # the current one, and swaps it in.
+        path = self.path.with_suffix(".bloom")
+        tmp = self.path.with_suffix(".bloom-tmp")
+        tmp.unlink(missing_ok=True)
+        bloom = BloomFilter(tmp, capacity, self.error_rate)
+        self.add_ids(self.db.execute("SELECT id FROM ids"), bloom)
+        bloom.close()
+        self.bloom.close()
+        os.replace(tmp, path)
+        self.bloom = BloomFilter(path, capacity, self.error_rate)
+        self.capacity = capacity
+        self.write_meta()
+        self.db.commit()
+
+    def grow_if_full(self):
+        if self.count <= self.capacity:
+            return
+        capacity = max(self.capacity * GROWTH_FACTOR, self.count)
+        print(
+            f"Review ID filter holds {self.count} IDs, over its capacity of "
+            f"{self.capacity}; rebuilding it for {capacity}"
+        )
+        self.rebuild(capacity)
+
+    def commit(self):
+        # Staged IDs are new ones (mark_seen callers pass unseen IDs).
+        self.count += len(self.staged)
+        self.write_meta()
+        self.db.commit()
+        for positions in self.staged_positions:
+            self.bloom.add(positions)
+        self.staged.clear()
+        self.staged_positions.clear()
+        self.grow_if_full()
+
+    def rollback(self):
+        self.db.rollback()
+        self.staged.clear()
+        self.staged_positions.clear()
+
+    def close(self):
+        # Uncommitted IDs are dropped.
+        self.rollback()
+        self.db.close()
+        self.bloom.close()
+
+    def summary(self):
+        return (
+            f"{self.checked} reviews checked, {self.dropped} duplicates dropped "
+            f"({self.disk_lookups} disk lookups)"
+        )
@@ -1,19 +1,42 @@
 import json
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import takewhile
 from pathlib import Path
 
-from google_play_scraper import app as gp_app
-from google_play_scraper import reviews, search
+try:
+    from google_play_scraper import app as gp_app
+    from google_play_scraper import reviews, search, Sort
+except ImportError:
+    # Only replay mode (REPLAY = True) runs without the scraper.
+    gp_app = reviews = search = Sort = None
+
+from checkpoints import CheckpointStore, as_datetime
+from dedup import ReviewIdIndex
+import metrics
+import rawlog
+from responsecache import ResponseCache
 
 
 RAW_DIR = Path("data/raw")
 RAW_DIR.mkdir(parents=True, exist_ok=True)
 
 APPS_OUT = RAW_DIR / "apps.jsonl"
-REVIEWS_OUT = RAW_DIR / "reviews.jsonl"
+# Segmented, gzip-compressed review log with a per-app block index (see
+# rawlog.py); each page of reviews is appended as one block.
+REVIEWS_OUT = RAW_DIR / "reviews_log"
+CHECKPOINTS = RAW_DIR / "checkpoints.json"
+# reviewId index (Bloom filter + SQLite) shared by every run appending to
+# REVIEWS_OUT; reviews already in the log are dropped before writing.
+REVIEW_ID_INDEX = RAW_DIR / "review_ids"
 
 # Tweak these as needed
 QUERY = "ai note taking"
+# Market of a single ingest run; ingest_queue.py covers many at once.
+LANG = "en"
+COUNTRY = "us"
 NUM_APPS = 40
 SLEEP_SECONDS = 0.5
 REVIEWS_PER_PAGE = 200
@@ -21,91 +44,529 @@ REVIEWS_PER_PAGE = 200
 MAX_REVIEWS_PER_APP = 1000
 DEBUG_SINGLE_APP = False
 TEST_APP_ID = "com.aisense.otter"
+# Keep per-app checkpoints: an interrupted run resumes from the last written
+# page, and later runs append only reviews newer than each app's watermark.
+# Set to False to always start from scratch.
+RESUME = True
+DEDUP_REVIEWS = True
+
+# Concurrent mode: many apps are fetched at once, all scraper calls share a
+# global token bucket (instead of SLEEP_SECONDS) and each app has a cap on
+# in-flight requests. Output files keep the same app/page order, so pages
+# of later apps wait for earlier ones; past MAX_BUFFERED_PAGES waiting pages,
+# fetching pauses for every app but the one being written.
+CONCURRENT = False
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 4.0
+REQUEST_BURST = 8
+MAX_INFLIGHT_PER_APP = 1
+MAX_BUFFERED_PAGES = 100
+
+# Response cache (responsecache.py): search results, app metadata and review
+# pages are kept in RESPONSE_CACHE (outside RAW_DIR, so it survives fresh
+# runs) and reused while younger than their CACHE_TTL_SECONDS. App metadata
+# is refetched early when its change signal (see app_signal) differs from
+# the one seen when it was last fetched. The signal costs a first reviews
+# page per app and "reviews" TTL; ingest reads that page from the cache
+# right after, except when it resumes a capped pass.
+# REPLAY = True runs the whole stage from the cache: every recorded response
+# is used whatever its age, anything not recorded fails instead of going to
+# the network, there are no sleeps or rate limits, and the outputs are
+# rebuilt from scratch (no checkpoints). Meant for load tests and CI.
+CACHE_RESPONSES = True
+RESPONSE_CACHE = Path("data/cache/responses.sqlite")
+CACHE_TTL_SECONDS = {"search": 24 * 3600, "app": 7 * 24 * 3600, "reviews": 3600}
+REPLAY = False
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    def __init__(self, rate, burst, per_app, bucket=None):
+        # `bucket`: anything with acquire(), instead of a TokenBucket.
+        self.bucket = bucket or TokenBucket(rate, burst)
+        self.per_app = per_app
+        self.app_slots = {}
+        self.lock = threading.Lock()
+
+    def _slot(self, app_id):
+        with self.lock:
+            if app_id not in self.app_slots:
+                self.app_slots[app_id] = threading.BoundedSemaphore(self.per_app)
+            return self.app_slots[app_id]
+
+    def call(self, app_id, fn, *args, **kwargs):
+        with self._slot(app_id):
+            waited = time.perf_counter()
+            self.bucket.acquire()
+            metrics.observe("rate_limit_wait_seconds", time.perf_counter() - waited)
+            return metrics.timed_call("scraper_request_seconds", fn, *args, **kwargs)
+
+
+class OrderedAppWriter:
+    # Fetches complete out of order; results are written strictly in app order.
+    # Pages of later apps are buffered until every earlier app is finished;
+    # add_page() blocks while `max_buffered` pages are waiting, except for
+    # the app at the head, which is written straight away.
+    def __init__(self, app_ids, log, store=None, dedup=None, max_buffered=None):
+        self.app_ids = list(app_ids)
+        self.log = log
+        self.store = store
+        self.dedup = dedup
+        self.max_buffered = max_buffered
+        self.state = {
+            app_id: {"meta": None, "meta_done": False, "pages": [], "done": False}
+            for app_id in self.app_ids
+        }
+        self.head = 0
+        self.buffered = 0
+        self.lock = threading.Lock()
+        self.room = threading.Condition(self.lock)
+        self.apps_written = 0
+        self.reviews_written = 0
+
+    def set_meta(self, app_id, meta):
+        with self.lock:
+            st = self.state[app_id]
+            st["meta"] = meta
+            st["meta_done"] = True
+            if meta is None:
+                self.buffered -= len(st["pages"])
+                st["pages"] = []
+            self._flush()
+
+    def skip_meta(self, app_id):
+        # Metadata was already written by an interrupted run.
+        with self.lock:
+            st = self.state[app_id]
+            st["meta"] = {}
+            st["meta_done"] = True
+            st["meta_written"] = True
+            self._flush()
+
+    def meta_failed(self, app_id):
+        with self.lock:
+            st = self.state.get(app_id)
+            return st is not None and st["meta_done"] and st["meta"] is None
+
+    def _full(self, app_id):
+        return (
+            self.max_buffered is not None
+            and self.buffered >= self.max_buffered
+            and self.head < len(self.app_ids)
+            and app_id != self.app_ids[self.head]
+        )
+
+    def add_page(self, app_id, batch, token=None):
+        with self.lock:
+            while self._full(app_id):
+                self.room.wait()
+            self.state[app_id]["pages"].append((batch, token))
+            self.buffered += 1
+            self._flush()
+
+    def finish_reviews(self, app_id, ok=True):
+        with self.lock:
+            self.state[app_id]["done"] = True
+            self.state[app_id]["ok"] = ok
+            self._flush()
+
+    def _flush(self):
+        # Pages written or a new head app: wake producers waiting for room.
+        self.room.notify_all()
+        while self.head < len(self.app_ids):
+            app_id = self.app_ids[self.head]
+            st = self.state[app_id]
+            if not st["meta_done"]:
+                return
+            if st["meta"] is not None:
+                if not st.get("meta_written"):
+                    append_jsonl(APPS_OUT, [st["meta"]])
+                    st["meta_written"] = True
+                    self.apps_written += 1
+                    if self.store:
+                        self.store.mark_meta(app_id)
+                for batch, token in st["pages"]:
+                    written = append_reviews(self.log, batch, self.dedup)
+                    self.reviews_written += written
+                    st["reviews"] = st.get("reviews", 0) + written
+                    if self.store:
+                        self.store.page_written(app_id, batch, token)
+                self.buffered -= len(st["pages"])
+                st["pages"] = []
+            if not st["done"]:
+                return
+            if self.store and st["meta"] is not None and st["ok"]:
+                self.store.finish_app(app_id, MAX_REVIEWS_PER_APP)
+            if st["meta"] is None:
+                print(f"[{self.head + 1}/{len(self.app_ids)}] {app_id}: skipped")
+            else:
+                print(
+                    f"[{self.head + 1}/{len(self.app_ids)}] {app_id}: "
+                    f"{st.get('reviews', 0)} reviews"
+                )
+            del self.state[app_id]
+            self.head += 1
+
+
+# Set by main() when CACHE_RESPONSES or REPLAY is on.
+responses = None
+
+
+def direct_call(app_id, fn, *args, **kwargs):
+    return metrics.timed_call("scraper_request_seconds", fn, *args, **kwargs)
+
+
+# The scraper functions are looked up at call time so a stub module can
+# replace them. `call` (direct_call or RateLimiter.call) only wraps requests
+# that actually go out, so cache hits are neither rate limited nor timed.
+def cached_search(query, n_hits, lang, country, call=direct_call):
+    def fetch():
+        return call(None, search, query, n_hits=n_hits, lang=lang, country=country)
+
+    if responses is None:
+        return fetch()
+    key = [query, n_hits, lang, country]
+    return responses.fetch("search", key, fetch, CACHE_TTL_SECONDS["search"])
+
+
+def cached_reviews(
+    app_id, lang, country, count, continuation_token=None, call=direct_call
+):
+    # Always newest first (the scraper defaults to most relevant): watermarks
+    # and checkpoints rely on it.
+    def fetch():
+        return call(
+            app_id,
+            reviews,
+            app_id,
+            lang=lang,
+            country=country,
+            sort=Sort.NEWEST,
+            count=count,
+            continuation_token=continuation_token,
+        )
+
+    if responses is None:
+        return fetch()
+    token = getattr(continuation_token, "token", None)
+    if continuation_token is not None and token is None:
+        # Past the last page: the scraper returns nothing without a request,
+        # and the key would otherwise collide with the first page.
+        return [], continuation_token
+    key = [app_id, lang, country, "newest", count, token]
+    return responses.fetch("reviews", key, fetch, CACHE_TTL_SECONDS["reviews"])
+
+
+def version_key(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version))
+
+
+def app_signal(app_id, lang, country, call=direct_call):
+    # Stand-in for "the listing changed": the newest app version among the
+    # app's latest reviews. Search hits carry no `updated`/`version`, and the
+    # app's own `updated` needs the metadata request this is meant to save.
+    try:
+        batch, _ = cached_reviews(app_id, lang, country, page_count(0), call=call)
+    except Exception:
+        return None
+    versions = [r["appVersion"] for r in batch if r.get("appVersion")]
+    if not versions:
+        return None
+    return {"review_version": max(versions, key=version_key)}
+
+
+def cached_app(app_id, lang, country, call=direct_call):
+    def fetch():
+        return call(app_id, gp_app, app_id, lang=lang, country=country)
+
+    if responses is None:
+        return fetch()
+    signal = app_signal(app_id, lang, country, call)
+    key = [app_id, lang, country]
+    return responses.fetch("app", key, fetch, CACHE_TTL_SECONDS["app"], signal)
 
 
 def fetch_app_ids():
-    results = search(QUERY, n_hits=NUM_APPS)
+    results = cached_search(QUERY, NUM_APPS, LANG, COUNTRY)
     app_ids = [r["appId"] for r in results if "appId" in r]
     return list(dict.fromkeys(app_ids))  # preserve order, remove duplicates
 
 
-def append_jsonl(path, rows):
-    with path.open("a", encoding="utf-8") as f:
-        for row in rows:
-            # Convert non-JSON types (e.g., datetime) to strings for raw storage
-            f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+def append_jsonl(path, rows, dedup=None):
+    metrics.count(f"{path.stem}_received", len(rows))
+    if dedup is not None:
+        rows = dedup.filter_new(rows)
+    try:
+        with path.open("a", encoding="utf-8") as f:
+            for row in rows:
+                # Convert non-JSON types (e.g., datetime) to strings for raw storage
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+    except BaseException:
+        if dedup is not None:
+            dedup.rollback()
+        raise
+    if dedup is not None:
+        # Only remember the IDs once their rows are on disk.
+        dedup.commit()
+    return len(rows)
 
 
-def main():
-    app_ids = fetch_app_ids()
-    if TEST_APP_ID not in app_ids:
-        app_ids = [TEST_APP_ID] + app_ids
-    if DEBUG_SINGLE_APP:
-        app_ids = [TEST_APP_ID]
-    print(f"Found {len(app_ids)} apps for query: {QUERY}")
+def append_reviews(log, rows, dedup=None):
+    metrics.count("reviews_received", len(rows))
+    if dedup is not None:
+        rows = dedup.filter_new(rows)
+    try:
+        log.append(rows)
+    except BaseException:
+        if dedup is not None:
+            dedup.rollback()
+        raise
+    if dedup is not None:
+        dedup.commit()
+    return len(rows)
+
+
+def resume_point(store, app_id):
+    if store is None:
+        return None, 0, None, False
+    return store.resume_point(app_id)
+
+
+def is_older(at, watermark):
+    at = as_datetime(at)
+    return at is not None and at <= watermark
+
+
+def page_count(app_reviews):
+    if MAX_REVIEWS_PER_APP is None:
+        return REVIEWS_PER_PAGE
+    return min(REVIEWS_PER_PAGE, MAX_REVIEWS_PER_APP - app_reviews)
+
+
+def iter_review_pages(
+    app_id,
+    call=direct_call,
+    token=None,
+    app_reviews=0,
+    watermark=None,
+    lang=None,
+    country=None,
+):
+    # Pages come newest first; with a watermark, paging stops at the first
+    # review that is not newer than it, and the page that reaches it comes
+    # with no token (nothing is left to fetch). Reviews without `at` don't
+    # decide where that is.
+    lang, country = lang or LANG, country or COUNTRY
+    while True:
+        count = page_count(app_reviews)
+        if count <= 0:
+            break
+        reviews_batch, token = cached_reviews(
+            app_id, lang, country, count, continuation_token=token, call=call
+        )
+        if not reviews_batch:
+            break
+        reached = False
+        if watermark is not None:
+            fresh = list(
+                takewhile(
+                    lambda r: not is_older(r.get("at"), watermark), reviews_batch
+                )
+            )
+            reached = len(fresh) < len(reviews_batch)
+            reviews_batch = fresh
+            if reached:
+                token = None
+        if reviews_batch:
+            for r in reviews_batch:
+                r["appId"] = app_id
+            yield reviews_batch, token
+            app_reviews += len(reviews_batch)
+        if reached or not token:
+            break
 
-    APPS_OUT.write_text("", encoding="utf-8")
-    REVIEWS_OUT.write_text("", encoding="utf-8")
 
+def run_sequential(app_ids, log, store=None, dedup=None):
     apps_written = 0
     reviews_written_total = 0
 
     for idx, app_id in enumerate(app_ids, start=1):
+        if store and store.is_done(app_id):
+            continue
         print(f"[{idx}/{len(app_ids)}] Fetching app: {app_id}")
+        if not (store and store.meta_written(app_id)):
+            try:
+                meta = cached_app(app_id, LANG, COUNTRY)
+                append_jsonl(APPS_OUT, [meta])
+                apps_written += 1
+                if store:
+                    store.mark_meta(app_id)
+            except Exception as e:
+                print(f"  Failed to fetch app metadata: {e}")
+                continue
+
+        token, fetched, watermark, exhausted = resume_point(store, app_id)
+        app_reviews = 0
+        ok = True
         try:
-            meta = gp_app(app_id)
-            append_jsonl(APPS_OUT, [meta])
-            apps_written += 1
+            pages = [] if exhausted else iter_review_pages(
+                app_id, token=token, app_reviews=fetched, watermark=watermark
+            )
+            for page, (reviews_batch, token) in enumerate(pages, start=1):
+                print(
+                    f"  Reviews page {page}: {len(reviews_batch)} "
+                    f"(total {fetched + app_reviews + len(reviews_batch)})"
+                )
+                if page == 1:
+                    print(f"  Review keys sample: {list(reviews_batch[0].keys())}")
+                app_reviews += append_reviews(log, reviews_batch, dedup)
+                if store:
+                    store.page_written(app_id, reviews_batch, token)
         except Exception as e:
-            print(f"  Failed to fetch app metadata: {e}")
-            continue
+            ok = False
+            print(f"  Failed to fetch reviews: {type(e).__name__}: {e}")
+        reviews_written_total += app_reviews
+        if store and ok:
+            store.finish_app(app_id, MAX_REVIEWS_PER_APP)
+
+        if not REPLAY:
+            time.sleep(SLEEP_SECONDS)
 
+    return apps_written, reviews_written_total
+
+
+def run_concurrent(app_ids, log, store=None, dedup=None):
+    if store:
+        app_ids = [app_id for app_id in app_ids if not store.is_done(app_id)]
+    limiter = RateLimiter(REQUESTS_PER_SECOND, REQUEST_BURST, MAX_INFLIGHT_PER_APP)
+    writer = OrderedAppWriter(app_ids, log, store, dedup, MAX_BUFFERED_PAGES)
+
+    def fetch_meta(app_id):
+        if store and store.meta_written(app_id):
+            writer.skip_meta(app_id)
+            return
         try:
-            app_reviews = 0
-            token = None
-            page = 0
-            while True:
-                remaining = None
-                if MAX_REVIEWS_PER_APP is not None:
-                    remaining = MAX_REVIEWS_PER_APP - app_reviews
-                    if remaining <= 0:
-                        break
-                count = (
-                    REVIEWS_PER_PAGE
-                    if remaining is None
-                    else min(REVIEWS_PER_PAGE, remaining)
-                )
-                reviews_batch, token = reviews(
-                    app_id,
-                    lang="en",
-                    country="us",
-                    count=count,
-                    continuation_token=token,
-                )
-                if not reviews_batch:
-                    break
-                page += 1
-                if reviews_batch:
-                    print(
-                        f"  Reviews page {page}: {len(reviews_batch)} "
-                        f"(total {app_reviews + len(reviews_batch)})"
-                    )
-                    if app_reviews == 0:
-                        print(f"  Review keys sample: {list(reviews_batch[0].keys())}")
-                for r in reviews_batch:
-                    r["appId"] = app_id
-                append_jsonl(REVIEWS_OUT, reviews_batch)
-                app_reviews += len(reviews_batch)
-                if not token:
+            meta = cached_app(app_id, LANG, COUNTRY, limiter.call)
+        except Exception as e:
+            print(f"  {app_id}: failed to fetch app metadata: {e}")
+            meta = None
+        writer.set_meta(app_id, meta)
+
+    def fetch_reviews(app_id):
+        token, fetched, watermark, exhausted = resume_point(store, app_id)
+        ok = True
+        try:
+            pages = [] if exhausted else iter_review_pages(
+                app_id,
+                call=limiter.call,
+                token=token,
+                app_reviews=fetched,
+                watermark=watermark,
+            )
+            for reviews_batch, token in pages:
+                if writer.meta_failed(app_id):
                     break
-            reviews_written_total += app_reviews
+                writer.add_page(app_id, reviews_batch, token)
         except Exception as e:
-            print(f"  Failed to fetch reviews: {type(e).__name__}: {e}")
+            ok = False
+            print(f"  {app_id}: failed to fetch reviews: {type(e).__name__}: {e}")
+        writer.finish_reviews(app_id, ok)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = []
+        for app_id in app_ids:
+            futures.append(pool.submit(fetch_meta, app_id))
+            futures.append(pool.submit(fetch_reviews, app_id))
+        for fut in futures:
+            fut.result()
+
+    return writer.apps_written, writer.reviews_written
+
+
+def select_app_ids():
+    app_ids = fetch_app_ids()
+    if TEST_APP_ID not in app_ids:
+        app_ids = [TEST_APP_ID] + app_ids
+    if DEBUG_SINGLE_APP:
+        app_ids = [TEST_APP_ID]
+    print(f"Found {len(app_ids)} apps for query: {QUERY}")
+    return app_ids
+
+
+def main():
+    global responses
+    with metrics.stage("ingest") as m:
+        if REPLAY and not RESPONSE_CACHE.exists():
+            raise FileNotFoundError(f"No response cache to replay at {RESPONSE_CACHE}")
+        if CACHE_RESPONSES or REPLAY:
+            responses = ResponseCache(RESPONSE_CACHE, replay=REPLAY)
+
+        store = None
+        if RESUME and not REPLAY:
+            store = CheckpointStore(CHECKPOINTS)
+            if not rawlog.exists(REVIEWS_OUT):
+                store.reset()
+        else:
+            CHECKPOINTS.unlink(missing_ok=True)
+
+        if store and store.run_in_progress():
+            app_ids = store.run_app_ids()
+            print(f"Resuming interrupted run over {len(app_ids)} apps")
+        else:
+            app_ids = select_app_ids()
+            # App metadata is a fresh snapshot each run; reviews are only
+            # truncated when there is no watermark history to continue from.
+            APPS_OUT.write_text("", encoding="utf-8")
+            if store and store.has_history():
+                print(f"Incremental run: appending new reviews to {REVIEWS_OUT}")
+            else:
+                rawlog.RawLog.reset(REVIEWS_OUT)
+                ReviewIdIndex.reset(REVIEW_ID_INDEX)
+            if store:
+                store.start_run(app_ids)
+
+        dedup = ReviewIdIndex(REVIEW_ID_INDEX) if DEDUP_REVIEWS else None
+        log = rawlog.RawLog(REVIEWS_OUT)
+        run = run_concurrent if CONCURRENT else run_sequential
+        apps_written, reviews_written_total = run(app_ids, log, store, dedup)
+        log.close()
 
-        time.sleep(SLEEP_SECONDS)
+        if store:
+            store.finish_run()
+        if dedup is not None:
+            print(f"Dedup: {dedup.summary()}")
+            dedup.close()
+        if responses is not None:
+            print(f"Response cache: {responses.summary()}")
+            responses.close()
+            responses = None
 
-    print(f"Wrote {apps_written} apps to {APPS_OUT}")
-    print(f"Wrote {reviews_written_total} reviews to {REVIEWS_OUT}")
+        print(f"Wrote {apps_written} apps to {APPS_OUT}")
+        print(f"Wrote {reviews_written_total} reviews to {REVIEWS_OUT}")
+        m.rows_in = m.counters.get("reviews_received", 0)
+        m.rows_out = reviews_written_total
 
 
 if __name__ == "__main__":
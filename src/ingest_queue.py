@@ -0,0 +1,386 @@
+import argparse
+import json
+import os
+import socket
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing import Process
+from pathlib import Path
+
+from checkpoints import as_datetime, token_from_state, token_to_state
+from dedup import ReviewIdIndex
+import ingest
+from jobqueue import JobQueue
+import metrics
+import rawlog
+from responsecache import CacheMiss, ResponseCache
+
+
+# Queue-backed ingestion over many markets (query x country x language):
+#
+#   python src/ingest_queue.py run [--workers N]  # enqueue, then drain the queue
+#   python src/ingest_queue.py enqueue
+#   python src/ingest_queue.py work               # one more worker, from any shell
+#   python src/ingest_queue.py status
+#
+# enqueue adds a "search" job per query and market, and an "app" job for
+# every app already known in a market. A search job adds an "app" job for
+# each app it finds that isn't queued yet. An app job fetches the app's
+# metadata and its reviews newer than the app's watermark, then writes them
+# to its market's partition, laid out like data/raw:
+#
+#   data/raw/markets/<lang>-<country>/apps.jsonl, reviews_log/, review_ids.*
+#
+# Jobs live in a durable SQLite queue (jobqueue.py) with leases, retries
+# with exponential backoff, and priority by staleness: seconds since the app
+# was last fetched in that market (never: since the epoch), so new and
+# stale apps go first. Any number of worker processes can pull from it.
+# An app job writes its market's partition under a lock on the market
+# (outside of any queue transaction), then advances the app's watermark and
+# acks the job in one transaction. The writes can be repeated safely: the
+# market's reviewId index drops reviews already written, and a marker in
+# the queue keeps a retried job from appending the app's metadata again.
+
+QUEUE_DB = Path("data/queue/ingest.sqlite")
+MARKETS_DIR = ingest.RAW_DIR / "markets"
+
+# Tweak these as needed
+QUERIES = [ingest.QUERY]
+COUNTRIES = ["us", "gb", "ca", "au", "in"]
+LANGUAGES = ["en"]
+WORKERS = 4
+# Scraper requests per second over all workers, drawn from one token bucket
+# in QUEUE_DB (burst: ingest.REQUEST_BURST), so adding workers doesn't raise
+# the rate the Play Store sees.
+REQUESTS_PER_SECOND = ingest.REQUESTS_PER_SECOND
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+# Longest an idle worker sleeps before checking the queue again.
+POLL_SECONDS = 1
+# reviewIds expected per market (sizes its Bloom filter, see dedup.py).
+MARKET_DEDUP_CAPACITY = 1_000_000
+# How often a worker checks whether a market it waits for is unlocked.
+LOCK_POLL_SECONDS = 0.05
+
+# backfill: where a job cut short by ingest.MAX_REVIEWS_PER_APP stopped
+# (JSON: continuation token and the newest review it fetched); the next job
+# continues from there and the watermark moves once it gets down to it.
+MARKET_APPS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS market_apps (market TEXT, app_id TEXT, "
+    "fetched_at REAL, watermark TEXT, backfill TEXT, "
+    "PRIMARY KEY (market, app_id)) WITHOUT ROWID"
+)
+# An app job whose metadata is already in apps.jsonl, keyed by the app's
+# fetched_at when the job started; cleared when the job is acked.
+META_WRITES_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta_writes (market TEXT, app_id TEXT, "
+    "since REAL, PRIMARY KEY (market, app_id)) WITHOUT ROWID"
+)
+
+
+class SharedTokenBucket:
+    # ingest.TokenBucket over a bucket row in the queue database.
+    def __init__(self, queue, rate, capacity):
+        self.queue = queue
+        self.rate = rate
+        self.capacity = capacity
+
+    def acquire(self):
+        while True:
+            wait = self.queue.take_token("requests", self.rate, self.capacity)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+def market_name(lang, country):
+    return f"{lang}-{country}"
+
+
+def open_queue():
+    queue = JobQueue(
+        QUEUE_DB, LEASE_SECONDS, MAX_ATTEMPTS, BACKOFF_SECONDS, MAX_BACKOFF_SECONDS
+    )
+    # Per-market app state, next to the jobs so it commits with their acks.
+    queue.db.execute(MARKET_APPS_SCHEMA)
+    columns = [r[1] for r in queue.db.execute("PRAGMA table_info(market_apps)")]
+    if "backfill" not in columns:
+        queue.db.execute("ALTER TABLE market_apps ADD COLUMN backfill TEXT")
+    queue.db.execute(META_WRITES_SCHEMA)
+    return queue
+
+
+def staleness(fetched_at, now):
+    return now - (fetched_at or 0)
+
+
+def app_job(app_id, lang, country, fetched_at, now):
+    payload = {"app_id": app_id, "lang": lang, "country": country}
+    key = f"app:{market_name(lang, country)}:{app_id}"
+    return key, "app", payload, staleness(fetched_at, now)
+
+
+def enqueue_markets(queue):
+    now = time.time()
+    markets = {
+        market_name(lang, country): (lang, country)
+        for lang in LANGUAGES
+        for country in COUNTRIES
+    }
+    jobs = [
+        (
+            f"search:{market}:{query}",
+            "search",
+            {"query": query, "lang": lang, "country": country},
+            staleness(None, now),
+        )
+        for market, (lang, country) in markets.items()
+        for query in QUERIES
+    ]
+    known = queue.db.execute("SELECT market, app_id, fetched_at FROM market_apps")
+    jobs += [
+        app_job(app_id, *markets[market], fetched_at, now)
+        for market, app_id, fetched_at in known
+        if market in markets
+    ]
+    return queue.enqueue(jobs)
+
+
+def run_search(queue, job, owner, call):
+    p = job["payload"]
+    lang, country = p["lang"], p["country"]
+    results = ingest.cached_search(p["query"], ingest.NUM_APPS, lang, country, call)
+    hits = [r for r in results if "appId" in r]
+
+    def commit(db):
+        fetched = dict(
+            db.execute(
+                "SELECT app_id, fetched_at FROM market_apps WHERE market = ?",
+                (market_name(lang, country),),
+            )
+        )
+        now = time.time()
+        jobs = []
+        for r in hits:
+            fetched_at = fetched.get(r["appId"])
+            jobs.append(app_job(r["appId"], lang, country, fetched_at, now))
+        queue.enqueue(jobs, requeue=False)
+
+    queue.ack(job, owner, commit)
+    return f"{len(hits)} apps"
+
+
+@contextmanager
+def market_lock(queue, market, owner):
+    name = f"market:{market}"
+    while not queue.try_lock(name, owner):
+        time.sleep(LOCK_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        queue.unlock(name, owner)
+
+
+def write_meta(queue, market, app_id, since, meta):
+    # Appends the app's metadata once per job, however often it is retried.
+    key = (market, app_id, since)
+    written = queue.db.execute(
+        "SELECT 1 FROM meta_writes WHERE market = ? AND app_id = ? AND since = ?", key
+    ).fetchone()
+    if written:
+        return
+    ingest.append_jsonl(MARKETS_DIR / market / "apps.jsonl", [meta])
+    with queue.transaction() as db:
+        db.execute("INSERT OR REPLACE INTO meta_writes VALUES (?, ?, ?)", key)
+
+
+def write_reviews(market, pages):
+    dedup = None
+    if ingest.DEDUP_REVIEWS:
+        dedup = ReviewIdIndex(MARKETS_DIR / market / "review_ids", MARKET_DEDUP_CAPACITY)
+    written = 0
+    try:
+        with rawlog.RawLog(MARKETS_DIR / market / "reviews_log") as log:
+            for batch in pages:
+                written += ingest.append_reviews(log, batch, dedup)
+    finally:
+        if dedup is not None:
+            dedup.close()
+    return written
+
+
+def run_app(queue, job, owner, call):
+    p = job["payload"]
+    app_id, lang, country = p["app_id"], p["lang"], p["country"]
+    market = market_name(lang, country)
+    row = queue.db.execute(
+        "SELECT watermark, fetched_at, backfill FROM market_apps "
+        "WHERE market = ? AND app_id = ?",
+        (market, app_id),
+    ).fetchone()
+    watermark = as_datetime(row[0]) if row else None
+    since = (row[1] if row else None) or 0
+    backfill = json.loads(row[2]) if row and row[2] else {}
+
+    meta = ingest.cached_app(app_id, lang, country, call)
+    # Pages are spilled to a temporary file until they are written, so one
+    # page is held in memory however many reviews the app has.
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spill:
+        newest = as_datetime(backfill.get("newest"))
+        token = token_from_state(backfill.get("token"))
+        fetched = 0
+        renewed = time.monotonic()
+        for batch, token in ingest.iter_review_pages(
+            app_id, call, token=token, watermark=watermark, lang=lang, country=country
+        ):
+            fetched += len(batch)
+            spill.write(json.dumps(batch, ensure_ascii=False, default=str) + "\n")
+            for t in map(as_datetime, (r.get("at") for r in batch)):
+                if t is not None and (newest is None or t > newest):
+                    newest = t
+            if time.monotonic() - renewed > LEASE_SECONDS / 3:
+                if not queue.renew(job, owner):
+                    return "lease lost"
+                renewed = time.monotonic()
+        spill.seek(0)
+
+        (MARKETS_DIR / market).mkdir(parents=True, exist_ok=True)
+        with market_lock(queue, market, owner):
+            # A worker that lost the job writes nothing; one that loses it
+            # while writing only repeats what the next one writes anyway.
+            if not queue.renew(job, owner):
+                return "lease lost"
+            write_meta(queue, market, app_id, since, meta)
+            written = write_reviews(market, map(json.loads, spill))
+
+    # As CheckpointStore.finish_app: a capped job over an app with a
+    # watermark leaves the rest down to it to the next job.
+    token = token_to_state(token)
+    cap = ingest.MAX_REVIEWS_PER_APP
+    capped = cap is not None and token is not None and fetched >= cap
+    if capped and watermark is not None:
+        backfill = json.dumps({"token": token, "newest": newest and newest.isoformat()})
+        newest = None
+    else:
+        backfill = None
+
+    def commit(db):
+        db.execute(
+            "INSERT INTO market_apps VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (market, app_id) DO UPDATE SET fetched_at = excluded.fetched_at, "
+            "watermark = COALESCE(excluded.watermark, watermark), "
+            "backfill = excluded.backfill",
+            (
+                market,
+                app_id,
+                time.time(),
+                newest.isoformat() if newest else None,
+                backfill,
+            ),
+        )
+        db.execute(
+            "DELETE FROM meta_writes WHERE market = ? AND app_id = ?", (market, app_id)
+        )
+
+    if not queue.ack(job, owner, commit):
+        return "lease lost"
+    metrics.count("reviews_written", written)
+    return f"{written} reviews"
+
+
+HANDLERS = {"search": run_search, "app": run_app}
+
+
+def work(name="worker"):
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    queue = open_queue()
+    if ingest.CACHE_RESPONSES or ingest.REPLAY:
+        ingest.responses = ResponseCache(ingest.RESPONSE_CACHE, replay=ingest.REPLAY)
+    bucket = SharedTokenBucket(queue, REQUESTS_PER_SECOND, ingest.REQUEST_BURST)
+    limiter = ingest.RateLimiter(
+        REQUESTS_PER_SECOND, ingest.REQUEST_BURST, ingest.MAX_INFLIGHT_PER_APP, bucket
+    )
+    with metrics.stage(f"ingest_{name}") as m:
+        while True:
+            job = queue.lease(owner)
+            if job is None:
+                wait = queue.wait_seconds()
+                if wait is None:
+                    break
+                time.sleep(min(max(wait, 0.1), POLL_SECONDS))
+                continue
+            try:
+                result = HANDLERS[job["kind"]](queue, job, owner, limiter.call)
+                m.count(f"{job['kind']}_jobs_done")
+                print(f"[{name}] {job['key']}: {result}")
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                # A replay can't get a missing response by retrying.
+                queue.fail(job, owner, error, retry=not isinstance(e, CacheMiss))
+                m.count(f"{job['kind']}_jobs_failed")
+                print(f"[{name}] {job['key']}: attempt {job['attempts']} failed: {error}")
+        m.rows_in = m.counters.get("reviews_received", 0)
+        m.rows_out = m.counters.get("reviews_written", 0)
+    if ingest.responses is not None:
+        ingest.responses.close()
+        ingest.responses = None
+    queue.close()
+
+
+def print_status(queue):
+    counts = queue.counts()
+    print("Jobs: " + ", ".join(f"{n} {state}" for state, n in counts.items()))
+    for key, attempts, error in queue.failures():
+        print(f"  failed after {attempts} attempts: {key}: {error}")
+    for market, apps, fetched in queue.db.execute(
+        "SELECT market, COUNT(*), MAX(fetched_at) FROM market_apps GROUP BY market"
+    ):
+        last = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(fetched))
+        print(f"  {market}: {apps} apps, last fetched {last}")
+
+
+def run(workers=WORKERS):
+    queue = open_queue()
+    added = enqueue_markets(queue)
+    print(f"Queued {added} jobs over {len(LANGUAGES) * len(COUNTRIES)} markets")
+    procs = [
+        Process(target=work, args=(f"worker{i}",)) for i in range(1, workers + 1)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    print_status(queue)
+    queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue-backed multi-market ingestion")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_cmd = sub.add_parser("run", help="enqueue all markets and drain the queue")
+    run_cmd.add_argument("--workers", type=int, default=WORKERS)
+    sub.add_parser("enqueue", help="queue search and known-app jobs for all markets")
+    work_cmd = sub.add_parser("work", help="run one worker until the queue is drained")
+    work_cmd.add_argument("--name", default=f"worker-{os.getpid()}")
+    sub.add_parser("status", help="job counts, failures and markets")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.workers)
+    elif args.command == "enqueue":
+        queue = open_queue()
+        print(f"Queued {enqueue_markets(queue)} jobs")
+        queue.close()
+    elif args.command == "work":
+        work(args.name)
+    else:
+        queue = open_queue()
+        print_status(queue)
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import json
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# Durable job queue in one SQLite file, shared by any number of worker
+# processes (WAL mode; every state change is one IMMEDIATE transaction).
+#
+# A job has a unique key, a kind and a JSON payload. lease() hands the
+# ready job with the highest priority to one worker for `lease_seconds`;
+# the worker then ack()s it, or fail()s it to retry after an exponential
+# backoff with jitter (until `max_attempts`, then the job is kept as
+# "failed"). A lease that runs out, e.g. because its worker died, makes the
+# job available again and counts as a failed attempt. ack(), fail() and
+# renew() only succeed while the caller still holds the lease, so a worker
+# that lost its job to another one can't complete it twice.
+#
+# States: queued -> leased -> done | queued (retry) | failed
+#
+# take_token() draws from a named token bucket kept in the same file, so a
+# request rate can be shared by all workers. try_lock() takes a named lock
+# for `lease_seconds` (or until unlock()), for outputs that several jobs
+# write to outside of the queue's transactions.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority REAL NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, priority DESC, id);
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    lease_until REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path,
+        lease_seconds=300,
+        max_attempts=5,
+        backoff_seconds=30,
+        max_backoff_seconds=3600,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        # Autocommit; transactions are opened explicitly.
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    @classmethod
+    def reset(cls, path):
+        path = Path(path)
+        for suffix in ("", "-wal", "-shm"):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+    @contextmanager
+    def transaction(self):
+        # Takes the write lock up front; nested uses join the outer one.
+        if self.db.in_transaction:
+            yield self.db
+            return
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def enqueue(self, jobs, requeue=True):
+        # jobs: (key, kind, payload, priority). A key that is already queued
+        # or leased is left alone apart from its priority. With requeue,
+        # finished and failed jobs are queued again with fresh attempts;
+        # without it they are left as they are.
+        now = time.time()
+        rows = [
+            (key, kind, json.dumps(payload), priority, now)
+            for key, kind, payload, priority in jobs
+        ]
+        reset = "state IN ('done', 'failed')" if requeue else "0"
+        with self.transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT INTO jobs (key, kind, payload, priority, state, available_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?) "
+                "ON CONFLICT (key) DO UPDATE SET priority = excluded.priority, "
+                f"payload = CASE WHEN {reset} THEN excluded.payload ELSE payload END, "
+                f"attempts = CASE WHEN {reset} THEN 0 ELSE attempts END, "
+                f"available_at = CASE WHEN {reset} THEN excluded.available_at "
+                "ELSE available_at END, "
+                f"error = CASE WHEN {reset} THEN NULL ELSE error END, "
+                f"state = CASE WHEN {reset} THEN 'queued' ELSE state END",
+                rows,
+            )
+            return db.total_changes - before
+
+    def backoff(self, attempts):
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _expire_leases(self, db, now):
+        expired = db.execute(
+            "SELECT id, attempts FROM jobs WHERE state = 'leased' AND lease_until <= ?",
+            (now,),
+        ).fetchall()
+        for job_id, attempts in expired:
+            self._retry(db, job_id, attempts, "lease expired", now)
+
+    def _retry(self, db, job_id, attempts, error, now):
+        if attempts >= self.max_attempts:
+            state, available_at = "failed", now
+        else:
+            state, available_at = "queued", now + self.backoff(attempts)
+        db.execute(
+            "UPDATE jobs SET state = ?, available_at = ?, owner = NULL, "
+            "lease_until = NULL, error = ?, updated_at = ? WHERE id = ?",
+            (state, available_at, error, now, job_id),
+        )
+
+    def lease(self, owner):
+        # -> {"id", "key", "kind", "payload", "attempts"}, or None when no
+        # job is ready.
+        now = time.time()
+        with self.transaction() as db:
+            self._expire_leases(db, now)
+            row = db.execute(
+                "SELECT id, key, kind, payload, attempts FROM jobs "
+                "WHERE state = 'queued' AND available_at <= ? "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, key, kind, payload, attempts = row
+            db.execute(
+                "UPDATE jobs SET state = 'leased', attempts = attempts + 1, owner = ?, "
+                "lease_until = ?, updated_at = ? WHERE id = ?",
+                (owner, now + self.lease_seconds, now, job_id),
+            )
+        return {
+            "id": job_id,
+            "key": key,
+            "kind": kind,
+            "payload": json.loads(payload),
+            "attempts": attempts + 1,
+        }
+
+    def _holds(self, db, job, owner):
+        row = db.execute(
+            "SELECT 1 FROM jobs WHERE id = ? AND state = 'leased' AND owner = ? "
+            "AND lease_until > ?",
+            (job["id"], owner, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def renew(self, job, owner):
+        with self.transaction() as db:
+            if not self._holds(db, job, owner):
+                return False
+            db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ?",
+                (time.time() + self.lease_seconds, job["id"]),
+            )
+        return True
+
+    def ack(self, job, owner, commit=None):
+        # commit(db), if given, runs in the same transaction that marks the
+        # job done, and only if the lease is still held. Keep it to database
+        # updates: it holds the write lock for every worker.
+        with self.transaction() as db:
+            if not self._holds(db, job, owner):
+                return False
+            if commit is not None:
+                commit(db)
+            db.execute(
+                "UPDATE jobs SET state = 'done', owner = NULL, lease_until = NULL, "
+                "error = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), job["id"]),
+            )
+        return True
+
+    def fail(self, job, owner, error, retry=True):
+        with self.transaction() as db:
+            if not self._holds(db, job, owner):
+                return False
+            attempts = job["attempts"] if retry else self.max_attempts
+            self._retry(db, job["id"], attempts, error, time.time())
+        return True
+
+    def try_lock(self, name, owner):
+        # -> True if `owner` now holds lock `name`; a lock whose lease ran
+        # out (e.g. its worker died) is taken over.
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("DELETE FROM locks WHERE name = ? AND lease_until <= ?", (name, now))
+            db.execute(
+                "INSERT OR IGNORE INTO locks VALUES (?, ?, ?)",
+                (name, owner, now + self.lease_seconds),
+            )
+            row = db.execute("SELECT owner FROM locks WHERE name = ?", (name,)).fetchone()
+        return row[0] == owner
+
+    def unlock(self, name, owner):
+        with self.transaction() as db:
+            db.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def take_token(self, name, rate, capacity):
+        # Takes one token from bucket `name` (refilled at `rate` per second
+        # up to `capacity`). -> 0 when taken, else seconds until one is due.
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)
+            ).fetchone()
+            tokens = capacity
+            if row is not None:
+                tokens = min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            db.execute(
+                "INSERT INTO buckets VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE "
+                "SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (name, tokens, now),
+            )
+        return wait
+
+    def wait_seconds(self):
+        # Until the next backed-off job is due or a lease runs out; None
+        # when nothing is queued or leased, i.e. the queue is drained.
+        row = self.db.execute(
+            "SELECT MIN(CASE WHEN state = 'queued' THEN available_at ELSE lease_until END) "
+            "FROM jobs WHERE state IN ('queued', 'leased')"
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def counts(self):
+        counts = dict.fromkeys(("queued", "leased", "done", "failed"), 0)
+        counts.update(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+        return counts
+
+    def failures(self, limit=10):
+        return self.db.execute(
+            "SELECT key, attempts, error FROM jobs WHERE state = 'failed' "
+            "ORDER BY updated_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,322 @@
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import cube
+
+
+# Local JSON service over the KPI outputs of serve.py. KPIs are held in
+# memory with one precomputed ordering per metric, and encoded responses go
+# through an LRU cache that is dropped whenever the KPI files change. A
+# reload that fails (e.g. a file written by hand, not by serve.py's atomic
+# replace) keeps serving the loaded KPIs and is retried on the next check.
+#
+#   GET /top?metric=review_velocity&k=10[&order=asc]
+#   GET /apps/<app_id>
+#   GET /daily[?start=YYYY-MM-DD][&end=YYYY-MM-DD]
+#   GET /trend?app=<app_id>[&freq=day|week|month]   (from kpi_cube.npz)
+#   GET /health
+
+PROCESSED_DIR = Path("data/processed")
+APP_KPI_IN = PROCESSED_DIR / "app_kpis.csv"
+DAILY_KPI_IN = PROCESSED_DIR / "daily_kpis.csv"
+CUBE_IN = PROCESSED_DIR / "kpi_cube.npz"
+
+# Tweak these as needed
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_SIZE = 4096
+DEFAULT_K = 10
+MAX_K = 1000
+# How often (at most) the KPI files are stat'ed for changes.
+RELOAD_CHECK_SECONDS = 1.0
+
+TOP_METRICS = [
+    "reviews_count",
+    "avg_thumbs_up",
+    "avg_review_length",
+    "rating_std_dev",
+    "review_velocity",
+    "avg_rating",
+    "avg_sentiment",
+    "negative_review_pct",
+]
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def records(df):
+    # NaN -> None so the JSON has nulls, as the CSVs have empty cells.
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def error_body(message):
+    return json.dumps({"error": str(message)}).encode("utf-8")
+
+
+def metric_order(values, ascending):
+    # Stable, so ties keep the file order (app_name, app_id); missing last.
+    values = np.asarray(values, dtype=float)
+    key = values if ascending else -values
+    return np.argsort(np.where(np.isnan(values), np.inf, key), kind="stable")
+
+
+class KpiStore:
+    def __init__(
+        self,
+        app_path=APP_KPI_IN,
+        daily_path=DAILY_KPI_IN,
+        cube_path=CUBE_IN,
+        generation=0,
+    ):
+        self.app_path = Path(app_path)
+        self.daily_path = Path(daily_path)
+        self.cube_path = Path(cube_path)
+        # Counts reloads; cached responses are keyed by it.
+        self.generation = generation
+        self.signature = None
+        self.load()
+
+    def file_signature(self):
+        sig = []
+        for path in (self.app_path, self.daily_path, self.cube_path):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                sig.append(None)
+                continue
+            sig.append((st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    def load(self):
+        self.signature = self.file_signature()
+        apps = pd.read_csv(self.app_path, dtype={"app_id": str, "app_name": str})
+        daily = pd.read_csv(self.daily_path, dtype={"date": str})
+        daily = daily.sort_values("date", kind="stable")
+
+        self.apps = records(apps)
+        self.by_id = {row["app_id"]: row for row in self.apps}
+        self.order = {}
+        for metric in TOP_METRICS:
+            values = apps[metric] if metric in apps else np.full(len(apps), np.nan)
+            self.order[(metric, False)] = metric_order(values, False).tolist()
+            self.order[(metric, True)] = metric_order(values, True).tolist()
+        self.daily = records(daily)
+        self.dates = [row["date"] for row in self.daily]
+        self.cube = cube.load(self.cube_path) if self.cube_path.exists() else None
+
+    def changed(self):
+        return self.file_signature() != self.signature
+
+    def top(self, metric, k=DEFAULT_K, ascending=False):
+        order = self.order.get((metric, ascending))
+        if order is None:
+            raise QueryError(400, f"unknown metric {metric!r}")
+        return [self.apps[i] for i in order[:k]]
+
+    def app(self, app_id):
+        row = self.by_id.get(app_id)
+        if row is None:
+            raise QueryError(404, f"unknown app {app_id!r}")
+        return row
+
+    def daily_range(self, start=None, end=None):
+        lo = 0 if start is None else bisect_left(self.dates, start)
+        hi = len(self.dates) if end is None else bisect_right(self.dates, end)
+        return self.daily[lo:hi]
+
+    def trend(self, app_id, freq="day"):
+        if self.cube is None:
+            raise QueryError(404, "no KPI cube; run serve.py")
+        if freq not in ("day", "week", "month"):
+            raise QueryError(400, f"unknown frequency {freq!r}")
+        series = cube.app_series(self.cube, app_id, freq)
+        if series is None:
+            raise QueryError(404, f"unknown app {app_id!r}")
+        ratings = [c for c in series.columns if c.startswith("rating")]
+        series[ratings] = series[ratings].astype(float).round(4)
+        return records(series.astype({"date": str}))
+
+
+class LruCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class KpiService:
+    def __init__(self, store, cache_size=CACHE_SIZE):
+        self.store = store
+        self.cache = LruCache(cache_size)
+        self.reload_lock = threading.Lock()
+        self.next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+        self.reloads = 0
+        self.reload_errors = 0
+        self.reload_error = None
+
+    def refresh(self):
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        with self.reload_lock:
+            if now < self.next_check:
+                return
+            self.next_check = now + RELOAD_CHECK_SECONDS
+            if not self.store.changed():
+                return
+            # Swap in a fully loaded store, then drop responses built from
+            # the old one. Requests still running on the old store cache
+            # under its generation, which is never looked up again.
+            old = self.store
+            try:
+                store = KpiStore(
+                    old.app_path, old.daily_path, old.cube_path, old.generation + 1
+                )
+            except Exception as exc:
+                self.reload_errors += 1
+                self.reload_error = f"{type(exc).__name__}: {exc}"
+                return
+            self.store = store
+            self.cache.clear()
+            self.reloads += 1
+            self.reload_error = None
+
+    def handle(self, target):
+        # Returns (status, body bytes) for a request target like "/top?k=5".
+        self.refresh()
+        if target.startswith("/health"):
+            return 200, json.dumps(self.health()).encode("utf-8")
+        store = self.store
+        key = (store.generation, target)
+        body = self.cache.get(key)
+        if body is not None:
+            return 200, body
+        try:
+            payload = self.query(target, store)
+        except QueryError as exc:
+            return exc.status, error_body(exc)
+        except Exception as exc:
+            return 500, error_body(f"{type(exc).__name__}: {exc}")
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.cache.put(key, body)
+        return 200, body
+
+    def health(self):
+        return {
+            "apps": len(self.store.apps),
+            "days": len(self.store.daily),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "reload_error": self.reload_error,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+        }
+
+    def query(self, target, store=None):
+        parts = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        path = parts.path.rstrip("/")
+        store = store or self.store
+
+        if path == "/top":
+            try:
+                k = int(params.get("k", DEFAULT_K))
+            except ValueError:
+                raise QueryError(400, "k must be an integer")
+            k = max(0, min(k, MAX_K))
+            ascending = params.get("order", "desc") == "asc"
+            metric = params.get("metric", "reviews_count")
+            apps = store.top(metric, k, ascending)
+            return {"metric": metric, "k": k, "apps": apps}
+        if path.startswith("/apps/"):
+            return store.app(unquote(path[len("/apps/"):]))
+        if path == "/daily":
+            rows = store.daily_range(params.get("start"), params.get("end"))
+            return {"days": rows}
+        if path == "/trend":
+            if "app" not in params:
+                raise QueryError(400, "app is required")
+            freq = params.get("freq", "day")
+            series = store.trend(params["app"], freq)
+            return {"app_id": params["app"], "freq": freq, "series": series}
+        raise QueryError(404, f"unknown path {parts.path!r}")
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so a client can reuse one connection for many queries.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, Nagle plus
+    # delayed ACKs stall every keep-alive response by ~40ms.
+    disable_nagle_algorithm = True
+    service = None
+
+    def do_GET(self):
+        status, body = self.service.handle(self.path)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host=HOST, port=PORT, service=None):
+    service = service or KpiService(KpiStore())
+    handler = type("KpiHandler", (Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    server = make_server()
+    host, port = server.server_address[:2]
+    print(f"Serving KPIs from {PROCESSED_DIR} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
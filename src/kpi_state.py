@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Mergeable KPI state, persisted between serve.py runs:
+# - apps:   per-app sums (counts, score sum / sum of squares, low-score and
+#           empty-review counts, thumbs and length totals) plus min/max `at`
+# - thumbs: per-app thumbs-up frequency table, for the exact median
+# - daily:  per-day review count and score sum
+# - app_daily: per-(app, day) review count, scored count and score sum, the
+#           base of the per-app cube (see cube.py)
+# - source: where the folded reviews came from (file, byte offset and a
+#           fingerprint of the bytes just before it)
+#
+# Every part merges by addition (min/max for timestamps), so folding a batch
+# of new reviews costs O(batch), not O(history).
+
+SUM_COLUMNS = [
+    "reviews_count",
+    "score_count",
+    "score_sum",
+    "score_sq_sum",
+    "low_count",
+    "total_thumbs_up",
+    "length_sum",
+    "empty_count",
+]
+APP_DAILY_COLUMNS = ["app_id", "day", "reviews", "score_count", "score_sum"]
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def empty_state():
+    return {
+        "apps": None,
+        "thumbs": None,
+        "daily": None,
+        "app_daily": None,
+        "source": None,
+    }
+
+
+def merge_apps(a, b):
+    if a is None or a.empty:
+        return b
+    if b is None or b.empty:
+        return a
+    index = a.index.union(b.index, sort=False)
+    a = a.reindex(index)
+    b = b.reindex(index)
+    out = pd.DataFrame(index=index)
+    out["app_name"] = a["app_name"].combine_first(b["app_name"])
+    for col in SUM_COLUMNS:
+        out[col] = (a[col].fillna(0) + b[col].fillna(0)).astype("int64")
+    out["first_review_dt"] = pd.concat(
+        [a["first_review_dt"], b["first_review_dt"]], axis=1
+    ).min(axis=1)
+    out["last_review_dt"] = pd.concat(
+        [a["last_review_dt"], b["last_review_dt"]], axis=1
+    ).max(axis=1)
+    return out
+
+
+def merge_counts(a, b):
+    if a is None or a.empty:
+        return b
+    if b is None or b.empty:
+        return a
+    # concat + groupby rather than a.add(b): index alignment tries to sort
+    # the union, which warns on a null app_id mixed with strings.
+    levels = list(range(a.index.nlevels))
+    merged = pd.concat([a, b]).groupby(
+        level=levels, dropna=False, observed=True, sort=False
+    )
+    return merged.sum().astype("int64")
+
+
+def merge_states(a, b):
+    return {
+        "apps": merge_apps(a["apps"], b["apps"]),
+        "thumbs": merge_counts(a["thumbs"], b["thumbs"]),
+        "daily": merge_counts(a["daily"], b["daily"]),
+        "app_daily": merge_counts(a.get("app_daily"), b.get("app_daily")),
+        "source": b.get("source") or a.get("source"),
+    }
+
+
+def median_from_counts(counts):
+    # Same as groupby().quantile(0.5, interpolation="higher"): the value at
+    # sorted position ceil((n - 1) / 2) of each app.
+    df = counts.sort_index().rename("n").reset_index()
+    df.columns = ["app_id", "value", "n"]
+    g = df.groupby("app_id", dropna=False, sort=False, observed=True)["n"]
+    cum = g.cumsum()
+    target = np.ceil((g.transform("sum") - 1) * 0.5)
+    hits = df[cum > target]
+    return hits.groupby("app_id", dropna=False, sort=False, observed=True)[
+        "value"
+    ].first()
+
+
+def app_aggregates(state):
+    agg = state["apps"].copy()
+    agg["median_thumbs_up"] = median_from_counts(state["thumbs"]).reindex(agg.index)
+    return agg
+
+
+def fingerprint(path, offset):
+    with Path(path).open("rb") as f:
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        tail = f.read(offset - max(0, offset - FINGERPRINT_BYTES))
+    return hashlib.sha1(tail).hexdigest()
+
+
+def resume_offset(state, path):
+    # Byte offset in `path` up to which reviews are already folded, or 0 when
+    # the file was rewritten with a different prefix (full rebuild).
+    source = state.get("source")
+    if not source or source["path"] != str(path):
+        return 0
+    size = Path(path).stat().st_size
+    if size < source["offset"]:
+        return 0
+    if fingerprint(path, source["offset"]) != source["fingerprint"]:
+        return 0
+    return source["offset"]
+
+
+def mark_source(state, path):
+    offset = Path(path).stat().st_size
+    state["source"] = {
+        "path": str(path),
+        "offset": offset,
+        "fingerprint": fingerprint(path, offset),
+    }
+
+
+def _key(value):
+    return None if pd.isna(value) else value
+
+
+def _epoch(ts):
+    return None if pd.isna(ts) else int(ts.value // 10**9)
+
+
+def save(state, path):
+    apps = state["apps"]
+    payload = {
+        "source": state["source"],
+        "apps": [],
+        "thumbs": [],
+        "daily": [],
+        "app_daily": [],
+    }
+    if apps is not None:
+        for app_id, row in apps.iterrows():
+            record = {"app_id": _key(app_id), "app_name": _key(row["app_name"])}
+            record.update({col: int(row[col]) for col in SUM_COLUMNS})
+            record["first_at"] = _epoch(row["first_review_dt"])
+            record["last_at"] = _epoch(row["last_review_dt"])
+            payload["apps"].append(record)
+    if state["thumbs"] is not None:
+        payload["thumbs"] = [
+            [_key(app_id), int(value), int(n)]
+            for (app_id, value), n in state["thumbs"].items()
+        ]
+    if state["daily"] is not None:
+        payload["daily"] = [
+            [date, int(row["daily_reviews"]), int(row["score_sum"])]
+            for date, row in state["daily"].iterrows()
+        ]
+    if state.get("app_daily") is not None:
+        payload["app_daily"] = [
+            [_key(app_id), int(day), *(int(v) for v in row)]
+            for (app_id, day), row in zip(
+                state["app_daily"].index, state["app_daily"].to_numpy()
+            )
+        ]
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load(path):
+    path = Path(path)
+    if not path.exists():
+        return empty_state()
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    state = empty_state()
+    state["source"] = payload["source"]
+    if payload["apps"]:
+        apps = pd.DataFrame(payload["apps"]).set_index("app_id")
+        apps["first_review_dt"] = pd.to_datetime(apps.pop("first_at"), unit="s")
+        apps["last_review_dt"] = pd.to_datetime(apps.pop("last_at"), unit="s")
+        state["apps"] = apps
+    if payload["thumbs"]:
+        thumbs = pd.DataFrame(payload["thumbs"], columns=["app_id", "value", "n"])
+        state["thumbs"] = thumbs.set_index(["app_id", "value"])["n"]
+    if payload["daily"]:
+        daily = pd.DataFrame(
+            payload["daily"], columns=["date", "daily_reviews", "score_sum"]
+        )
+        state["daily"] = daily.set_index("date")
+    if payload.get("app_daily"):
+        app_daily = pd.DataFrame(payload["app_daily"], columns=APP_DAILY_COLUMNS)
+        state["app_daily"] = app_daily.set_index(["app_id", "day"])
+    return state
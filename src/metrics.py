@@ -0,0 +1,309 @@
+import bisect
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# Per-stage metrics shared by ingest/transform/serve/dashboard.
+#
+#   with metrics.stage("transform") as m:
+#       with metrics.step("transform_reviews"):
+#           ...
+#       m.rows_in += n
+#
+# On exit the stage writes data/metrics/<stage>.json and/or <stage>.prom
+# (PIPELINE_METRICS=json|prometheus|both|off) with wall time, rows in/out,
+# throughput, peak RSS, per-step timings and latency histograms.
+#
+# Peak RSS is the stage's own: the process RSS is sampled every
+# RSS_SAMPLE_SECONDS while the stage runs (so a shorter spike can be
+# missed, and worker processes are not included). Without /proc to sample
+# from, it falls back to the process-wide peak so far, and peak_rss_scope
+# says "process" instead of "stage".
+# PIPELINE_PROFILE=1 also writes cProfile and tracemalloc output to
+# data/metrics/profile/.
+
+METRICS_DIR = Path("data/metrics")
+PROFILE_DIR = METRICS_DIR / "profile"
+FORMAT = os.environ.get("PIPELINE_METRICS", "json")
+PROFILE = os.environ.get("PIPELINE_PROFILE", "") not in ("", "0")
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+RSS_SAMPLE_SECONDS = 0.05
+
+_current = None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb():
+    # Current RSS, or None where /proc is not available.
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RssSampler:
+    # Tracks the largest RSS seen between start() and stop().
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = rss_mb()
+        self.done = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        rss = rss_mb()
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if self.peak is not None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.done.set()
+            self.thread.join()
+            self.sample()
+        return self.peak
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation.
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + [self.max], self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = 0
+        self.rows_out = 0
+        self.steps = {}
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.started = None
+        self.seconds = None
+        self.peak_rss = None
+
+    def add_step(self, name, seconds):
+        with self.lock:
+            self.steps[name] = self.steps.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def to_dict(self):
+        seconds = self.seconds or 0.0
+        peak, scope = self.peak_rss, "stage"
+        if peak is None:
+            peak, scope = peak_rss_mb(), "process"
+        return {
+            "stage": self.name,
+            "seconds": round(seconds, 6),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_sec": round(self.rows_in / seconds, 1) if seconds else None,
+            "peak_rss_mb": round(peak, 1) if peak is not None else None,
+            "peak_rss_scope": scope,
+            "steps": {k: round(v, 6) for k, v in self.steps.items()},
+            "counters": dict(self.counters),
+            "histograms": [
+                {"name": name, "labels": dict(labels), **hist.to_dict()}
+                for (name, labels), hist in self.histograms.items()
+            ],
+        }
+
+    def to_prometheus(self):
+        data = self.to_dict()
+        stage = f'stage="{self.name}"'
+        lines = []
+        for key in ("seconds", "rows_in", "rows_out", "rows_per_sec", "peak_rss_mb"):
+            if data[key] is None:
+                continue
+            labels = stage
+            if key == "peak_rss_mb":
+                labels += f',scope="{data["peak_rss_scope"]}"'
+            lines.append(f"# TYPE pipeline_stage_{key} gauge")
+            lines.append(f"pipeline_stage_{key}{{{labels}}} {data[key]}")
+        if self.steps:
+            lines.append("# TYPE pipeline_step_seconds gauge")
+            for step, seconds in data["steps"].items():
+                lines.append(f'pipeline_step_seconds{{{stage},step="{step}"}} {seconds}')
+        if self.counters:
+            lines.append("# TYPE pipeline_count counter")
+            for name, value in self.counters.items():
+                lines.append(f'pipeline_count{{{stage},name="{name}"}} {value}')
+        # One TYPE line per histogram name, followed by all of its label sets.
+        typed = set()
+        for (name, labels), hist in sorted(self.histograms.items()):
+            label_text = ",".join([stage] + [f'{k}="{v}"' for k, v in labels])
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE pipeline_{name} histogram")
+            cumulative = 0
+            for bound, n in zip([str(b) for b in hist.buckets] + ["+Inf"], hist.counts):
+                cumulative += n
+                lines.append(
+                    f'pipeline_{name}_bucket{{{label_text},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"pipeline_{name}_sum{{{label_text}}} {hist.sum}")
+            lines.append(f"pipeline_{name}_count{{{label_text}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        if FORMAT == "off":
+            return
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        if FORMAT in ("json", "both"):
+            (METRICS_DIR / f"{self.name}.json").write_text(
+                json.dumps(self.to_dict(), indent=2), encoding="utf-8"
+            )
+        if FORMAT in ("prometheus", "both"):
+            (METRICS_DIR / f"{self.name}.prom").write_text(
+                self.to_prometheus(), encoding="utf-8"
+            )
+
+    def summary(self):
+        data = self.to_dict()
+        parts = [f"{data['seconds']:.2f}s", f"{self.rows_in} rows in", f"{self.rows_out} rows out"]
+        if data["rows_per_sec"]:
+            parts.append(f"{data['rows_per_sec']:.0f} rows/s")
+        if data["peak_rss_mb"] is not None:
+            scope = "" if data["peak_rss_scope"] == "stage" else " (process)"
+            parts.append(f"peak RSS {data['peak_rss_mb']:.1f} MB{scope}")
+        return f"[{self.name}] " + ", ".join(parts)
+
+
+def _write_profile(name, profiler, snapshot):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(PROFILE_DIR / f"{name}.prof")
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+    (PROFILE_DIR / f"{name}.cprofile.txt").write_text(text.getvalue(), encoding="utf-8")
+    top = snapshot.statistics("lineno")[:40]
+    (PROFILE_DIR / f"{name}.tracemalloc.txt").write_text(
+        "\n".join(str(stat) for stat in top) + "\n", encoding="utf-8"
+    )
+
+
+@contextmanager
+def stage(name):
+    global _current
+    current = Stage(name)
+    previous, _current = _current, current
+    profiler = None
+    if PROFILE:
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+    sampler = RssSampler().start()
+    current.started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - current.started
+        current.peak_rss = sampler.stop()
+        if profiler is not None:
+            profiler.disable()
+            _write_profile(name, profiler, tracemalloc.take_snapshot())
+            tracemalloc.stop()
+        _current = previous
+        current.write()
+        print(current.summary())
+
+
+@contextmanager
+def step(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _current is not None:
+            _current.add_step(name, time.perf_counter() - started)
+
+
+def count(name, n=1):
+    if _current is not None:
+        _current.count(name, n)
+
+
+def observe(name, value, **labels):
+    if _current is not None:
+        _current.observe(name, value, **labels)
+
+
+def timed_call(name, fn, *args, **kwargs):
+    # Calls fn and records its latency (also for failures) in histogram `name`.
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        observe(name, time.perf_counter() - started, call=fn.__name__)
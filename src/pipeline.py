@@ -0,0 +1,416 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+# Runs the pipeline as a DAG of stages with declared inputs and outputs.
+# A stage is skipped when the content hashes of its code and inputs match
+# the last successful run, all of its outputs still exist and none of its
+# outputs changed since. Stages run one at a time in dependency order,
+# each in its own process: every stage reads what the one before it wrote
+# (serve joins sentiment's scores, the dashboard plots both), so none could
+# run alongside another.
+
+SRC_DIR = Path(__file__).resolve().parent
+RAW_DIR = Path("data/raw")
+PROCESSED_DIR = Path("data/processed")
+STATE_PATH = Path("data/pipeline_state.json")
+
+# Tweak these as needed
+HASH_CHUNK = 1024 * 1024
+
+
+class Stage:
+    def __init__(
+        self,
+        name,
+        code,
+        inputs=(),
+        outputs=(),
+        optional=(),
+        deps=(),
+        source=False,
+        one_of=(),
+    ):
+        self.name = name
+        self.code = [SRC_DIR / c for c in code]
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        # Outputs that only some settings produce: not required to exist,
+        # but a run is redone if they changed since.
+        self.optional = [Path(p) for p in optional]
+        # Alternative outputs, of which at least one must exist.
+        self.one_of = [Path(p) for p in one_of]
+        self.deps = list(deps)
+        # Source stages read from outside the pipeline (the Play Store), so
+        # their inputs can't be hashed; they only run when asked to or when
+        # their outputs are missing.
+        self.source = source
+
+    def script(self):
+        return self.code[0]
+
+    def all_outputs(self):
+        return self.outputs + self.one_of + self.optional
+
+
+# Inputs that don't exist are hashed as absent, so alternatives such as
+# reviews.csv / reviews_parts / reviews_columnar can all be listed. A stage's
+# state files (inputs it also writes) are only checked as outputs.
+STAGES = [
+    Stage(
+        "ingest",
+        code=[
+            "ingest.py", "checkpoints.py", "dedup.py", "rawlog.py", "responsecache.py",
+            "metrics.py",
+        ],
+        outputs=[RAW_DIR / "apps.jsonl"],
+        # reviews.jsonl: written by older runs (or bench/generate.py), and
+        # still read by transform when there is no log.
+        one_of=[RAW_DIR / "reviews_log", RAW_DIR / "reviews.jsonl"],
+        source=True,
+    ),
+    Stage(
+        "transform",
+        code=[
+            "transform.py", "colstore.py", "dedup.py", "rawlog.py", "textindex.py",
+            "schema.py", "metrics.py",
+        ],
+        inputs=[
+            RAW_DIR / "apps.jsonl",
+            RAW_DIR / "reviews_log",
+            RAW_DIR / "reviews.jsonl",
+        ],
+        outputs=[PROCESSED_DIR / "apps.csv"],
+        optional=[
+            PROCESSED_DIR / "reviews.csv",
+            PROCESSED_DIR / "reviews_parts",
+            PROCESSED_DIR / "reviews_columnar",
+            PROCESSED_DIR / "review_index",
+            PROCESSED_DIR / "quarantine",
+        ],
+        deps=["ingest"],
+    ),
+    Stage(
+        "sentiment",
+        code=["sentiment.py", "colstore.py", "metrics.py"],
+        inputs=[
+            PROCESSED_DIR / "reviews.csv",
+            PROCESSED_DIR / "reviews_parts",
+            PROCESSED_DIR / "reviews_columnar",
+        ],
+        outputs=[
+            PROCESSED_DIR / "app_sentiment.csv",
+            PROCESSED_DIR / "complaint_terms.csv",
+        ],
+        deps=["transform"],
+    ),
+    Stage(
+        "serve",
+        code=[
+            "serve.py", "colstore.py", "kpi_state.py", "cube.py", "sketches.py",
+            "anomaly.py", "metrics.py",
+        ],
+        inputs=[
+            PROCESSED_DIR / "apps.csv",
+            PROCESSED_DIR / "reviews.csv",
+            PROCESSED_DIR / "reviews_parts",
+            PROCESSED_DIR / "reviews_columnar",
+            PROCESSED_DIR / "app_sentiment.csv",
+            PROCESSED_DIR / "kpi_state.json",
+            PROCESSED_DIR / "anomaly_state.json",
+        ],
+        outputs=[
+            PROCESSED_DIR / "app_kpis.csv",
+            PROCESSED_DIR / "daily_kpis.csv",
+            PROCESSED_DIR / "kpi_cube.npz",
+            PROCESSED_DIR / "alerts.csv",
+        ],
+        optional=[
+            PROCESSED_DIR / "app_sketch_kpis.csv",
+            PROCESSED_DIR / "daily_sketch_kpis.csv",
+            PROCESSED_DIR / "kpi_state.json",
+            PROCESSED_DIR / "anomaly_state.json",
+        ],
+        deps=["transform", "sentiment"],
+    ),
+    Stage(
+        "dashboard",
+        code=["dashboard.py", "cube.py", "metrics.py"],
+        inputs=[
+            PROCESSED_DIR / "app_kpis.csv",
+            PROCESSED_DIR / "daily_kpis.csv",
+            PROCESSED_DIR / "kpi_cube.npz",
+            PROCESSED_DIR / "complaint_terms.csv",
+            PROCESSED_DIR / "alerts.csv",
+        ],
+        outputs=[PROCESSED_DIR / "dashboard.png"],
+        deps=["serve"],
+    ),
+]
+
+
+def load_state(path=STATE_PATH):
+    if not path.exists():
+        return {"stages": {}, "files": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_state(state, path=STATE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def file_digest(path, memo):
+    # Content hash of one file; the (size, mtime) memo avoids re-reading
+    # large unchanged inputs on every run.
+    st = path.stat()
+    key = str(path)
+    cached = memo.get(key)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    memo[key] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+
+def path_digest(path, memo):
+    if path.is_dir():
+        h = hashlib.sha256()
+        for child in sorted(p for p in path.rglob("*") if p.is_file()):
+            h.update(str(child.relative_to(path)).encode("utf-8"))
+            h.update(file_digest(child, memo).encode("ascii"))
+        return "dir:" + h.hexdigest()
+    if path.exists():
+        return file_digest(path, memo)
+    return "missing"
+
+
+def stage_key(stage, memo):
+    own = set(stage.all_outputs())
+    h = hashlib.sha256()
+    for path in stage.code + [p for p in stage.inputs if p not in own]:
+        h.update(str(path).encode("utf-8"))
+        h.update(path_digest(path, memo).encode("ascii"))
+    return h.hexdigest()
+
+
+def output_digests(stage, memo):
+    return {str(p): path_digest(p, memo) for p in stage.all_outputs()}
+
+
+def outputs_exist(stage):
+    if stage.one_of and not any(p.exists() for p in stage.one_of):
+        return False
+    return all(p.exists() for p in stage.outputs)
+
+
+def run_stage(stage):
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, str(stage.script())])
+    return proc.returncode, time.perf_counter() - started
+
+
+def select_stages(names):
+    by_name = {s.name: s for s in STAGES}
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise SystemExit(f"Unknown stage(s): {', '.join(unknown)}")
+    return [by_name[n] for n in names]
+
+
+def plan(stage, state, memo, force=(), refresh=False):
+    # Called as each stage becomes ready, so the key reflects the outputs of
+    # upstream stages that just finished. Returns (run?, key).
+    if stage.source:
+        return stage.name in force or refresh or not outputs_exist(stage), None
+    key = stage_key(stage, memo)
+    previous = state["stages"].get(stage.name, {})
+    up_to_date = (
+        key == previous.get("key")
+        and outputs_exist(stage)
+        and output_digests(stage, memo) == previous.get("outputs")
+    )
+    return stage.name in force or not up_to_date, key
+
+
+def dependency_order(stages):
+    # `stages` in an order where every stage comes after its (selected)
+    # dependencies, otherwise keeping the given order.
+    names = {s.name for s in stages}
+    ordered = []
+    placed = set()
+    while len(ordered) < len(stages):
+        for stage in stages:
+            if stage.name not in placed and all(
+                d in placed or d not in names for d in stage.deps
+            ):
+                ordered.append(stage)
+                placed.add(stage.name)
+                break
+        else:
+            raise SystemExit("Stage dependencies form a cycle")
+    return ordered
+
+
+def run_pipeline(stages, force=(), refresh=False, dry_run=False):
+    state = load_state()
+    memo = state.setdefault("files", {})
+    failed = set()
+    ran, skipped = [], []
+
+    for stage in dependency_order(stages):
+        if any(d in failed for d in stage.deps):
+            print(f"[{stage.name}] not run: upstream failed")
+            failed.add(stage.name)
+            continue
+        needed, key = plan(stage, state, memo, force, refresh)
+        if not needed:
+            print(f"[{stage.name}] up to date, skipped")
+            skipped.append(stage.name)
+            continue
+        if dry_run:
+            print(f"[{stage.name}] would run")
+            ran.append(stage.name)
+            continue
+        print(f"[{stage.name}] running")
+        code, seconds = run_stage(stage)
+        if code != 0:
+            print(f"[{stage.name}] failed with exit code {code}")
+            state["stages"].pop(stage.name, None)
+            failed.add(stage.name)
+            save_state(state)
+            continue
+        print(f"[{stage.name}] done in {seconds:.2f}s")
+        ran.append(stage.name)
+        if not stage.source:
+            # Keyed on the inputs as they were when the stage started.
+            state["stages"][stage.name] = {
+                "key": key,
+                "outputs": output_digests(stage, memo),
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+        save_state(state)
+
+    if not dry_run:
+        save_state(state)
+    return ran, skipped, sorted(failed)
+
+
+def run_in_process(write_csv=True):
+    # transform -> sentiment -> serve -> dashboard in one process: typed review
+    # columns and KPI frames are handed over directly instead of through
+    # reviews.csv and app_kpis.csv. The KPI CSVs and (unless write_csv is off)
+    # reviews.csv are still written as side outputs. Sentiment needs review
+    # text, so it reads the reviews written to disk; without them it is
+    # skipped and the KPIs get no sentiment. Outputs this mode doesn't
+    # produce (sketch KPIs, incremental KPI state, skipped sentiment) are
+    # removed rather than left over from an earlier run.
+    sys.path.insert(0, str(SRC_DIR))
+    import dashboard
+    import metrics
+    import sentiment
+    import serve
+    import transform
+
+    with metrics.stage("transform") as m:
+        table, app_names, written, dropped = transform.transform_to_table(
+            serve.KPI_COLUMNS, write_csv
+        )
+        m.rows_in = written + dropped
+        m.rows_out = written
+    sentiment_in = sentiment.SENTIMENT_OUT
+    if sentiment.has_input():
+        sentiment.main()
+    else:
+        print("No reviews on disk to score; skipping sentiment")
+        sentiment_in = None
+        for path in (sentiment.SENTIMENT_OUT, sentiment.COMPLAINTS_OUT):
+            path.unlink(missing_ok=True)
+    # Not computed here: the sketches need userName, which isn't kept.
+    serve.remove_sketch_kpis()
+    serve.KPI_STATE.unlink(missing_ok=True)
+    with metrics.stage("serve") as m:
+        with metrics.step("reviews_from_table"):
+            df = serve.reviews_from_table(table)
+        del table
+        m.rows_in = len(df)
+        with metrics.step("compute_app_kpis"):
+            app_kpis = serve.compute_app_kpis(df, app_names)
+        with metrics.step("compute_daily_kpis"):
+            daily_kpis = serve.compute_daily_kpis(df)
+        with metrics.step("aggregate_app_daily"):
+            app_daily = serve.aggregate_app_daily(df)
+        del df
+        app_kpis = serve.add_sentiment(app_kpis, sentiment_in)
+        with metrics.step("write"):
+            kpi_cube = serve.write_kpis(app_kpis, daily_kpis, app_daily)
+        if serve.ALERTS:
+            with metrics.step("update_alerts"):
+                m.count("alerts", len(serve.update_alerts(kpi_cube, app_kpis)))
+        m.rows_out = len(app_kpis) + len(daily_kpis)
+    with metrics.stage("dashboard") as m:
+        app_rows = dashboard.rows_from_frame(app_kpis, dashboard.APP_KPI_FIELDS)
+        daily_rows = dashboard.rows_from_frame(daily_kpis, dashboard.DAILY_KPI_FIELDS)
+        m.rows_in = len(app_rows) + len(daily_rows)
+        drawn = dashboard.render(
+            app_rows, daily_rows, kpi_cube, dashboard.load_complaints(),
+            dashboard.load_alerts(),
+        )
+        m.count("panels_drawn", len(drawn))
+        m.rows_out = 1
+    print(f"Wrote {serve.APP_KPI_OUT}, {serve.DAILY_KPI_OUT} and {dashboard.OUT_IMG}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the pipeline, skipping up-to-date stages."
+    )
+    parser.add_argument("stages", nargs="*", help="stages to consider (default: all)")
+    parser.add_argument(
+        "--force", action="append", default=[], metavar="STAGE",
+        help="re-run STAGE even if it is up to date (repeatable, or 'all')",
+    )
+    parser.add_argument(
+        "--refresh", action="store_true",
+        help="re-run ingest to fetch new data from the Play Store",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only print the plan")
+    parser.add_argument(
+        "--in-process", action="store_true",
+        help="run transform, sentiment, serve and dashboard in one process, passing data "
+        "in memory (no caching)",
+    )
+    parser.add_argument(
+        "--no-csv", action="store_true",
+        help="with --in-process, don't write reviews.csv",
+    )
+    args = parser.parse_args()
+
+    if args.in_process:
+        run_in_process(write_csv=not args.no_csv)
+        return
+
+    stages = select_stages(args.stages) if args.stages else STAGES
+    force = {s.name for s in STAGES} if "all" in args.force else set(args.force)
+    select_stages(force)
+    ran, skipped, failed = run_pipeline(stages, force, args.refresh, args.dry_run)
+    print(f"Ran {len(ran)} stage(s), skipped {len(skipped)}")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import gzip
+import json
+import os
+import shutil
+from itertools import groupby
+from pathlib import Path
+
+
+# Segmented raw review log:
+#
+#   <root>/segment-000000.jsonl.gz   gzip segments, rotated at SEGMENT_BYTES
+#   <root>/index.jsonl               one line per block, in write order
+#
+# Every append writes each run of same-app rows as one block: an independent
+# gzip member (so a segment is still a valid .jsonl.gz file) that can be
+# read on its own by seeking to its offset. The index records, per block,
+# its segment, byte offset and length, uncompressed size, row count, appId
+# and the min/max review `at`, so readers go straight to the blocks of the
+# apps or time range they want.
+#
+# A block is appended to its segment before its index line is written; on
+# open, bytes past the last indexed block (an interrupted append) are cut.
+
+INDEX_NAME = "index.jsonl"
+
+# Tweak these as needed
+SEGMENT_BYTES = 64 * 1024 * 1024
+COMPRESS_LEVEL = 6
+# Rows per block when importing an existing reviews.jsonl.
+IMPORT_BLOCK_ROWS = 1000
+
+
+def exists(root):
+    return (Path(root) / INDEX_NAME).exists()
+
+
+def segment_name(number):
+    return f"segment-{number:06d}.jsonl.gz"
+
+
+def read_index(root):
+    # Returns the index entries and the byte length of the intact prefix.
+    path = Path(root) / INDEX_NAME
+    entries = []
+    valid = 0
+    if not path.exists():
+        return entries, valid
+    with path.open("rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+            valid += len(line)
+    return entries, valid
+
+
+def row_time(row):
+    at = row.get("at")
+    return None if at in (None, "") else str(at)
+
+
+def in_range(at, start=None, end=None):
+    # `start` inclusive, `end` exclusive, compared as "YYYY-MM-DD HH:MM:SS"
+    # strings, so "2025-03" or "2025-03-01" work as bounds too.
+    if start is None and end is None:
+        return True
+    if at is None:
+        return False
+    return (start is None or at >= start) and (end is None or at < end)
+
+
+def select_blocks(entries, app_ids=None, start=None, end=None):
+    if app_ids is not None:
+        app_ids = set(app_ids)
+    selected = []
+    for entry in entries:
+        if app_ids is not None and entry["app"] not in app_ids:
+            continue
+        if start is not None or end is not None:
+            if entry["min_at"] is None:
+                continue
+            if end is not None and entry["min_at"] >= end:
+                continue
+            if start is not None and entry["max_at"] < start:
+                continue
+        selected.append(entry)
+    return selected
+
+
+def decode_lines(lines):
+    # JSON lines -> objects, with one json.loads for all of them; falls back
+    # to one call per line (and its error) when the batch doesn't parse.
+    lines = [line for line in lines if line.strip()]
+    try:
+        rows = json.loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        rows = None
+    if rows is None or len(rows) != len(lines):
+        rows = [json.loads(line) for line in lines]
+    return rows
+
+
+def read_blocks(root, blocks, start=None, end=None):
+    # Yields the rows of `blocks` (index entries) in order, optionally
+    # limited to reviews with start <= at < end.
+    root = Path(root)
+    f = None
+    current = None
+    try:
+        for entry in blocks:
+            if entry["segment"] != current:
+                if f is not None:
+                    f.close()
+                current = entry["segment"]
+                f = (root / segment_name(current)).open("rb")
+            f.seek(entry["offset"])
+            data = gzip.decompress(f.read(entry["length"]))
+            for row in decode_lines(data.splitlines()):
+                if in_range(row_time(row), start, end):
+                    yield row
+    finally:
+        if f is not None:
+            f.close()
+
+
+class RawLog:
+    def __init__(self, root, segment_bytes=SEGMENT_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.entries, valid = read_index(self.root)
+        self.index = (self.root / INDEX_NAME).open("ab")
+        self.index.truncate(valid)
+        self.pending = []
+        self.segment = None
+        self.f = None
+        self.recover()
+
+    @classmethod
+    def reset(cls, root):
+        root = Path(root)
+        if root.exists():
+            shutil.rmtree(root)
+
+    def recover(self):
+        # Drops bytes and segments that were written but never indexed.
+        if self.entries:
+            last = self.entries[-1]
+            number, end = last["segment"], last["offset"] + last["length"]
+        else:
+            number, end = 0, 0
+        for path in self.root.glob("segment-*.jsonl.gz"):
+            if int(path.name[8:14]) > number:
+                path.unlink()
+        self.open_segment(number)
+        if self.f.tell() > end:
+            self.f.truncate(end)
+            self.f.seek(end)
+
+    def open_segment(self, number):
+        if self.f is not None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.f.close()
+        self.segment = number
+        self.f = (self.root / segment_name(number)).open("ab")
+
+    def append(self, rows):
+        # Writes `rows` (review dicts with "appId"), one block per run of
+        # consecutive rows of the same app. Returns the number of rows.
+        written = 0
+        for app_id, group in groupby(rows, key=lambda r: r.get("appId")):
+            written += self.write_block(app_id, list(group))
+        if written:
+            self.flush()
+        return written
+
+    def write_block(self, app_id, rows):
+        # Non-JSON types (e.g. datetime) are stored as strings, as before.
+        raw = "".join(
+            json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows
+        ).encode("utf-8")
+        data = gzip.compress(raw, compresslevel=COMPRESS_LEVEL, mtime=0)
+        offset = self.f.tell()
+        if offset and offset + len(data) > self.segment_bytes:
+            self.open_segment(self.segment + 1)
+            offset = 0
+        self.f.write(data)
+        times = [t for t in map(row_time, rows) if t is not None]
+        entry = {
+            "segment": self.segment,
+            "offset": offset,
+            "length": len(data),
+            "raw_bytes": len(raw),
+            "rows": len(rows),
+            "app": app_id,
+            "min_at": min(times) if times else None,
+            "max_at": max(times) if times else None,
+        }
+        self.entries.append(entry)
+        self.pending.append(entry)
+        return len(rows)
+
+    def flush(self):
+        # Segment data reaches the disk before the index lines that point
+        # at it.
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        for entry in self.pending:
+            self.index.write((json.dumps(entry) + "\n").encode("utf-8"))
+        self.pending = []
+        self.index.flush()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def disk_bytes(root):
+    return sum(p.stat().st_size for p in Path(root).iterdir() if p.is_file())
+
+
+def read(root, app_ids=None, start=None, end=None):
+    entries, _ = read_index(root)
+    blocks = select_blocks(entries, app_ids, start, end)
+    yield from read_blocks(root, blocks, start, end)
+
+
+def import_jsonl(src, root, block_rows=IMPORT_BLOCK_ROWS):
+    # Converts a plain reviews.jsonl into a (new) log at `root`.
+    RawLog.reset(root)
+    rows = 0
+    with RawLog(root) as log, Path(src).open(encoding="utf-8") as f:
+        batch = []
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            batch.append(json.loads(line))
+            if len(batch) >= block_rows:
+                rows += log.append(batch)
+                batch = []
+        rows += log.append(batch)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segmented raw review log")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="convert a reviews.jsonl into a log")
+    imp.add_argument("src", nargs="?", default="data/raw/reviews.jsonl")
+    imp.add_argument("root", nargs="?", default="data/raw/reviews_log")
+    stats = sub.add_parser("stats", help="apps, rows and sizes of a log")
+    stats.add_argument("root", nargs="?", default="data/raw/reviews_log")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        rows = import_jsonl(args.src, args.root)
+        src_mb = Path(args.src).stat().st_size / 1e6
+        log_mb = disk_bytes(args.root) / 1e6
+        print(f"Imported {rows} reviews into {args.root}")
+        print(f"{src_mb:.1f} MB -> {log_mb:.1f} MB ({src_mb / max(log_mb, 1e-9):.1f}x)")
+    else:
+        entries, _ = read_index(args.root)
+        raw_mb = sum(e["raw_bytes"] for e in entries) / 1e6
+        log_mb = disk_bytes(args.root) / 1e6
+        segments = len({e["segment"] for e in entries})
+        print(
+            f"{len({e['app'] for e in entries})} apps, "
+            f"{sum(e['rows'] for e in entries)} reviews, {len(entries)} blocks "
+            f"in {segments} segments; {raw_mb:.1f} MB raw, {log_mb:.1f} MB on disk"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from checkpoints import token_from_state, token_to_state
+import metrics
+
+
+# On-disk cache of scraper responses (search results, app metadata, review
+# pages) in one SQLite file. Each response is stored as zlib-compressed JSON
+# under (kind, key), with the time it was fetched and an optional change
+# signal. Datetimes and continuation tokens are tagged so they come back as
+# the same types.
+#
+# fetch() reuses a response while it is younger than the caller's TTL and
+# its signal matches; in replay mode every recorded response is used as is
+# and anything else raises CacheMiss instead of going to the network.
+
+COMPRESS_LEVEL = 6
+
+
+class CacheMiss(LookupError):
+    pass
+
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if hasattr(value, "token") and hasattr(value, "__dict__"):
+        return {"__token__": token_to_state(value)}
+    return str(value)
+
+
+def decode_object(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__token__" in obj:
+        return token_from_state(obj["__token__"])
+    return obj
+
+
+def dumps(value):
+    raw = json.dumps(value, ensure_ascii=False, default=encode_value)
+    return zlib.compress(raw.encode("utf-8"), COMPRESS_LEVEL)
+
+
+def loads(body):
+    return json.loads(zlib.decompress(body), object_hook=decode_object)
+
+
+class ResponseCache:
+    def __init__(self, path, replay=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.replay = replay
+        # Shared by the concurrent ingest threads.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (kind TEXT, key TEXT, "
+            "fetched_at REAL, signal TEXT, body BLOB, PRIMARY KEY (kind, key)) "
+            "WITHOUT ROWID"
+        )
+        self.outcomes = {}
+
+    @classmethod
+    def reset(cls, path):
+        path = Path(path)
+        for suffix in ("", "-wal", "-shm"):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+    def get(self, kind, key):
+        # -> (value, fetched_at, signal), or None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT fetched_at, signal, body FROM responses "
+                "WHERE kind = ? AND key = ?",
+                (kind, json.dumps(key)),
+            ).fetchone()
+        if row is None:
+            return None
+        fetched_at, signal, body = row
+        return loads(body), fetched_at, None if signal is None else json.loads(signal)
+
+    def put(self, kind, key, value, signal=None):
+        body = dumps(value)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (
+                    kind,
+                    json.dumps(key),
+                    time.time(),
+                    None if signal is None else json.dumps(signal, sort_keys=True),
+                    body,
+                ),
+            )
+            self.db.commit()
+
+    def record(self, kind, outcome):
+        metrics.count(f"response_cache_{outcome}")
+        with self.lock:
+            counts = self.outcomes.setdefault(kind, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def fetch(self, kind, key, fn, ttl=None, signal=None):
+        # Returns fn()'s response, from the cache if the stored one is younger
+        # than `ttl` seconds (None: no expiry) and was fetched under the same
+        # `signal` (None: not checked).
+        entry = self.get(kind, key)
+        if entry is not None:
+            value, fetched_at, stored_signal = entry
+            fresh = ttl is None or time.time() - fetched_at < ttl
+            same = signal is None or signal == stored_signal
+            if self.replay or (fresh and same):
+                self.record(kind, "hit")
+                return value
+            outcome = "expired" if same else "changed"
+        elif self.replay:
+            self.record(kind, "missing")
+            raise CacheMiss(f"{kind} {key} is not in {self.path}")
+        else:
+            outcome = "miss"
+        value = fn()
+        self.put(kind, key, value, signal)
+        self.record(kind, outcome)
+        return value
+
+    def summary(self):
+        parts = []
+        for kind, counts in sorted(self.outcomes.items()):
+            detail = ", ".join(f"{n} {name}" for name, n in sorted(counts.items()))
+            parts.append(f"{kind}: {detail}")
+        return "; ".join(parts) or "no calls"
+
+    def close(self):
+        with self.lock:
+            self.db.close()
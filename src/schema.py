@@ -0,0 +1,235 @@
+import json
+import warnings
+from collections import Counter
+from itertools import repeat
+from pathlib import Path
+
+import numpy as np
+
+
+# Declarative record schemas compiled into batch decoders. A schema maps
+# output columns to Fields; Decoder(schema).decode(objs) pulls each field out
+# of a batch of raw JSON objects as one column and parses the whole column at
+# once. Values that already have the right type are passed through as they
+# are, and only the others are parsed one by one. Timestamps are parsed by
+# numpy; a batch it can't parse is split in halves until the bad values are
+# found.
+#
+# A row with a missing required field, or with a value present but not
+# parsable or out of range, is rejected with a reason ("<column>: <problem>")
+# instead of being kept with None in its place. Missing optional values
+# (null, absent or "") are None.
+#
+#   str        strings; numbers are turned into strings
+#   int        integers, integral floats and integer strings ("1,024")
+#   count      like int, also with a trailing "+" ("1,000,000+")
+#   float      numbers and numeric strings
+#   timestamp  ISO 8601 strings, as "%Y-%m-%d %H:%M:%S" (converted to UTC
+#              when they carry an offset)
+
+NONE = type(None)
+
+
+class Field:
+    def __init__(self, kind, source=None, required=False, min=None, max=None):
+        if kind not in DECODERS:
+            raise ValueError(f"unknown field kind: {kind}")
+        self.kind = kind
+        # Key in the raw object; defaults to the column name.
+        self.source = source
+        self.required = required
+        self.min = min
+        self.max = max
+
+
+def other_types(values, types):
+    # Indices of the values whose type is not in `types`.
+    if set(map(type, values)) <= types:
+        return []
+    return [i for i, t in enumerate(map(type, values)) if t not in types]
+
+
+def decode_str(values):
+    odd = other_types(values, {str, NONE})
+    if not odd:
+        return values, []
+    out, bad = list(values), []
+    for i in odd:
+        v = out[i]
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[i] = str(v)
+        else:
+            out[i] = None
+            bad.append((i, "not a string"))
+    return out, bad
+
+
+def to_number(value, kind):
+    # One value of an int/count/float field; raises ValueError when invalid.
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, str):
+        text = value.replace(",", "").strip()
+        if kind == "count" and text.endswith("+"):
+            text = text[:-1]
+        if not text:
+            return None
+        value = float(text) if kind == "float" else int(text)
+    elif not isinstance(value, (int, float)):
+        raise ValueError(value)
+    if kind == "float":
+        value = float(value)
+        if not np.isfinite(value):
+            raise ValueError(value)
+        return value
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    return value
+
+
+def non_finite(values):
+    # Indices of the NaN and infinite floats; None is not one of them.
+    x = np.array(values, dtype=np.float64)
+    return [i for i in np.flatnonzero(~np.isfinite(x)).tolist() if values[i] is not None]
+
+
+def decode_numbers(values, kind):
+    odd = other_types(values, {float, NONE} if kind == "float" else {int, NONE})
+    problem = "not a number" if kind == "float" else "not an integer"
+    out, bad = values, []
+    if odd:
+        out = list(values)
+        for i in odd:
+            try:
+                out[i] = to_number(out[i], kind)
+            except (ValueError, OverflowError):
+                out[i] = None
+                bad.append((i, problem))
+    if kind == "float":
+        # Values that were floats already can still be NaN or infinite.
+        nan = non_finite(out)
+        if nan:
+            if out is values:
+                out = list(values)
+            for i in nan:
+                out[i] = None
+                bad.append((i, problem))
+    return out, bad
+
+
+def format_timestamps(parsed):
+    # datetime64[s] -> "%Y-%m-%d %H:%M:%S" strings, NaT -> None.
+    return [
+        None if s == "NaT" else s[:10] + " " + s[11:]
+        for s in np.datetime_as_string(parsed, unit="s").tolist()
+    ]
+
+
+def parse_timestamps(values):
+    with warnings.catch_warnings():
+        # numpy warns that it converts offsets to UTC, which is what we want.
+        warnings.simplefilter("ignore", UserWarning)
+        warnings.simplefilter("ignore", DeprecationWarning)
+        return np.array(values, dtype="datetime64[s]")
+
+
+def parse_or_split(values, start, out, bad):
+    # Parses values into out[start:]; a slice numpy rejects is split in
+    # halves until the bad values are single.
+    try:
+        out[start : start + len(values)] = format_timestamps(parse_timestamps(values))
+    except ValueError:
+        if len(values) == 1:
+            bad.append((start, "not a timestamp"))
+            return
+        half = len(values) // 2
+        parse_or_split(values[:half], start, out, bad)
+        parse_or_split(values[half:], start + half, out, bad)
+
+
+def decode_timestamp(values):
+    odd = set(other_types(values, {str, NONE}))
+    bad = [(i, "not a timestamp") for i in sorted(odd)]
+    if odd:
+        values = [None if i in odd else v for i, v in enumerate(values)]
+    out = [None] * len(values)
+    parse_or_split(values, 0, out, bad)
+    return out, bad
+
+
+DECODERS = {
+    "str": decode_str,
+    "int": lambda values: decode_numbers(values, "int"),
+    "count": lambda values: decode_numbers(values, "count"),
+    "float": lambda values: decode_numbers(values, "float"),
+    "timestamp": decode_timestamp,
+}
+
+
+def out_of_range(values, low, high):
+    x = np.array(values, dtype=np.float64)  # None -> nan, never out of range
+    outside = np.zeros(len(x), dtype=bool)
+    if low is not None:
+        outside |= x < low
+    if high is not None:
+        outside |= x > high
+    return np.flatnonzero(outside).tolist()
+
+
+class Decoder:
+    def __init__(self, schema):
+        self.columns = list(schema)
+        self.fields = [
+            (name, field.source or name, DECODERS[field.kind], field)
+            for name, field in schema.items()
+        ]
+
+    def decode(self, objs):
+        # -> (rows, rejects): the valid objects as dicts of the schema's
+        # columns, in order, and (obj, reason) for each rejected one, with
+        # the reason of its first failing column.
+        reasons = dict.fromkeys(other_types(objs, {dict}), "not an object")
+        sources = [{} if i in reasons else obj for i, obj in enumerate(objs)] if reasons else objs
+        columns = []
+        for name, source, decode, field in self.fields:
+            values, bad = decode(list(map(dict.get, sources, repeat(source))))
+            if field.required and (None in values or "" in values):
+                bad += [(i, "missing") for i, v in enumerate(values) if v is None or v == ""]
+            if field.min is not None or field.max is not None:
+                bad += [(i, "out of range") for i in out_of_range(values, field.min, field.max)]
+            for i, problem in bad:
+                reasons.setdefault(i, f"{name}: {problem}")
+            columns.append(values)
+        rows = [dict(zip(self.columns, values)) for values in zip(*columns)]
+        if not reasons:
+            return rows, []
+        rejects = [(objs[i], reasons[i]) for i in sorted(reasons)]
+        return [row for i, row in enumerate(rows) if i not in reasons], rejects
+
+
+class Quarantine:
+    # Rejected rows as JSON lines {"reason", "row"} in `path`, counted by
+    # reason. The file is only created once a row is rejected.
+    def __init__(self, path):
+        self.path = Path(path)
+        self.counts = Counter()
+        self.f = None
+
+    def add(self, rejects):
+        if not rejects:
+            return
+        if self.f is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.f = self.path.open("w", encoding="utf-8")
+        for obj, reason in rejects:
+            self.counts[reason] += 1
+            record = {"reason": reason, "row": obj}
+            self.f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        return self.counts
@@ -0,0 +1,460 @@
+import os
+import re
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import colstore
+import metrics
+
+
+# Lexicon-based review sentiment and complaint phrases, between transform and
+# serve. Reviews are scored in BATCH_ROWS batches by a process pool: each
+# batch is tokenized with one regex pass over its joined text, and the
+# lexicon, negation and intensifier rules are applied to the whole token
+# array at once. Scores are cached by reviewId, so a run only scores reviews
+# it has not seen; complaint n-gram counts (from reviews scored <= LOW_SCORE)
+# are kept in the same cache and only grow by the new reviews.
+#
+# Outputs:
+#   app_sentiment.csv   per app: reviews scored, avg sentiment (-1..1),
+#                       positive/negative %, top complaint phrases
+#   complaint_terms.csv per app: top TOP_COMPLAINTS n-grams with counts
+
+PROCESSED_DIR = Path("data/processed")
+REVIEWS_IN = PROCESSED_DIR / "reviews.csv"
+REVIEWS_PARTS_DIR = PROCESSED_DIR / "reviews_parts"
+REVIEWS_COLUMNAR = PROCESSED_DIR / "reviews_columnar"
+SENTIMENT_OUT = PROCESSED_DIR / "app_sentiment.csv"
+COMPLAINTS_OUT = PROCESSED_DIR / "complaint_terms.csv"
+CACHE = PROCESSED_DIR / "sentiment_cache.sqlite"
+REVIEW_COLUMNS = ["reviewId", "app_id", "score", "content"]
+
+# Tweak these as needed
+BATCH_ROWS = 20_000
+WORKERS = os.cpu_count() or 1
+QUEUE_DEPTH = 2
+LOW_SCORE = 2
+NGRAM_SIZES = (2, 3)
+TOP_COMPLAINTS = 10
+# Complaint phrases joined into app_kpis.csv's top_complaints column.
+KPI_COMPLAINTS = 3
+# |sentiment| below this counts as neutral.
+NEUTRAL_BAND = 0.05
+
+# VADER-style rules: word weights are summed per review, flipped (and
+# damped) within NEGATION_SCOPE words after a negator, boosted after an
+# intensifier, and squashed into -1..1 with s / sqrt(s^2 + 15).
+LEXICON = {
+    "good": 1.9, "great": 3.1, "love": 3.2, "loved": 2.9, "loving": 2.9,
+    "excellent": 3.2, "amazing": 2.8, "awesome": 3.1, "fantastic": 2.9,
+    "wonderful": 2.7, "perfect": 2.7, "best": 3.2, "nice": 1.8, "cool": 1.3,
+    "helpful": 1.8, "useful": 1.9, "easy": 1.9, "simple": 1.2, "fast": 1.5,
+    "quick": 1.3, "accurate": 1.9, "reliable": 1.9, "intuitive": 1.8,
+    "smooth": 1.5, "recommend": 1.5, "recommended": 1.5, "happy": 2.7,
+    "thanks": 1.9, "thank": 1.5, "like": 1.3, "enjoy": 2.2, "impressive": 2.4,
+    "worth": 0.9, "works": 0.8, "fine": 0.8, "solid": 1.2, "life": 0.4,
+    "bad": -2.5, "terrible": -2.9, "awful": -3.1, "horrible": -2.5,
+    "worst": -3.1, "useless": -1.8, "slow": -1.2, "crash": -1.9,
+    "crashes": -1.9, "crashing": -1.9, "crashed": -1.9, "bug": -1.6,
+    "bugs": -1.6, "buggy": -1.9, "broken": -2.0, "expensive": -1.0,
+    "overpriced": -1.8, "freeze": -1.4, "freezes": -1.4, "frozen": -1.2,
+    "lost": -1.3, "lose": -1.3, "losing": -1.3, "refund": -1.2, "scam": -2.8,
+    "annoying": -1.8, "ads": -0.8, "disappointed": -1.9, "disappointing": -2.2,
+    "waste": -1.8, "error": -1.4, "errors": -1.4, "fail": -2.0,
+    "fails": -2.0, "failed": -2.0, "poor": -2.1, "inaccurate": -1.9,
+    "laggy": -1.6, "lag": -1.3, "glitch": -1.4, "glitches": -1.4,
+    "hate": -2.7, "sucks": -1.5, "difficult": -1.5, "confusing": -1.3,
+    "unusable": -2.4, "issue": -0.7, "issues": -0.8, "problem": -1.0,
+    "problems": -1.2, "charged": -1.0, "wrong": -2.1, "missing": -1.2,
+    "uninstall": -1.5, "uninstalled": -1.5, "stopped": -1.0, "garbage": -2.6,
+}
+NEGATORS = {
+    "not", "no", "never", "nothing", "without", "cannot", "can't", "cant",
+    "don't", "dont", "doesn't", "doesnt", "didn't", "didnt", "isn't",
+    "isnt", "wasn't", "wasnt", "won't", "wont", "aren't", "arent",
+}
+INTENSIFIERS = {
+    "very", "really", "extremely", "so", "super", "totally", "absolutely",
+    "completely", "incredibly", "too",
+}
+NEGATION_SCOPE = 3
+NEGATION_FACTOR = -0.74
+INTENSIFIER_BOOST = 0.293
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "so", "to", "of", "in",
+    "on", "at", "for", "with", "from", "by", "as", "is", "it", "its",
+    "it's", "this", "that", "these", "those", "be", "been", "was", "were",
+    "are", "am", "i", "i'm", "me", "my", "we", "you", "your", "they",
+    "he", "she", "them", "his", "her", "our", "has", "have", "had", "do",
+    "does", "did", "will", "would", "can", "could", "just", "also",
+    "when", "then", "than", "there", "here", "what", "which", "who",
+    "very", "really", "app",
+}
+
+# Reviews are joined with RECORD_SEP so a whole batch is tokenized by one
+# findall; the separator comes back as its own token.
+RECORD_SEP = "\x1e"
+TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*|\x1e")
+
+
+def tokenize_batch(contents):
+    # -> (token codes, unique tokens, review index per token)
+    contents = ["" if c is None or c != c else str(c) for c in contents]
+    text = RECORD_SEP.join(contents)
+    if text.count(RECORD_SEP) != len(contents) - 1:
+        text = RECORD_SEP.join(c.replace(RECORD_SEP, " ") for c in contents)
+    tokens = TOKEN_RE.findall(text.replace("’", "'").lower())
+    flat = np.empty(len(tokens), dtype=object)
+    flat[:] = tokens
+    codes, uniques = pd.factorize(flat)
+    is_sep = uniques == RECORD_SEP
+    sep = is_sep[codes] if len(codes) else np.zeros(0, dtype=bool)
+    review = np.cumsum(sep)[~sep]
+    return codes[~sep], uniques, review
+
+
+def lookup(uniques, table, default=0.0):
+    return np.fromiter(
+        (table.get(t, default) for t in uniques), dtype=np.float64, count=len(uniques)
+    )
+
+
+def same_review_before(review, flags, k):
+    # Whether the token k positions earlier (in the same review) is flagged.
+    out = np.zeros(len(review), dtype=bool)
+    if k < len(review):
+        out[k:] = flags[:-k] & (review[:-k] == review[k:])
+    return out
+
+
+def sentiment_scores(codes, uniques, review, n):
+    weight = lookup(uniques, LEXICON)[codes]
+    negator = np.isin(uniques, list(NEGATORS))[codes]
+    booster = np.isin(uniques, list(INTENSIFIERS))[codes]
+
+    negated = np.zeros(len(codes), dtype=bool)
+    for k in range(1, NEGATION_SCOPE + 1):
+        negated |= same_review_before(review, negator, k)
+    boosted = same_review_before(review, booster, 1)
+    weight = weight * np.where(boosted, 1 + INTENSIFIER_BOOST, 1.0)
+    weight = weight * np.where(negated, NEGATION_FACTOR, 1.0)
+
+    total = np.bincount(review, weights=weight, minlength=n)
+    return (total / np.sqrt(total * total + 15)).astype(np.float32)
+
+
+def complaint_counts(codes, uniques, review, app_ids, scores):
+    # Counts of NGRAM_SIZES n-grams in low-score reviews, as a frame of
+    # (app_id, ngram, count). N-grams may not start or end with a stopword,
+    # nor end with a negator ("not syncing" is kept, "sync not" is not).
+    low = np.asarray(scores, dtype=np.float64) <= LOW_SCORE
+    keep = low[review]
+    codes = codes[keep]
+    review = review[keep]
+    if not len(codes):
+        return pd.DataFrame(columns=["app_id", "ngram", "count"])
+    app_codes, apps = pd.factorize(pd.Series(app_ids, dtype=object).fillna(""))
+    stop = np.isin(uniques, list(STOPWORDS))[codes]
+    last_stop = stop | np.isin(uniques, list(NEGATORS))[codes]
+
+    frames = []
+    for size in NGRAM_SIZES:
+        if len(codes) < size:
+            continue
+        m = len(codes) - size + 1
+        valid = (review[: m] == review[size - 1 :]) & ~stop[:m] & ~last_stop[size - 1 :]
+        if not valid.any():
+            continue
+        starts = np.flatnonzero(valid)
+        parts = {"app": app_codes[review[starts]]}
+        for j in range(size):
+            parts[j] = codes[starts + j]
+        counts = pd.DataFrame(parts).groupby(list(parts), sort=False).size()
+        keys = counts.index.to_frame(index=False).to_numpy()
+        frames.append(
+            pd.DataFrame(
+                {
+                    "app_id": np.asarray(apps, dtype=object)[keys[:, 0]],
+                    "ngram": [" ".join(uniques[k[1:]]) for k in keys],
+                    "count": counts.to_numpy(dtype=np.int64),
+                }
+            )
+        )
+    if not frames:
+        return pd.DataFrame(columns=["app_id", "ngram", "count"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def score_batch(contents, app_ids, scores):
+    # Worker entry point: (sentiment per review, complaint n-gram counts).
+    codes, uniques, review = tokenize_batch(contents)
+    sentiment = sentiment_scores(codes, uniques, review, len(contents))
+    return sentiment, complaint_counts(codes, uniques, review, app_ids, scores)
+
+
+def merge_counts(frames):
+    if not frames:
+        return pd.DataFrame(columns=["app_id", "ngram", "count"])
+    counts = pd.concat(frames, ignore_index=True)
+    return counts.groupby(["app_id", "ngram"], sort=False, as_index=False)["count"].sum()
+
+
+class SentimentCache:
+    # New scores and complaint counts are committed together on close, so an
+    # interrupted run leaves the cache as it was.
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # Keyed by a 64-bit hash of reviewId: integer keys append and load
+        # much faster than text, and a collision among even 10M reviews has a
+        # probability of about 1e-6.
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sentiment "
+            "(review_hash INTEGER PRIMARY KEY, score REAL)"
+        )
+        # app_id is "" for reviews without one (NULLs never conflict).
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS complaints (app_id TEXT, ngram TEXT, "
+            "count INTEGER, PRIMARY KEY (app_id, ngram)) WITHOUT ROWID"
+        )
+
+    @classmethod
+    def reset(cls, path):
+        path = Path(path)
+        for suffix in ("", "-wal", "-shm"):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+    def size(self):
+        return self.db.execute("SELECT COUNT(*) FROM sentiment").fetchone()[0]
+
+    def load(self):
+        # -> (sorted review hashes, scores), for lookups with searchsorted.
+        rows = self.db.execute(
+            "SELECT review_hash, score FROM sentiment ORDER BY review_hash"
+        ).fetchall()
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        hashes, scores = zip(*rows)
+        return np.array(hashes, dtype=np.int64), np.array(scores, dtype=np.float32)
+
+    def add(self, hashes, scores):
+        # Sorted keys insert into the B-tree about a third faster.
+        order = np.argsort(hashes)
+        self.db.executemany(
+            "INSERT OR REPLACE INTO sentiment VALUES (?, ?)",
+            zip(hashes[order].tolist(), scores[order].tolist()),
+        )
+
+    def add_complaints(self, counts):
+        self.db.executemany(
+            "INSERT INTO complaints VALUES (?, ?, ?) ON CONFLICT (app_id, ngram) "
+            "DO UPDATE SET count = count + excluded.count",
+            counts[["app_id", "ngram", "count"]].itertuples(index=False, name=None),
+        )
+
+    def top_complaints(self, k):
+        rows = self.db.execute(
+            "SELECT app_id, ngram, count, rank FROM ("
+            " SELECT app_id, ngram, count, ROW_NUMBER() OVER ("
+            "  PARTITION BY app_id ORDER BY count DESC, ngram) AS rank"
+            " FROM complaints) WHERE rank <= ? ORDER BY app_id, rank",
+            (k,),
+        ).fetchall()
+        return pd.DataFrame(rows, columns=["app_id", "ngram", "count", "rank"])
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def review_csv_paths():
+    if REVIEWS_IN.exists():
+        return [REVIEWS_IN]
+    return sorted(REVIEWS_PARTS_DIR.glob("reviews-*.csv"))
+
+
+def has_input():
+    return bool(review_csv_paths()) or colstore.exists(REVIEWS_COLUMNAR)
+
+
+def review_batches():
+    # Frames of REVIEW_COLUMNS, at most BATCH_ROWS rows each.
+    paths = review_csv_paths()
+    for path in paths:
+        yield from pd.read_csv(
+            path,
+            usecols=lambda c: c in REVIEW_COLUMNS,
+            dtype={"reviewId": str, "app_id": str, "content": str},
+            chunksize=BATCH_ROWS,
+            # Only empty fields are missing, as in the column store.
+            keep_default_na=False,
+            na_values=[""],
+        )
+    if paths or not colstore.exists(REVIEWS_COLUMNAR):
+        return
+    schema, _ = colstore.read_meta(REVIEWS_COLUMNAR)
+    for app_id, part in colstore.list_parts(colstore.list_partitions(REVIEWS_COLUMNAR)):
+        cols = {
+            name: colstore.read_column(part, name, schema[name])
+            for name in ["reviewId", "score", "content"]
+        }
+        score = cols["score"].astype(np.float64)
+        score[cols["score"] == colstore.missing_value("int8")] = np.nan
+        df = pd.DataFrame(
+            {
+                "reviewId": cols["reviewId"],
+                "app_id": app_id,
+                "score": score,
+                "content": cols["content"],
+            }
+        )
+        for start in range(0, len(df), BATCH_ROWS):
+            yield df.iloc[start : start + BATCH_ROWS]
+
+
+def review_hashes(ids):
+    return pd.util.hash_array(ids.astype(object)).view(np.int64)
+
+
+def app_sums(app_ids, sentiment):
+    df = pd.DataFrame(
+        {
+            "app_id": pd.Series(app_ids, dtype=object).fillna("").to_numpy(),
+            "reviews_scored": 1,
+            "sentiment_sum": np.asarray(sentiment, dtype=np.float64),
+            "positive": np.asarray(sentiment) >= NEUTRAL_BAND,
+            "negative": np.asarray(sentiment) <= -NEUTRAL_BAND,
+        }
+    )
+    return df.groupby("app_id", sort=False).sum()
+
+
+def score_reviews(cache):
+    # Scores every review, cached or new. Returns (per-app sums, complaint
+    # counts of the new reviews, cached reviews seen, reviews scored).
+    known, known_scores = cache.load()
+    seen = np.zeros(len(known), dtype=bool)
+    sums = []
+    counts = []
+    scored = 0
+
+    def collect(futures):
+        nonlocal scored
+        for fut in futures:
+            hashes, has_id, app_ids = pending.pop(fut)
+            sentiment, batch_counts = fut.result()
+            cache.add(hashes[has_id], sentiment[has_id])
+            sums.append(app_sums(app_ids, sentiment))
+            counts.append(batch_counts)
+            scored += len(app_ids)
+        if len(counts) > 50:
+            counts[:] = [merge_counts(counts)]
+
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        pending = {}
+        for batch in review_batches():
+            batch = batch.reindex(columns=REVIEW_COLUMNS)
+            has_id = batch["reviewId"].notna().to_numpy()
+            hashes = review_hashes(batch["reviewId"].to_numpy(dtype=object))
+            app_ids = batch["app_id"].to_numpy(dtype=object)
+            pos = np.searchsorted(known, hashes)
+            pos[pos == len(known)] = 0
+            if len(known):
+                cached = has_id & (known[pos] == hashes)
+            else:
+                cached = np.zeros(len(batch), dtype=bool)
+            if cached.any():
+                seen[pos[cached]] = True
+                sums.append(app_sums(app_ids[cached], known_scores[pos[cached]]))
+
+            new = ~cached
+            if new.any():
+                fut = pool.submit(
+                    score_batch,
+                    batch["content"].to_numpy(dtype=object)[new].tolist(),
+                    app_ids[new].tolist(),
+                    batch["score"].to_numpy(dtype=np.float64)[new],
+                )
+                # Reviews without an id are scored on every run.
+                pending[fut] = (hashes[new], has_id[new], app_ids[new])
+            if len(pending) >= WORKERS * QUEUE_DEPTH:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(list(pending))
+    return sums, merge_counts(counts), int(seen.sum()), scored
+
+
+def app_sentiment(sums, complaints):
+    if sums:
+        agg = pd.concat(sums).groupby(level=0, sort=False).sum()
+    else:
+        agg = app_sums([], [])
+    out = pd.DataFrame(
+        {
+            "app_id": agg.index,
+            "reviews_scored": agg["reviews_scored"].to_numpy(),
+            "avg_sentiment": (agg["sentiment_sum"] / agg["reviews_scored"]).round(4).to_numpy(),
+            "positive_review_pct": (100 * agg["positive"] / agg["reviews_scored"]).round(2).to_numpy(),
+            "negative_review_pct": (100 * agg["negative"] / agg["reviews_scored"]).round(2).to_numpy(),
+        }
+    )
+    top = complaints[complaints["rank"] <= KPI_COMPLAINTS]
+    joined = top.groupby("app_id", sort=False)["ngram"].agg("; ".join)
+    out["top_complaints"] = out["app_id"].map(joined)
+    out["app_id"] = out["app_id"].replace("", None)
+    return out.sort_values("app_id", na_position="last", ignore_index=True)
+
+
+def compute_sentiment():
+    # Returns (app_sentiment, complaint_terms); see the outputs above.
+    cache = SentimentCache(CACHE)
+    cached = cache.size()
+    sums, counts, hits, scored = score_reviews(cache)
+    if hits < cached:
+        # Reviews were removed from the input (e.g. a fresh ingest), so the
+        # cached complaint counts are stale too: start over.
+        print(f"{cached - hits} cached reviews are gone from the input; rescoring all")
+        cache.close()
+        SentimentCache.reset(CACHE)
+        cache = SentimentCache(CACHE)
+        sums, counts, hits, scored = score_reviews(cache)
+    cache.add_complaints(counts)
+    complaints = cache.top_complaints(TOP_COMPLAINTS)
+    cache.close()
+    metrics.count("reviews_scored", scored)
+    metrics.count("sentiment_cache_hits", hits)
+
+    result = app_sentiment(sums, complaints)
+    complaints["app_id"] = complaints["app_id"].replace("", None)
+    complaints = complaints[["app_id", "rank", "ngram", "count"]]
+    return result, complaints
+
+
+def main():
+    with metrics.stage("sentiment") as m:
+        if not has_input():
+            raise FileNotFoundError(f"No reviews found at {REVIEWS_IN}")
+        with metrics.step("score_reviews"):
+            result, complaints = compute_sentiment()
+        m.rows_in = int(result["reviews_scored"].sum())
+        m.rows_out = len(result) + len(complaints)
+        with metrics.step("write"):
+            result.to_csv(SENTIMENT_OUT, index=False)
+            complaints.to_csv(COMPLAINTS_OUT, index=False)
+        print(
+            f"Scored {m.counters.get('reviews_scored', 0)} new reviews "
+            f"({m.counters.get('sentiment_cache_hits', 0)} cached)"
+        )
+        print(f"Wrote {SENTIMENT_OUT}")
+        print(f"Wrote {COMPLAINTS_OUT}")
+
+
+if __name__ == "__main__":
+    main()
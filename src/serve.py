@@ -1,45 +1,208 @@
+import csv
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 from pathlib import Path
 
+import anomaly
+import colstore
+import cube
+import kpi_state
+import metrics
+import sketches
+
 
 PROCESSED_DIR = Path("data/processed")
 REVIEWS_IN = PROCESSED_DIR / "reviews.csv"
+# Written instead of reviews.csv by transform.py with SHARD_OUTPUT = "parts".
+REVIEWS_PARTS_DIR = PROCESSED_DIR / "reviews_parts"
+# Column store written by transform.py with "columnar" in REVIEWS_FORMATS.
+# When present it is used instead of the CSV, reading only KPI_COLUMNS.
+REVIEWS_COLUMNAR = PROCESSED_DIR / "reviews_columnar"
+KPI_COLUMNS = ["score", "thumbsUpCount", "content_length", "at"]
+# Columns read from reviews.csv; `content` is reduced to its length per chunk.
+CSV_COLUMNS = ["app_id", "score", "thumbsUpCount", "content", "at"]
+# Only empty fields are missing: text such as "NA" or "null" is kept, as in
+# the column store, so both give the same KPIs.
+CSV_NA = {"keep_default_na": False, "na_values": [""]}
+# App names are joined per app at the KPI step instead of being held per row.
+APPS_IN = PROCESSED_DIR / "apps.csv"
+
+# Compact review frame used by every KPI path:
+#   app_id         categorical
+#   score          int8, SCORE_MISSING when absent
+#   thumbsUpCount  int32 (absent = 0)
+#   content_length int32
+#   at             int64 epoch seconds, AT_MISSING when absent (NaT as [s])
+SCORE_MISSING = colstore.missing_value("int8")
+AT_MISSING = colstore.missing_value("int64")
+
+APP_KPI_COLUMNS = [
+    "app_id",
+    "app_name",
+    "reviews_count",
+    "avg_rating",
+    "low_rating_pct",
+    "first_review_date",
+    "last_review_date",
+    "total_thumbs_up",
+    "avg_thumbs_up",
+    "median_thumbs_up",
+    "avg_review_length",
+    "empty_review_pct",
+    "rating_std_dev",
+    "review_velocity",
+]
+
+# Per-app sentiment from sentiment.py, joined onto app_kpis.csv when present
+# (the columns are left empty otherwise).
+SENTIMENT_IN = PROCESSED_DIR / "app_sentiment.csv"
+SENTIMENT_COLUMNS = ["avg_sentiment", "negative_review_pct", "top_complaints"]
 
 APP_KPI_OUT = PROCESSED_DIR / "app_kpis.csv"
 DAILY_KPI_OUT = PROCESSED_DIR / "daily_kpis.csv"
+# Per-app x day counts with week/month rollups and rolling windows (cube.py).
+CUBE_OUT = PROCESSED_DIR / "kpi_cube.npz"
+
+# Incremental mode keeps mergeable aggregate state in KPI_STATE and only folds
+# the rows appended to reviews.csv since the last run (read in CHUNK_ROWS
+# chunks). If reviews.csv was rewritten with different content, the state is
+# rebuilt from scratch.
+INCREMENTAL = False
+KPI_STATE = PROCESSED_DIR / "kpi_state.json"
+CHUNK_ROWS = 200_000
+
+# PARALLEL = True computes the KPIs in a process pool without materializing
+# all reviews. CHUNK_ROWS-row chunks of reviews.csv are hash-partitioned by
+# app_id and each slice is folded into partial aggregates by a worker
+# (column store parts are already per app and are handed out in batches of
+# about CHUNK_ROWS rows). With WORKERS = 1 the slices are folded in-process.
+# Partials merge exactly like the incremental state, and at most
+# WORKERS * QUEUE_DEPTH slices are in flight at once.
+PARALLEL = False
+WORKERS = os.cpu_count() or 1
+QUEUE_DEPTH = 2
+
+# Approximate KPIs from mergeable sketches (sketches.py): distinct reviewers
+# and p50/p90/p99 of thumbs-up and review length, per app and per day. One
+# streaming pass in CHUNK_ROWS chunks with fixed memory per app and day;
+# written to their own files next to the exact KPIs. The pass always reads
+# all reviews, even in INCREMENTAL or PARALLEL mode, so it is off by default;
+# while off, sketch files left by an earlier run are removed.
+SKETCH_KPIS = False
+SKETCH_COLUMNS = ["app_id", "userName", "thumbsUpCount", "content", "at"]
+SKETCH_QUANTILES = (0.5, 0.9, 0.99)
+APP_SKETCH_OUT = PROCESSED_DIR / "app_sketch_kpis.csv"
+DAILY_SKETCH_OUT = PROCESSED_DIR / "daily_sketch_kpis.csv"
+
+# Per-app rating drops and review spikes (anomaly.py), detected online over
+# the cube's daily series. The detector state in ANOMALY_STATE only ever
+# folds new days; ALERTS_OUT keeps every alert raised so far. Delete the
+# state to re-run detection over the whole history.
+ALERTS = True
+ANOMALY_STATE = PROCESSED_DIR / "anomaly_state.json"
+ALERTS_OUT = PROCESSED_DIR / "alerts.csv"
+
+
+def review_csv_paths():
+    if REVIEWS_IN.exists():
+        return [REVIEWS_IN]
+    return sorted(REVIEWS_PARTS_DIR.glob("reviews-*.csv"))
+
+
+def load_app_names():
+    if not APPS_IN.exists():
+        return {}
+    with APPS_IN.open(encoding="utf-8", newline="") as f:
+        return {row["appId"]: row["title"] or None for row in csv.DictReader(f)}
+
+
+def load_reviews(app_ids=None):
+    # Returns the compact review frame and {app_id: app_name}.
+    if colstore.exists(REVIEWS_COLUMNAR):
+        return load_reviews_columnar(app_ids)
+    return load_reviews_csv()
+
+
+def load_reviews_columnar(app_ids=None):
+    table = colstore.read_table(REVIEWS_COLUMNAR, KPI_COLUMNS, app_ids)
+    _, app_names = colstore.read_meta(REVIEWS_COLUMNAR)
+    return reviews_from_table(table), app_names
+
+
+def reviews_from_table(table):
+    # `table` is in colstore.read_table's layout (from disk, or straight from
+    # transform.transform_to_table when running in-process); its missing
+    # values already use the compact frame's sentinels.
+    app_id = pd.Categorical.from_codes(table["app_code"], categories=table["app_ids"])
+    thumbs = np.asarray(table["thumbsUpCount"], dtype=np.int32)
+    thumbs[thumbs == colstore.missing_value("int32")] = 0
+    return compact_reviews(
+        app_id, table["score"], thumbs, table["content_length"], table["at"]
+    )
 
 
-def load_reviews():
-    df = pd.read_csv(REVIEWS_IN)
-    required = [
-        "app_id",
-        "app_name",
-        "reviewId",
-        "userName",
-        "score",
-        "content",
-        "thumbsUpCount",
-        "at",
-    ]
-    for col in required:
-        if col not in df.columns:
-            df[col] = pd.NA
+def compact_reviews(app_id, score, thumbs, content_length, at):
+    if not isinstance(app_id, pd.Categorical):
+        app_id = pd.Categorical(app_id)
+    return pd.DataFrame(
+        {
+            "app_id": app_id,
+            "score": np.asarray(score, dtype=np.int8),
+            "thumbsUpCount": np.asarray(thumbs, dtype=np.int32),
+            "content_length": np.asarray(content_length, dtype=np.int32),
+            "at": np.asarray(at, dtype=np.int64),
+        }
+    )
+
 
-    df["score"] = pd.to_numeric(df["score"], errors="coerce")
-    df["thumbsUpCount"] = (
-        pd.to_numeric(df["thumbsUpCount"], errors="coerce").fillna(0).astype(int)
+def concat_reviews(frames):
+    if not frames:
+        return compact_reviews([], [], [], [], [])
+    app_id = union_categoricals(
+        [f["app_id"].array for f in frames], sort_categories=True
+    )
+    return compact_reviews(
+        app_id,
+        *(
+            np.concatenate([f[col].to_numpy() for f in frames])
+            for col in ["score", "thumbsUpCount", "content_length", "at"]
+        ),
     )
-    df["content"] = df["content"].fillna("")
-    df["content_length"] = df["content"].str.strip().str.len()
-    df["at_dt"] = pd.to_datetime(df["at"], errors="coerce")
-    return df
 
 
-def rating_std(series):
-    s = series.dropna()
-    if len(s) <= 1:
-        return 0.0
-    return float(s.std(ddof=0))
+def load_reviews_csv():
+    paths = review_csv_paths()
+    if not paths:
+        raise FileNotFoundError(f"No reviews found at {REVIEWS_IN}")
+    frames = []
+    for path in paths:
+        chunks = pd.read_csv(
+            path,
+            usecols=lambda c: c in CSV_COLUMNS,
+            dtype={"app_id": "category", "content": str},
+            chunksize=CHUNK_ROWS,
+            **CSV_NA,
+        )
+        frames.extend(prepare_reviews(chunk) for chunk in chunks)
+    return concat_reviews(frames), load_app_names()
+
+
+def prepare_reviews(df):
+    # Parses one chunk of reviews.csv into the compact frame.
+    for col in CSV_COLUMNS:
+        if col not in df.columns:
+            df[col] = pd.NA
+
+    score = pd.to_numeric(df["score"], errors="coerce").fillna(SCORE_MISSING)
+    thumbs = pd.to_numeric(df["thumbsUpCount"], errors="coerce").fillna(0)
+    content_length = df["content"].fillna("").astype(str).str.strip().str.len()
+    at = pd.to_datetime(df["at"], errors="coerce").to_numpy()
+    at = at.astype("datetime64[s]").view(np.int64)
+    return compact_reviews(df["app_id"], score, thumbs, content_length, at)
 
 
 def compute_review_velocity(counts, days_active):
@@ -50,58 +213,97 @@ def compute_review_velocity(counts, days_active):
     return velocity
 
 
-def compute_app_kpis(df):
-    g = df.groupby("app_id", dropna=False)
-
-    reviews_count = g.size().rename("reviews_count")
-    app_name = g["app_name"].first().rename("app_name")
-
-    score_sum = g["score"].sum().rename("score_sum")
-    low_count = g["score"].apply(lambda s: (s <= 2).sum()).rename("low_count")
-
-    avg_rating = (score_sum / reviews_count).rename("avg_rating")
-    low_rating_pct = (low_count / reviews_count * 100).rename("low_rating_pct")
-
-    total_thumbs_up = g["thumbsUpCount"].sum().rename("total_thumbs_up")
-    avg_thumbs_up = (total_thumbs_up / reviews_count).rename("avg_thumbs_up")
-    median_thumbs_up = g["thumbsUpCount"].quantile(
-        0.5, interpolation="higher"
-    ).rename("median_thumbs_up")
-
-    avg_review_length = g["content_length"].mean().rename("avg_review_length")
-    empty_review_pct = g["content_length"].apply(
-        lambda s: (s == 0).mean() * 100
-    ).rename("empty_review_pct")
-
-    rating_std_dev = g["score"].apply(rating_std).rename("rating_std_dev")
-
-    first_dt = g["at_dt"].min().rename("first_review_dt")
-    last_dt = g["at_dt"].max().rename("last_review_dt")
-
-    days_active = (last_dt - first_dt).dt.days.rename("days_active")
-    review_velocity = compute_review_velocity(reviews_count, days_active).rename(
-        "review_velocity"
+def app_names_for(index, app_names):
+    return [None if pd.isna(a) else app_names.get(a) for a in index]
+
+
+def aggregate_apps(df, app_names, median=True):
+    # One grouped pass over precomputed flag/square columns; every app KPI is
+    # derived from these sums in finish_app_kpis. Missing scores count as 0
+    # in the sums, as NaN did with skipna.
+    score = df["score"].to_numpy()
+    scored = score != SCORE_MISSING
+    score = np.where(scored, score, 0).astype(np.int8)
+    length = df["content_length"].to_numpy()
+    work = pd.DataFrame(
+        {
+            "app_id": df["app_id"],
+            "scored": scored.astype(np.int8),
+            "score": score,
+            "score_sq": score * score,
+            "low": (scored & (score <= 2)).astype(np.int8),
+            "thumbsUpCount": df["thumbsUpCount"],
+            "content_length": length,
+            "empty": (length == 0).astype(np.int8),
+            "at_dt": df["at"].to_numpy().view("datetime64[s]"),
+        }
     )
-
-    app_kpis = pd.concat(
-        [
-            app_name,
-            reviews_count,
-            avg_rating,
-            low_rating_pct,
-            first_dt,
-            last_dt,
-            total_thumbs_up,
-            avg_thumbs_up,
-            median_thumbs_up,
-            avg_review_length,
-            empty_review_pct,
-            rating_std_dev,
-            review_velocity,
-        ],
-        axis=1,
+    g = work.groupby("app_id", dropna=False, observed=True)
+    agg = g.agg(
+        reviews_count=("score", "size"),
+        score_count=("scored", "sum"),
+        score_sum=("score", "sum"),
+        score_sq_sum=("score_sq", "sum"),
+        low_count=("low", "sum"),
+        total_thumbs_up=("thumbsUpCount", "sum"),
+        length_sum=("content_length", "sum"),
+        empty_count=("empty", "sum"),
+        first_review_dt=("at_dt", "min"),
+        last_review_dt=("at_dt", "max"),
+    )
+    # pandas may hand small-int sums back in the input dtype when they fit;
+    # widen them before they are added up across chunks.
+    agg[kpi_state.SUM_COLUMNS] = agg[kpi_state.SUM_COLUMNS].astype("int64")
+    for col in ["first_review_dt", "last_review_dt"]:
+        agg[col] = agg[col].astype("datetime64[ns]")
+    agg.insert(0, "app_name", app_names_for(agg.index, app_names))
+    if median:
+        agg["median_thumbs_up"] = g["thumbsUpCount"].quantile(
+            0.5, interpolation="higher"
+        )
+    return agg
+
+
+def thumbs_counts(df):
+    thumbs = df["thumbsUpCount"].astype("int64")
+    counts = df.groupby(
+        [df["app_id"], thumbs], dropna=False, observed=True
+    ).size()
+    counts.index.names = ["app_id", "value"]
+    return counts
+
+
+def rating_std_from_sums(count, total, total_sq):
+    # Population std dev of integer scores from exact integer sums:
+    # var = (n * sum(x^2) - sum(x)^2) / n^2, and 0 for one or no scores.
+    n = count.astype("int64")
+    s = total.round().astype("int64")
+    ss = total_sq.round().astype("int64")
+    var = (n * ss - s * s).astype(float) / (n * n).where(n > 0, 1).astype(float)
+    return np.sqrt(var.clip(lower=0)).where(n > 1, 0.0)
+
+
+def finish_app_kpis(agg):
+    reviews_count = agg["reviews_count"]
+    app_kpis = pd.DataFrame(index=agg.index)
+    app_kpis["app_name"] = agg["app_name"]
+    app_kpis["reviews_count"] = reviews_count
+    app_kpis["avg_rating"] = agg["score_sum"] / reviews_count
+    app_kpis["low_rating_pct"] = agg["low_count"] / reviews_count * 100
+    app_kpis["first_review_dt"] = agg["first_review_dt"]
+    app_kpis["last_review_dt"] = agg["last_review_dt"]
+    app_kpis["total_thumbs_up"] = agg["total_thumbs_up"]
+    app_kpis["avg_thumbs_up"] = agg["total_thumbs_up"] / reviews_count
+    app_kpis["median_thumbs_up"] = agg["median_thumbs_up"]
+    app_kpis["avg_review_length"] = agg["length_sum"] / reviews_count
+    app_kpis["empty_review_pct"] = agg["empty_count"] / reviews_count * 100
+    app_kpis["rating_std_dev"] = rating_std_from_sums(
+        agg["score_count"], agg["score_sum"], agg["score_sq_sum"]
     )
 
+    days_active = (agg["last_review_dt"] - agg["first_review_dt"]).dt.days
+    app_kpis["review_velocity"] = compute_review_velocity(reviews_count, days_active)
+
     app_kpis["first_review_date"] = app_kpis["first_review_dt"].dt.strftime(
         "%Y-%m-%d"
     )
@@ -119,59 +321,439 @@ def compute_app_kpis(df):
     app_kpis["total_thumbs_up"] = app_kpis["total_thumbs_up"].astype(int)
     app_kpis["median_thumbs_up"] = app_kpis["median_thumbs_up"].astype(int)
 
+    app_kpis.index.name = "app_id"
     app_kpis = app_kpis.reset_index()
+    app_kpis["app_id"] = app_kpis["app_id"].astype(object)
     app_kpis = app_kpis.sort_values(["app_name", "app_id"], na_position="last")
 
-    return app_kpis[
-        [
-            "app_id",
-            "app_name",
-            "reviews_count",
-            "avg_rating",
-            "low_rating_pct",
-            "first_review_date",
-            "last_review_date",
-            "total_thumbs_up",
-            "avg_thumbs_up",
-            "median_thumbs_up",
-            "avg_review_length",
-            "empty_review_pct",
-            "rating_std_dev",
-            "review_velocity",
-        ]
-    ]
+    return app_kpis[APP_KPI_COLUMNS]
 
 
-def compute_daily_kpis(df):
-    daily = df[df["at_dt"].notna()].copy()
-    if daily.empty:
-        return pd.DataFrame(columns=["date", "daily_reviews", "daily_avg_rating"])
+def compute_app_kpis(df, app_names):
+    return finish_app_kpis(aggregate_apps(df, app_names))
 
-    daily["date"] = daily["at_dt"].dt.date
-    g = daily.groupby("date", dropna=False)
 
-    daily_reviews = g.size().rename("daily_reviews")
-    score_sum = g["score"].sum().rename("score_sum")
-    daily_avg_rating = (score_sum / daily_reviews).rename("daily_avg_rating")
+def aggregate_daily(df):
+    at = df["at"].to_numpy()
+    dated = at != AT_MISSING
+    score = df["score"].to_numpy()[dated]
+    work = pd.DataFrame(
+        {
+            "day": at[dated] // 86400,
+            "score": np.where(score != SCORE_MISSING, score, 0).astype(np.int8),
+        }
+    )
+    g = work.groupby("day")
+    agg = pd.DataFrame(
+        {"daily_reviews": g.size(), "score_sum": g["score"].sum().astype("int64")}
+    )
+    agg.index = pd.Index(
+        agg.index.to_numpy().astype("datetime64[D]").astype(str), name="date"
+    )
+    return agg
+
+
+def aggregate_app_daily(df):
+    at = df["at"].to_numpy()
+    dated = at != AT_MISSING
+    score = df["score"].to_numpy()[dated]
+    scored = score != SCORE_MISSING
+    work = pd.DataFrame(
+        {
+            "app_id": df["app_id"].array[dated],
+            "day": at[dated] // 86400,
+            "scored": scored.astype(np.int8),
+            "score": np.where(scored, score, 0).astype(np.int8),
+        }
+    )
+    g = work.groupby(["app_id", "day"], dropna=False, observed=True)
+    agg = g.agg(
+        reviews=("scored", "size"),
+        score_count=("scored", "sum"),
+        score_sum=("score", "sum"),
+    )
+    return agg.astype("int64")
+
+
+def finish_daily_kpis(agg):
+    if agg is None or agg.empty:
+        return pd.DataFrame(columns=["date", "daily_reviews", "daily_avg_rating"])
 
-    daily_kpis = pd.concat([daily_reviews, daily_avg_rating], axis=1).reset_index()
-    daily_kpis["daily_avg_rating"] = daily_kpis["daily_avg_rating"].round(4)
-    daily_kpis["date"] = daily_kpis["date"].astype(str)
-    daily_kpis = daily_kpis.sort_values("date")
+    daily_kpis = pd.DataFrame(index=agg.index)
+    daily_kpis["daily_reviews"] = agg["daily_reviews"]
+    daily_kpis["daily_avg_rating"] = (
+        agg["score_sum"] / agg["daily_reviews"]
+    ).round(4)
+    daily_kpis.index.name = "date"
+    daily_kpis = daily_kpis.reset_index().sort_values("date")
 
     return daily_kpis[["date", "daily_reviews", "daily_avg_rating"]]
 
 
-def main():
-    df = load_reviews()
-    app_kpis = compute_app_kpis(df)
-    daily_kpis = compute_daily_kpis(df)
+def compute_daily_kpis(df):
+    return finish_daily_kpis(aggregate_daily(df))
+
+
+def add_sentiment(app_kpis, path=SENTIMENT_IN):
+    # path=None leaves the sentiment columns empty.
+    app_kpis = app_kpis.copy()
+    if path is None or not path.exists():
+        for col in SENTIMENT_COLUMNS:
+            app_kpis[col] = None
+        return app_kpis
+    sentiment = pd.read_csv(path, dtype={"app_id": str, "top_complaints": str})
+    # Reviews without an app_id are keyed as "" on both sides.
+    sentiment = sentiment.set_index(sentiment["app_id"].fillna(""))
+    keys = app_kpis["app_id"].astype(object).fillna("")
+    for col in SENTIMENT_COLUMNS:
+        app_kpis[col] = keys.map(sentiment[col]).to_numpy()
+    return app_kpis
+
+
+def write_csv_atomic(df, path):
+    # Readers (kpi_service.py reloads) see the old file or the new one,
+    # never a partly written one.
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_csv(tmp, index=False)
+    tmp.replace(path)
+
+
+def write_kpis(app_kpis, daily_kpis, app_daily=None):
+    # Returns the per-app cube built from app_daily (None without it).
+    write_csv_atomic(app_kpis, APP_KPI_OUT)
+    write_csv_atomic(daily_kpis, DAILY_KPI_OUT)
+    if app_daily is None:
+        return None
+    kpi_cube = cube.build(app_daily)
+    cube.save(kpi_cube, CUBE_OUT)
+    return kpi_cube
+
+
+def update_alerts(kpi_cube, app_kpis):
+    # Folds the cube's new days into the detector state and rewrites
+    # ALERTS_OUT; returns the new alerts.
+    state = anomaly.load(ANOMALY_STATE)
+    previous = None
+    if state is None:
+        state = anomaly.empty_state()
+    elif ALERTS_OUT.exists():
+        previous = pd.read_csv(ALERTS_OUT, dtype={"app_id": str, "app_name": str})
+    state, alerts = anomaly.update(state, kpi_cube)
+    names = app_kpis.set_index(app_kpis["app_id"].astype(object).fillna(""))["app_name"]
+    alerts.insert(2, "app_name", alerts["app_id"].map(names).to_numpy())
+    anomaly.merge_alerts(previous, alerts).to_csv(ALERTS_OUT, index=False)
+    anomaly.save(state, ANOMALY_STATE)
+    return alerts
+
+
+def read_csv_from(path, offset, chunksize):
+    # Yields chunks of rows starting at byte `offset` (0 = first data row).
+    with path.open("rb") as f:
+        header = f.readline()
+        names = next(csv.reader([header.decode("utf-8-sig")]))
+        if offset:
+            f.seek(offset)
+        yield from pd.read_csv(
+            f,
+            header=None,
+            names=names,
+            usecols=lambda c: c in CSV_COLUMNS,
+            dtype={"app_id": "category", "content": str},
+            chunksize=chunksize,
+            **CSV_NA,
+        )
+
+
+def fold_reviews(state, df, app_names):
+    delta = {
+        "apps": aggregate_apps(df, app_names, median=False),
+        "thumbs": thumbs_counts(df),
+        "daily": aggregate_daily(df),
+        "app_daily": aggregate_app_daily(df),
+        "source": None,
+    }
+    return kpi_state.merge_states(state, delta)
+
+
+def compute_kpis_incremental():
+    state = kpi_state.load(KPI_STATE)
+    offset = kpi_state.resume_offset(state, REVIEWS_IN)
+    if state["apps"] is not None and state["app_daily"] is None:
+        offset = 0  # state from before the per-app cube; rebuild it
+    if offset == 0:
+        state = kpi_state.empty_state()
+
+    app_names = load_app_names()
+    folded = 0
+    for chunk in read_csv_from(REVIEWS_IN, offset, CHUNK_ROWS):
+        state = fold_reviews(state, prepare_reviews(chunk), app_names)
+        folded += len(chunk)
+    metrics.count("reviews_folded", folded)
+    kpi_state.mark_source(state, REVIEWS_IN)
+    kpi_state.save(state, KPI_STATE)
+    print(f"Folded {folded} new reviews into {KPI_STATE}")
+    return kpis_from_state(state)
+
+
+def kpis_from_state(state):
+    # (app_kpis, daily_kpis, app_daily) from merged aggregate state.
+    app_daily = state.get("app_daily")
+    if app_daily is None:
+        app_daily = pd.DataFrame(
+            columns=kpi_state.APP_DAILY_COLUMNS[2:],
+            index=pd.MultiIndex.from_tuples([], names=["app_id", "day"]),
+        )
+    if state["apps"] is None:
+        app_kpis = pd.DataFrame(columns=APP_KPI_COLUMNS)
+        return app_kpis, finish_daily_kpis(None), app_daily
+    app_kpis = finish_app_kpis(kpi_state.app_aggregates(state))
+    return app_kpis, finish_daily_kpis(state["daily"]), app_daily
+
+
+def _init_worker(app_names):
+    # Sent once per worker process instead of once per slice.
+    global _worker_app_names
+    _worker_app_names = app_names
+
+
+def fold_csv_slice(raw):
+    df = prepare_reviews(raw)
+    return fold_reviews(kpi_state.empty_state(), df, _worker_app_names), len(df)
+
+
+def fold_column_parts(parts, schema):
+    # Folds a batch of (app_id, part_dir) in one go: per-task overhead is
+    # paid once per batch rather than once per part.
+    columns = {name: [] for name in KPI_COLUMNS}
+    app_ids, codes = [], []
+    for app_id, part_dir in parts:
+        for name in KPI_COLUMNS:
+            columns[name].append(colstore.read_column(part_dir, name, schema[name]))
+        rows = len(columns["score"][-1])
+        if app_id is not None:
+            app_ids.append(app_id)
+        code = -1 if app_id is None else len(app_ids) - 1
+        codes.append(np.full(rows, code, np.int32))
+    table = {name: np.concatenate(arrays) for name, arrays in columns.items()}
+    table["app_ids"] = app_ids
+    table["app_code"] = np.concatenate(codes)
+    df = reviews_from_table(table)
+    return fold_reviews(kpi_state.empty_state(), df, _worker_app_names), len(df)
+
+
+def part_batches(parts):
+    # Consecutive parts in batches of about CHUNK_ROWS rows, smaller when
+    # that leaves workers idle.
+    sizes = [
+        len(np.load(part_dir / "score.npy", mmap_mode="r")) for _, part_dir in parts
+    ]
+    target = max(1, min(CHUNK_ROWS, -(-sum(sizes) // WORKERS)))
+    batch, rows = [], 0
+    for part, size in zip(parts, sizes):
+        batch.append(part)
+        rows += size
+        if rows >= target:
+            yield batch
+            batch, rows = [], 0
+    if batch:
+        yield batch
+
+
+def shard_tasks():
+    # Returns {app_id: app_name} and an iterator of (fn, *args) tasks.
+    if colstore.exists(REVIEWS_COLUMNAR):
+        schema, app_names = colstore.read_meta(REVIEWS_COLUMNAR)
+        parts = colstore.list_parts(colstore.list_partitions(REVIEWS_COLUMNAR))
+        tasks = ((fold_column_parts, batch, schema) for batch in part_batches(parts))
+        return app_names, tasks
+
+    paths = review_csv_paths()
+    if not paths:
+        raise FileNotFoundError(f"No reviews found at {REVIEWS_IN}")
+
+    def csv_tasks():
+        for path in paths:
+            chunks = pd.read_csv(
+                path,
+                usecols=lambda c: c in CSV_COLUMNS,
+                dtype=str,
+                chunksize=CHUNK_ROWS,
+                **CSV_NA,
+            )
+            for chunk in chunks:
+                # Stable across processes, unlike hash() on str.
+                hashes = pd.util.hash_pandas_object(chunk["app_id"], index=False)
+                shard = hashes.to_numpy() % WORKERS
+                for k in range(WORKERS):
+                    part = chunk[shard == k]
+                    if len(part):
+                        yield fold_csv_slice, part
+
+    return load_app_names(), csv_tasks()
+
+
+def compute_kpis_parallel():
+    app_names, tasks = shard_tasks()
+    state = kpi_state.empty_state()
+    folded = 0
+
+    def merge(futures):
+        nonlocal state, folded
+        for fut in futures:
+            delta, rows = fut.result()
+            state = kpi_state.merge_states(state, delta)
+            folded += rows
+
+    if WORKERS <= 1:
+        # A pool of one only adds pickling and process start-up.
+        _init_worker(app_names)
+        for fn, *args in tasks:
+            delta, rows = fn(*args)
+            state = kpi_state.merge_states(state, delta)
+            folded += rows
+        metrics.count("reviews_folded", folded)
+        return kpis_from_state(state)
+
+    with ProcessPoolExecutor(
+        max_workers=WORKERS, initializer=_init_worker, initargs=(app_names,)
+    ) as pool:
+        pending = set()
+        for fn, *args in tasks:
+            pending.add(pool.submit(fn, *args))
+            if len(pending) >= WORKERS * QUEUE_DEPTH:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                merge(done)
+        merge(pending)
+    metrics.count("reviews_folded", folded)
+    return kpis_from_state(state)
+
+
+def sketch_batches():
+    # Yields (app_id, userName, thumbs, content_length, at) arrays, one part
+    # of the column store or one chunk of reviews.csv at a time.
+    if colstore.exists(REVIEWS_COLUMNAR):
+        schema, _ = colstore.read_meta(REVIEWS_COLUMNAR)
+        parts = colstore.list_parts(colstore.list_partitions(REVIEWS_COLUMNAR))
+        for app_id, part in parts:
+            cols = {
+                name: colstore.read_column(part, name, schema[name])
+                for name in ["userName", "thumbsUpCount", "content_length", "at"]
+            }
+            thumbs = cols["thumbsUpCount"]
+            thumbs[thumbs == colstore.missing_value("int32")] = 0
+            app_ids = np.full(len(thumbs), app_id, dtype=object)
+            yield app_ids, cols["userName"], thumbs, cols["content_length"], cols["at"]
+        return
+
+    paths = review_csv_paths()
+    if not paths:
+        raise FileNotFoundError(f"No reviews found at {REVIEWS_IN}")
+    for path in paths:
+        chunks = pd.read_csv(
+            path,
+            usecols=lambda c: c in SKETCH_COLUMNS,
+            dtype={"app_id": str, "userName": str, "content": str},
+            chunksize=CHUNK_ROWS,
+            **CSV_NA,
+        )
+        for chunk in chunks:
+            df = prepare_reviews(chunk)
+            users = chunk.get("userName", pd.Series(None, index=chunk.index))
+            yield (
+                chunk["app_id"].to_numpy(dtype=object),
+                users.to_numpy(dtype=object),
+                df["thumbsUpCount"].to_numpy(),
+                df["content_length"].to_numpy(),
+                df["at"].to_numpy(),
+            )
+
+
+def finish_sketch_kpis(summary, key):
+    summary = summary.rename(columns={"key": key})
+    for col in summary.columns:
+        if col.startswith(("thumbs_", "length_")):
+            summary[col] = summary[col].round().astype("Int64")
+    return summary
+
+
+def compute_sketch_kpis(app_names):
+    # (app_sketch_kpis, daily_sketch_kpis) in a single pass over the reviews.
+    apps = sketches.SketchSet()
+    days = sketches.SketchSet()
+    rows = 0
+    for app_id, users, thumbs, length, at in sketch_batches():
+        apps.update(app_id, users, thumbs, length)
+        dated = at != AT_MISSING
+        days.update(at[dated] // 86400, users[dated], thumbs[dated], length[dated])
+        rows += len(at)
+    metrics.count("reviews_sketched", rows)
+
+    app_sketch = finish_sketch_kpis(apps.summary(SKETCH_QUANTILES), "app_id")
+    app_sketch.insert(1, "app_name", app_names_for(app_sketch["app_id"], app_names))
+    app_sketch = app_sketch.sort_values(["app_name", "app_id"], na_position="last")
+
+    daily_sketch = finish_sketch_kpis(days.summary(SKETCH_QUANTILES), "date")
+    daily_sketch = daily_sketch.sort_values("date")
+    daily_sketch["date"] = (
+        daily_sketch["date"].to_numpy(dtype=np.int64).astype("datetime64[D]")
+    ).astype(str)
+    return app_sketch, daily_sketch
+
+
+def remove_sketch_kpis():
+    # So that stale approximate KPIs don't outlive the exact ones.
+    for path in (APP_SKETCH_OUT, DAILY_SKETCH_OUT):
+        if path.exists():
+            path.unlink()
+            print(f"Removed {path}")
 
-    app_kpis.to_csv(APP_KPI_OUT, index=False)
-    daily_kpis.to_csv(DAILY_KPI_OUT, index=False)
 
-    print(f"Wrote {APP_KPI_OUT}")
-    print(f"Wrote {DAILY_KPI_OUT}")
+def main():
+    with metrics.stage("serve") as m:
+        if INCREMENTAL and REVIEWS_IN.exists():
+            with metrics.step("compute_kpis_incremental"):
+                app_kpis, daily_kpis, app_daily = compute_kpis_incremental()
+            m.rows_in = m.counters.get("reviews_folded", 0)
+        elif PARALLEL:
+            with metrics.step("compute_kpis_parallel"):
+                app_kpis, daily_kpis, app_daily = compute_kpis_parallel()
+            m.rows_in = m.counters.get("reviews_folded", 0)
+        else:
+            with metrics.step("load_reviews"):
+                df, app_names = load_reviews()
+            m.rows_in = len(df)
+            m.count("reviews_frame_bytes", int(df.memory_usage(deep=True).sum()))
+            with metrics.step("compute_app_kpis"):
+                app_kpis = compute_app_kpis(df, app_names)
+            with metrics.step("compute_daily_kpis"):
+                daily_kpis = compute_daily_kpis(df)
+            with metrics.step("aggregate_app_daily"):
+                app_daily = aggregate_app_daily(df)
+
+        app_kpis = add_sentiment(app_kpis)
+        with metrics.step("write"):
+            kpi_cube = write_kpis(app_kpis, daily_kpis, app_daily)
+        m.rows_out = len(app_kpis) + len(daily_kpis)
+
+        print(f"Wrote {APP_KPI_OUT}")
+        print(f"Wrote {DAILY_KPI_OUT}")
+        print(f"Wrote {CUBE_OUT}")
+
+        if ALERTS:
+            with metrics.step("update_alerts"):
+                alerts = update_alerts(kpi_cube, app_kpis)
+            m.count("alerts", len(alerts))
+            print(f"Wrote {ALERTS_OUT} ({len(alerts)} new alerts)")
+
+        if SKETCH_KPIS:
+            with metrics.step("compute_sketch_kpis"):
+                app_sketch, daily_sketch = compute_sketch_kpis(load_app_names())
+            app_sketch.to_csv(APP_SKETCH_OUT, index=False)
+            daily_sketch.to_csv(DAILY_SKETCH_OUT, index=False)
+            print(f"Wrote {APP_SKETCH_OUT}")
+            print(f"Wrote {DAILY_SKETCH_OUT}")
+        else:
+            remove_sketch_kpis()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,619 @@
+import argparse
+import hashlib
+import json
+import re
+import shutil
+import time
+from bisect import bisect_left
+from functools import reduce
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Inverted index over review content, in row IDs of reviews.csv (0 = first
+# data row). Built by transform.py as reviews are written:
+#
+#   <root>/index.json           rows indexed, segment list, source signature
+#   <root>/seg-<base>[-<rows>]/ one segment per SEGMENT_ROWS rows (merged
+#                               segments are also named by their row count)
+#       meta.json               {"base": first row, "rows": n}
+#       terms.bin/.offsets.npy  sorted vocabulary (UTF-8, binary searched)
+#       postings.bin            per term: varint deltas of (row << 16 | pos)
+#       postings.offsets.npy    byte range of each term in postings.bin
+#       app.npy / apps.json     app code per row (-1 = none) and app ids
+#       score.npy               int8 score per row (SCORE_MISSING = none)
+#
+# Everything is memory-mapped; a query decodes only the posting lists of its
+# terms, one vectorized pass each. Row-local positions make phrase queries
+# an intersection of shifted keys. Incremental runs only tokenize rows after
+# the ones already indexed, as long as the raw input was only appended to.
+# Each such run adds a small segment; once MERGE_SEGMENTS segments are under
+# SEGMENT_ROWS rows, runs of adjacent small ones are merged into segments of
+# up to SEGMENT_ROWS rows.
+#
+# Query syntax: words are ANDed, "quoted phrases" match in order, -word or
+# -"phrase" excludes, and OR separates alternatives:
+#   transcription "speaker labels" -zoom OR diarization
+
+INDEX_META = "index.json"
+TOKEN_RE = re.compile(r"\w+")
+MAX_POS = 0xFFFF
+SCORE_MISSING = -128
+
+# Tweak these as needed
+SEGMENT_ROWS = 100_000
+MERGE_SEGMENTS = 4
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def varint_sizes(values):
+    sizes = np.ones(len(values), dtype=np.int8)
+    for k in range(1, 10):
+        sizes += values >= np.uint64(1 << (7 * k))
+    return sizes
+
+
+def varint_encode(values):
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = varint_sizes(values)
+    ends = np.cumsum(sizes, dtype=np.int64)
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    # Byte k of every value that has one; later passes only touch the few
+    # large values.
+    at = ends - sizes
+    idx = np.arange(len(values))
+    for k in range(int(sizes.max()) if len(sizes) else 0):
+        if k:
+            keep = sizes[idx] > k
+            idx = idx[keep]
+            at = at[keep] + 1
+        byte = (values[idx] >> np.uint64(7 * k)).astype(np.uint8) & 0x7F
+        out[at] = byte | ((sizes[idx] > k + 1).astype(np.uint8) << 7)
+    return out, sizes
+
+
+def varint_decode(buf):
+    b = np.asarray(buf, dtype=np.uint8)
+    if not len(b):
+        return np.empty(0, dtype=np.uint64)
+    ends = b < 0x80
+    value_starts = np.r_[0, np.flatnonzero(ends)[:-1] + 1]
+    value_id = np.cumsum(ends) - ends
+    shift = (np.arange(len(b)) - value_starts[value_id]) * 7
+    parts = (b & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(parts, value_starts)
+
+
+def unique_sorted(values):
+    if not len(values):
+        return values
+    return values[np.r_[True, values[1:] != values[:-1]]]
+
+
+def prefix_digest(f, size):
+    h = hashlib.sha256()
+    left = size
+    while left > 0:
+        chunk = f.read(min(left, 1 << 20))
+        if not chunk:
+            return None
+        h.update(chunk)
+        left -= len(chunk)
+    return h.hexdigest()
+
+
+def file_prefix_signature(path):
+    # Lets a later run check that `path` was only appended to since.
+    path = Path(path)
+    if not path.exists():
+        return None
+    size = path.stat().st_size
+    with path.open("rb") as f:
+        return {"path": str(path), "size": size, "sha256": prefix_digest(f, size)}
+
+
+def has_prefix(path, signature):
+    path = Path(path)
+    if signature is None or str(path) != signature["path"] or not path.exists():
+        return False
+    with path.open("rb") as f:
+        return prefix_digest(f, signature["size"]) == signature["sha256"]
+
+
+def read_meta(root):
+    path = Path(root) / INDEX_META
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_meta(root, meta):
+    path = Path(root) / INDEX_META
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+def segment_dir(root, base):
+    return Path(root) / f"seg-{base:012d}"
+
+
+def write_segment(path, base, rows, terms, codes, keys, app_codes, apps, scores):
+    # `codes` (indexes into `terms`) and `keys` are lists of chunks; every
+    # (code, key) pair is one token.
+    path.mkdir(parents=True)
+    order = np.argsort(np.array(terms, dtype=object), kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    term_codes = rank[np.concatenate(codes)] if codes else np.empty(0, np.int64)
+    keys = np.concatenate(keys) if keys else np.empty(0, np.uint64)
+    # Sort tokens by (term, key); packed into one uint64 when it fits, which
+    # avoids lexsort's index arrays.
+    key_bits = int(keys.max()).bit_length() if len(keys) else 1
+    if len(terms).bit_length() + key_bits <= 64:
+        packed = (term_codes.astype(np.uint64) << np.uint64(key_bits)) | keys
+        del term_codes, keys
+        packed.sort()
+        term_codes = packed >> np.uint64(key_bits)
+        keys = packed & np.uint64((1 << key_bits) - 1)
+        del packed
+    else:
+        sort = np.lexsort((keys, term_codes))
+        term_codes = term_codes[sort]
+        keys = keys[sort]
+        del sort
+
+    # Delta-encode each term's keys; the first key of a term is absolute.
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = term_codes[1:] != term_codes[:-1]
+    deltas = keys.copy()
+    deltas[1:] -= keys[:-1]
+    deltas[starts] = keys[starts]
+    del keys
+    blob, sizes = varint_encode(deltas)
+    del deltas
+    ends = np.r_[0, np.cumsum(sizes, dtype=np.int64)]
+    offsets = np.r_[ends[np.flatnonzero(starts)], ends[-1]].astype(np.int64)
+
+    sorted_terms = [terms[i].encode("utf-8") for i in order]
+    term_ends = np.cumsum([len(t) for t in sorted_terms], dtype=np.int64)
+    (path / "terms.bin").write_bytes(b"".join(sorted_terms))
+    np.save(path / "terms.offsets.npy", np.r_[0, term_ends].astype(np.int64))
+    blob.tofile(path / "postings.bin")
+    np.save(path / "postings.offsets.npy", offsets)
+    np.save(path / "app.npy", np.asarray(app_codes, dtype=np.int32))
+    np.save(path / "score.npy", np.asarray(scores, dtype=np.int8))
+    (path / "apps.json").write_text(json.dumps(apps), encoding="utf-8")
+    (path / "meta.json").write_text(
+        json.dumps({"base": base, "rows": rows}), encoding="utf-8"
+    )
+
+
+class IndexWriter:
+    # Rows go in with add() in output order; rows before `skip` are already
+    # indexed and only counted.
+    def __init__(self, root, source=None, skip=0, segments=()):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.source = source
+        self.segments = list(segments)
+        self.seen = 0
+        self.skip = skip
+        self.start_segment(skip)
+
+    @classmethod
+    def reset(cls, root):
+        root = Path(root)
+        if root.exists():
+            shutil.rmtree(root)
+
+    @classmethod
+    def open(cls, root, source):
+        # Continues the existing index if it was built from a prefix of the
+        # same source (same `source["selection"]`, raw file only appended
+        # to); otherwise starts over.
+        meta = read_meta(root)
+        if (
+            meta is not None
+            and source is not None
+            and meta["source"] is not None
+            and meta["source"]["selection"] == source["selection"]
+            and has_prefix(source["path"], meta["source"]["raw"])
+        ):
+            listed = set(meta["segments"])
+            for path in Path(root).glob("seg-*"):
+                if path.name not in listed:
+                    shutil.rmtree(path)
+            return cls(root, source, meta["rows"], meta["segments"])
+        cls.reset(root)
+        return cls(root, source)
+
+    def start_segment(self, base):
+        self.base = base
+        self.rows = 0
+        self.vocab = {}
+        self.codes = []
+        self.keys = []
+        self.app_ids = {}
+        self.app_codes = []
+        self.scores = []
+
+    def add(self, contents, app_ids, scores):
+        n = len(contents)
+        first = max(0, self.skip - self.seen)
+        self.seen += n
+        if first >= n:
+            return
+        contents = contents[first:]
+        app_ids = app_ids[first:]
+        scores = scores[first:]
+        while contents:
+            room = SEGMENT_ROWS - self.rows
+            self.add_rows(contents[:room], app_ids[:room], scores[:room])
+            contents = contents[room:]
+            app_ids = app_ids[room:]
+            scores = scores[room:]
+            if self.rows >= SEGMENT_ROWS:
+                self.flush_segment()
+
+    def add_rows(self, contents, app_ids, scores):
+        tokens = [tokenize(c) for c in contents]
+        counts = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        flat = list(chain.from_iterable(tokens))
+        if flat:
+            local, uniques = pd.factorize(pd.Series(flat, dtype=object))
+            vocab = self.vocab
+            mapping = np.fromiter(
+                (vocab.setdefault(t, len(vocab)) for t in uniques),
+                dtype=np.int64,
+                count=len(uniques),
+            )
+            rows = np.repeat(np.arange(self.rows, self.rows + len(tokens)), counts)
+            pos = np.arange(len(flat)) - np.repeat(np.cumsum(counts) - counts, counts)
+            keys = (rows.astype(np.uint64) << np.uint64(16)) | np.minimum(
+                pos, MAX_POS
+            ).astype(np.uint64)
+            self.codes.append(mapping[local])
+            self.keys.append(keys)
+        for app_id in app_ids:
+            if app_id is None:
+                self.app_codes.append(-1)
+            else:
+                self.app_codes.append(self.app_ids.setdefault(app_id, len(self.app_ids)))
+        self.scores.extend(SCORE_MISSING if s is None else s for s in scores)
+        self.rows += len(tokens)
+
+    def flush_segment(self):
+        if not self.rows:
+            return
+        path = segment_dir(self.root, self.base)
+        if path.exists():
+            shutil.rmtree(path)
+        write_segment(
+            path,
+            self.base,
+            self.rows,
+            list(self.vocab),
+            self.codes,
+            self.keys,
+            self.app_codes,
+            list(self.app_ids),
+            self.scores,
+        )
+        self.segments.append(path.name)
+        self.start_segment(self.base + self.rows)
+
+    def close(self):
+        self.flush_segment()
+        write_meta(
+            self.root,
+            {
+                "rows": max(self.seen, self.skip),
+                "segments": self.segments,
+                "source": self.source,
+            },
+        )
+        compact(self.root)
+        return max(0, self.seen - self.skip)
+
+
+def adopt(root, parts, source=None):
+    # Moves the segments of per-shard indexes (`parts`: [(part_root, base)]
+    # in row order) into `root`, shifting their row bases, and replaces
+    # `root`'s metadata. Used by transform.py's parallel mode.
+    IndexWriter.reset(root)
+    Path(root).mkdir(parents=True)
+    segments = []
+    rows = 0
+    for part_root, base in parts:
+        meta = read_meta(part_root)
+        for name in meta["segments"]:
+            seg_meta = json.loads((Path(part_root) / name / "meta.json").read_text())
+            seg_meta["base"] += base
+            target = segment_dir(root, seg_meta["base"])
+            (Path(part_root) / name).rename(target)
+            (target / "meta.json").write_text(json.dumps(seg_meta), encoding="utf-8")
+            segments.append(target.name)
+        rows = base + meta["rows"]
+        shutil.rmtree(part_root)
+    write_meta(root, {"rows": rows, "segments": segments, "source": source})
+    compact(root)
+
+
+def segment_postings(seg):
+    # (terms, term index per key, keys) of a whole segment, keys in term
+    # order.
+    terms = [seg.terms[i].decode("utf-8") for i in range(len(seg.terms))]
+    deltas = varint_decode(seg.postings)
+    ends = np.r_[0, np.cumsum(np.asarray(seg.postings) < 0x80)]
+    firsts = ends[np.asarray(seg.offsets)]
+    counts = np.diff(firsts)
+    # Each term's first key is absolute: cumulative sums, restarted per term.
+    total = np.cumsum(deltas, dtype=np.uint64)
+    before = np.r_[np.uint64(0), total][firsts[:-1]]
+    keys = total - np.repeat(before, counts)
+    return terms, np.repeat(np.arange(len(terms)), counts), keys
+
+
+def merge_segments(root, names):
+    # Writes one segment with the rows of `names` (adjacent, in row order)
+    # and returns its name.
+    segments = [Segment(Path(root) / name) for name in names]
+    vocab = {}
+    codes = []
+    keys = []
+    app_ids = {}
+    app_codes = []
+    scores = []
+    rows = 0
+    for seg in segments:
+        terms, term_index, seg_keys = segment_postings(seg)
+        mapping = np.fromiter(
+            (vocab.setdefault(t, len(vocab)) for t in terms),
+            dtype=np.int64,
+            count=len(terms),
+        )
+        codes.append(mapping[term_index])
+        keys.append(seg_keys + (np.uint64(rows) << np.uint64(16)))
+        apps = np.fromiter(
+            (app_ids.setdefault(a, len(app_ids)) for a in seg.apps),
+            dtype=np.int32,
+            count=len(seg.apps),
+        )
+        app = np.asarray(seg.app)
+        remapped = np.full(len(app), -1, dtype=np.int32)
+        remapped[app >= 0] = apps[app[app >= 0]]
+        app_codes.append(remapped)
+        scores.append(np.asarray(seg.score))
+        rows += seg.rows
+    path = segment_dir(root, segments[0].base)
+    path = path.with_name(f"{path.name}-{rows:012d}")
+    if path.exists():
+        shutil.rmtree(path)
+    write_segment(
+        path,
+        segments[0].base,
+        rows,
+        list(vocab),
+        codes,
+        keys,
+        np.concatenate(app_codes),
+        list(app_ids),
+        np.concatenate(scores),
+    )
+    return path.name
+
+
+def compact(root):
+    # Merges runs of adjacent segments under SEGMENT_ROWS rows (see
+    # MERGE_SEGMENTS). The merged segments are listed before the old ones
+    # are removed; IndexWriter.open drops whichever is left unlisted.
+    meta = read_meta(root)
+    sizes = [
+        json.loads((Path(root) / name / "meta.json").read_text())["rows"]
+        for name in meta["segments"]
+    ]
+    if sum(n < SEGMENT_ROWS for n in sizes) < MERGE_SEGMENTS:
+        return
+    runs = [[]]
+    run_rows = 0
+    for name, n in zip(meta["segments"], sizes):
+        if n >= SEGMENT_ROWS or run_rows + n > SEGMENT_ROWS:
+            runs.append([])
+            run_rows = 0
+        runs[-1].append(name)
+        run_rows += n
+    segments = []
+    merged = []
+    for run in runs:
+        if len(run) > 1:
+            segments.append(merge_segments(root, run))
+            merged.extend(run)
+        else:
+            segments.extend(run)
+    if not merged:
+        return
+    write_meta(root, dict(meta, segments=segments))
+    for name in merged:
+        shutil.rmtree(Path(root) / name)
+
+
+def map_bytes(path):
+    # np.memmap refuses empty files.
+    if not path.stat().st_size:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class TermList:
+    # Sorted UTF-8 vocabulary as a sequence of bytes, for bisect.
+    def __init__(self, path):
+        self.blob = map_bytes(path / "terms.bin")
+        self.offsets = np.load(path / "terms.offsets.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].tobytes()
+
+    def find(self, term):
+        key = term.encode("utf-8")
+        i = bisect_left(self, key)
+        return i if i < len(self) and self[i] == key else None
+
+
+class Segment:
+    def __init__(self, path):
+        meta = json.loads((path / "meta.json").read_text())
+        self.base = meta["base"]
+        self.rows = meta["rows"]
+        self.terms = TermList(path)
+        self.postings = map_bytes(path / "postings.bin")
+        self.offsets = np.load(path / "postings.offsets.npy", mmap_mode="r")
+        self.app = np.load(path / "app.npy", mmap_mode="r")
+        self.score = np.load(path / "score.npy", mmap_mode="r")
+        self.apps = json.loads((path / "apps.json").read_text(encoding="utf-8"))
+
+    def keys(self, term):
+        i = self.terms.find(term)
+        if i is None:
+            return np.empty(0, dtype=np.uint64)
+        deltas = varint_decode(self.postings[self.offsets[i] : self.offsets[i + 1]])
+        return np.cumsum(deltas, dtype=np.uint64)
+
+    def docs(self, terms):
+        # Local rows containing `terms` as a phrase (one term: anywhere).
+        keys = self.keys(terms[0])
+        for shift, term in enumerate(terms[1:], start=1):
+            if not len(keys):
+                break
+            nxt = self.keys(term)
+            nxt = nxt[(nxt & np.uint64(MAX_POS)) >= shift] - np.uint64(shift)
+            keys = np.intersect1d(keys, nxt, assume_unique=True)
+        return unique_sorted((keys >> np.uint64(16)).astype(np.int64))
+
+    def match(self, groups):
+        found = []
+        for group in groups:
+            include = [self.docs(terms) for negate, terms in group if not negate]
+            if include:
+                docs = reduce(
+                    lambda a, b: np.intersect1d(a, b, assume_unique=True),
+                    sorted(include, key=len),
+                )
+            else:
+                docs = np.arange(self.rows, dtype=np.int64)
+            for negate, terms in group:
+                if negate and len(docs):
+                    docs = np.setdiff1d(docs, self.docs(terms), assume_unique=True)
+            found.append(docs)
+        return reduce(np.union1d, found) if found else np.empty(0, np.int64)
+
+    def filter(self, docs, app_ids=None, min_score=None, max_score=None):
+        if app_ids is not None:
+            codes = [i for i, app_id in enumerate(self.apps) if app_id in app_ids]
+            docs = docs[np.isin(self.app[docs], codes)]
+        if min_score is not None or max_score is not None:
+            score = self.score[docs]
+            keep = score != SCORE_MISSING
+            if min_score is not None:
+                keep &= score >= min_score
+            if max_score is not None:
+                keep &= score <= max_score
+            docs = docs[keep]
+        return docs
+
+
+def by_count(counts):
+    return dict(sorted(counts.items(), key=lambda kv: -kv[1]))
+
+
+def parse_query(text):
+    # -> [[(negate, (term, ...)), ...], ...]: OR of ANDed (phrase) clauses.
+    groups = [[]]
+    for m in re.finditer(r'(-?)"([^"]*)"|(\S+)', text):
+        if m.group(3) == "OR":
+            groups.append([])
+            continue
+        if m.group(3) is not None:
+            word = m.group(3)
+            negate = word.startswith("-") and len(word) > 1
+            terms = tokenize(word[1:] if negate else word)
+        else:
+            negate = m.group(1) == "-"
+            terms = tokenize(m.group(2))
+        if terms:
+            groups[-1].append((negate, tuple(terms)))
+    return [g for g in groups if g]
+
+
+class ReviewIndex:
+    def __init__(self, root):
+        self.root = Path(root)
+        meta = read_meta(self.root)
+        if meta is None:
+            raise FileNotFoundError(f"No review index at {self.root}")
+        self.rows = meta["rows"]
+        self.segments = [Segment(self.root / name) for name in meta["segments"]]
+
+    def search(self, query, app_ids=None, min_score=None, max_score=None):
+        # Row IDs (into reviews.csv) of the matching reviews, ascending.
+        groups = parse_query(query)
+        if app_ids is not None:
+            app_ids = set(app_ids)
+        found = []
+        for seg in self.segments:
+            docs = seg.filter(seg.match(groups), app_ids, min_score, max_score)
+            found.append(docs + seg.base)
+        return np.concatenate(found) if found else np.empty(0, np.int64)
+
+    def facets(self, rows):
+        # ({app_id: count}, {score: count}) over `rows`, largest first.
+        apps = {}
+        scores = {}
+        for seg in self.segments:
+            local = rows[(rows >= seg.base) & (rows < seg.base + seg.rows)] - seg.base
+            if not len(local):
+                continue
+            codes, counts = np.unique(seg.app[local], return_counts=True)
+            for code, n in zip(codes, counts):
+                app_id = None if code < 0 else seg.apps[code]
+                apps[app_id] = apps.get(app_id, 0) + int(n)
+            values, counts = np.unique(seg.score[local], return_counts=True)
+            for value, n in zip(values, counts):
+                key = None if value == SCORE_MISSING else int(value)
+                scores[key] = scores.get(key, 0) + int(n)
+        return by_count(apps), by_count(scores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the review text index")
+    parser.add_argument("query")
+    parser.add_argument("--index", default="data/processed/review_index")
+    parser.add_argument("--app", action="append", dest="apps")
+    parser.add_argument("--min-score", type=int)
+    parser.add_argument("--max-score", type=int)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    index = ReviewIndex(args.index)
+    started = time.perf_counter()
+    rows = index.search(args.query, args.apps, args.min_score, args.max_score)
+    elapsed = time.perf_counter() - started
+    apps, scores = index.facets(rows)
+    print(f"{len(rows)} of {index.rows} reviews match ({elapsed * 1000:.1f} ms)")
+    for app_id, n in list(apps.items())[: args.top]:
+        print(f"  {n:>8}  {app_id}")
+    print("  scores: " + ", ".join(f"{k}: {v}" for k, v in scores.items()))
+    print(f"  first rows: {rows[: args.top].tolist()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,22 @@
+import calendar
 import csv
 import json
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
+import colstore
+import metrics
+import rawlog
+import textindex
+from dedup import ReviewIdIndex
+from schema import Decoder, Field, Quarantine
+
 
 # Issues observed in raw data (at least five):
 # 1) Nested and non-tabular fields (e.g., categories, screenshots, histogram).
@@ -11,171 +25,595 @@ from pathlib import Path
 # 4) Timestamps stored as strings without explicit timezone (e.g., review "at").
 # 5) Reviews lack app name, only appId; requires join with apps dataset.
 # 6) HTML / long text fields (descriptionHTML) are not analytics-friendly as-is.
-# 7) Potential duplicates and inconsistent identifiers across apps/reviews.
+# 7) Potential duplicates and inconsistent identifiers across apps/reviews
+#    (duplicate reviewIds are dropped, see DEDUP_REVIEWS).
+# 8) Malformed values (e.g. a score of "five", a timestamp that doesn't
+#    parse); such rows are quarantined, see APP_SCHEMA / REVIEW_SCHEMA.
 
 
-RAW_DIR = Path("data/raw")
+# Read one market partition written by ingest_queue.py (e.g. "en-gb",
+# under data/raw/markets/) instead of the files directly in data/raw.
+MARKET = None
+RAW_DIR = Path("data/raw") if MARKET is None else Path("data/raw/markets") / MARKET
 PROCESSED_DIR = Path("data/processed")
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
 APPS_IN = RAW_DIR / "apps.jsonl"
+# Segmented review log written by ingest.py (see rawlog.py). A plain
+# reviews.jsonl (older runs, bench/generate.py) is read when there is no log.
+REVIEWS_LOG = RAW_DIR / "reviews_log"
 REVIEWS_IN = RAW_DIR / "reviews.jsonl"
 
+# Only transform the reviews of these appIds and/or with
+# REVIEWS_SINCE <= at < REVIEWS_UNTIL (e.g. "2025-01-01"); None = all. With
+# the log, only the matching blocks are read.
+REVIEW_APPS = None
+REVIEWS_SINCE = None
+REVIEWS_UNTIL = None
+
 APPS_OUT = PROCESSED_DIR / "apps.csv"
 REVIEWS_OUT = PROCESSED_DIR / "reviews.csv"
 
+# Rows are streamed from the raw files to the CSV writers; at most this many
+# converted rows are held in memory at once.
+BATCH_SIZE = 5000
+
+# Inverted index over review content (see textindex.py), in reviews.csv row
+# IDs with app_id and score facets. When the raw reviews were only appended
+# to since the last run, only the new rows are indexed; parallel runs
+# rebuild it.
+TEXT_INDEX = True
+TEXT_INDEX_DIR = PROCESSED_DIR / "review_index"
+
+# Drop repeated reviewIds (overlapping pages, re-ingested batches), keeping
+# the first. The index is rebuilt on every run. In parallel mode each shard
+# dedups against its own index; the shard indexes are then merged in input
+# order and shards holding IDs of earlier shards are converted once more
+# with those IDs marked as seen, so the output is the same as sequentially.
+DEDUP_REVIEWS = True
+REVIEW_ID_INDEX = PROCESSED_DIR / "review_ids"
+
+# Parallel mode: the log's blocks (or reviews.jsonl, in newline-aligned byte
+# ranges) are split into shards of about SHARD_BYTES uncompressed that are
+# converted by a process pool. SHARD_OUTPUT "concat" writes one
+# reviews.csv in input order; "parts" keeps one CSV per shard instead.
+PARALLEL = False
+WORKERS = os.cpu_count() or 1
+SHARD_BYTES = 64 * 1024 * 1024
+SHARD_OUTPUT = "concat"
+REVIEWS_PARTS_DIR = PROCESSED_DIR / "reviews_parts"
+
+# Output formats for reviews: "csv" (reviews.csv) and/or "columnar", an
+# app-partitioned column store with typed columns (see colstore.py) that
+# serve.py reads in preference to the CSV.
+REVIEWS_FORMATS = ("csv",)
+REVIEWS_COLUMNAR = PROCESSED_DIR / "reviews_columnar"
+COLUMNAR_PART_ROWS = 100_000
+REVIEW_COLUMNS = {
+    "reviewId": "str",
+    "userName": "str",
+    "content": "str",
+    "score": "int8",
+    "thumbsUpCount": "int32",
+    "at": "int64",
+    "content_length": "int32",
+}
+
+# Raw apps and reviews are decoded in batches by these schemas (see
+# schema.py). Rows that fail them are written to QUARANTINE_DIR as
+# apps.jsonl / reviews.jsonl (reviews-<shard>.jsonl in parallel mode) with
+# their reason, and the counts per reason to summary.json.
+APP_SCHEMA = {
+    "appId": Field("str", required=True),
+    "title": Field("str"),
+    "developer": Field("str"),
+    "score": Field("float", min=0, max=5),
+    "ratings": Field("count", min=0),
+    "installs": Field("count", min=0),
+    "genre": Field("str"),
+    "price": Field("float", min=0),
+}
+REVIEW_SCHEMA = {
+    "app_id": Field("str", source="appId", required=True),
+    "reviewId": Field("str", required=True),
+    "userName": Field("str"),
+    "score": Field("int", min=1, max=5),
+    "content": Field("str"),
+    "thumbsUpCount": Field("int", min=0),
+    "at": Field("timestamp"),
+}
+QUARANTINE_DIR = PROCESSED_DIR / "quarantine"
+APP_DECODER = Decoder(APP_SCHEMA)
+REVIEW_DECODER = Decoder(REVIEW_SCHEMA)
+
+APP_FIELDS = list(APP_SCHEMA)
+REVIEW_FIELDS = [
+    "app_id",
+    "app_name",
+    "reviewId",
+    "userName",
+    "score",
+    "content",
+    "thumbsUpCount",
+    "at",
+]
+
+
+def read_jsonl(path):
+    with path.open("rb") as f:
+        for lines in batched(f, BATCH_SIZE):
+            yield from rawlog.decode_lines(lines)
+
+
+def select_reviews(rows, app_ids=None, since=None, until=None):
+    if app_ids is not None:
+        app_ids = set(app_ids)
+    for obj in rows:
+        if not isinstance(obj, dict):
+            yield obj  # quarantined by the decoder
+            continue
+        if app_ids is not None and obj.get("appId") not in app_ids:
+            continue
+        if rawlog.in_range(rawlog.row_time(obj), since, until):
+            yield obj
+
+
+def read_reviews(app_ids=None, since=None, until=None):
+    if rawlog.exists(REVIEWS_LOG):
+        return rawlog.read(REVIEWS_LOG, app_ids, since, until)
+    return select_reviews(read_jsonl(REVIEWS_IN), app_ids, since, until)
+
+
+def batched(rows, size):
+    it = iter(rows)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_csv(path, fieldnames, rows):
+    written = 0
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for batch in batched(rows, BATCH_SIZE):
+            writer.writerows(batch)
+            written += len(batch)
+    return written
+
+
+def clear_quarantine():
+    if QUARANTINE_DIR.exists():
+        shutil.rmtree(QUARANTINE_DIR)
 
-def parse_int(value):
-    if value is None:
+
+def report_quarantine(kind, counts):
+    # Adds `kind`'s reason counts to the summary and prints them.
+    total = sum(counts.values())
+    metrics.count(f"{kind}_quarantined", total)
+    if not total:
+        return
+    summary_path = QUARANTINE_DIR / "summary.json"
+    summary = {}
+    if summary_path.exists():
+        summary = json.loads(summary_path.read_text(encoding="utf-8"))
+    summary[kind] = {"rows": total, "reasons": dict(counts.most_common())}
+    summary_path.write_text(json.dumps(summary, indent=1), encoding="utf-8")
+    reasons = ", ".join(f"{reason}: {n}" for reason, n in counts.most_common(5))
+    print(f"Quarantined {total} {kind} to {QUARANTINE_DIR} ({reasons})")
+
+
+def decode_reviews(objs, app_name_by_id, quarantine):
+    # Raw review objects -> batches of REVIEW_FIELDS rows.
+    for batch in batched(objs, BATCH_SIZE):
+        rows, rejects = REVIEW_DECODER.decode(batch)
+        quarantine.add(rejects)
+        for row in rows:
+            row["app_name"] = app_name_by_id.get(row["app_id"])
+        yield rows
+
+
+def transform_apps():
+    # ingest_queue.py appends a fresh snapshot each time it refetches an
+    # app; the last one of each appId wins.
+    rows = {}
+    quarantine = Quarantine(QUARANTINE_DIR / "apps.jsonl")
+    for batch in batched(read_jsonl(APPS_IN), BATCH_SIZE):
+        decoded, rejects = APP_DECODER.decode(batch)
+        quarantine.add(rejects)
+        for row in decoded:
+            rows[row["appId"]] = row
+    report_quarantine("apps", quarantine.close())
+    write_csv(APPS_OUT, APP_FIELDS, rows.values())
+    return {app_id: row["title"] for app_id, row in rows.items()}
+
+
+def timestamp_to_epoch(value):
+    # `value` is a normalized "%Y-%m-%d %H:%M:%S" string, read as UTC.
+    if not value:
         return None
-    if isinstance(value, bool):
-        return int(value)
-    if isinstance(value, int):
-        return value
-    if isinstance(value, float):
-        return int(value)
-    if isinstance(value, str):
-        cleaned = value.replace(",", "").replace("+", "").strip()
-        if cleaned == "":
-            return None
-        try:
-            return int(cleaned)
-        except ValueError:
-            return None
-    return None
-
-
-def parse_float(value):
-    if value is None:
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
         return None
-    if isinstance(value, bool):
-        return float(int(value))
-    if isinstance(value, (int, float)):
-        return float(value)
-    if isinstance(value, str):
-        cleaned = value.replace(",", "").replace("+", "").strip()
-        if cleaned == "":
-            return None
-        try:
-            return float(cleaned)
-        except ValueError:
-            return None
-    return None
-
-
-def normalize_timestamp(value):
-    if not value:
+    return calendar.timegm(dt.timetuple())
+
+
+def columnar_row(row):
+    content = row["content"]
+    return {
+        "reviewId": row["reviewId"],
+        "userName": row["userName"],
+        "content": content,
+        "score": row["score"],
+        "thumbsUpCount": row["thumbsUpCount"],
+        "at": timestamp_to_epoch(row["at"]),
+        "content_length": len(content.strip()) if content else 0,
+    }
+
+
+def write_reviews(
+    batches,
+    csv_path=None,
+    columnar=None,
+    header=True,
+    dedup=None,
+    memory=None,
+    text_index=None,
+):
+    written = 0
+    with ExitStack() as stack:
+        writer = None
+        if csv_path is not None:
+            f = stack.enter_context(csv_path.open("w", newline="", encoding="utf-8"))
+            writer = csv.DictWriter(f, fieldnames=REVIEW_FIELDS)
+            if header:
+                writer.writeheader()
+        for batch in batches:
+            if dedup is not None:
+                batch = dedup.filter_new(batch)
+            if writer is not None:
+                writer.writerows(batch)
+            if text_index is not None:
+                text_index.add(
+                    [row["content"] for row in batch],
+                    [row["app_id"] for row in batch],
+                    [row["score"] for row in batch],
+                )
+            if columnar is not None or memory is not None:
+                for row in batch:
+                    typed = columnar_row(row)
+                    if columnar is not None:
+                        columnar.add(row["app_id"], typed)
+                    if memory is not None:
+                        memory.add(row["app_id"], typed)
+            if dedup is not None:
+                dedup.commit()
+            written += len(batch)
+    if columnar is not None:
+        columnar.flush()
+    return written
+
+
+def columnar_writer(prefix="part-00000"):
+    if "columnar" not in REVIEWS_FORMATS:
         return None
-    if isinstance(value, datetime):
-        return value.strftime("%Y-%m-%d %H:%M:%S")
-    if isinstance(value, str):
-        try:
-            dt = datetime.fromisoformat(value)
-            return dt.strftime("%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            return value
-    return str(value)
+    return colstore.PartitionedWriter(
+        REVIEWS_COLUMNAR, REVIEW_COLUMNS, COLUMNAR_PART_ROWS, prefix=prefix
+    )
 
 
-def read_jsonl(path):
-    with path.open(encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            yield json.loads(line)
+def prepare_outputs(app_name_by_id):
+    clear_review_parts()
+    if not TEXT_INDEX:
+        textindex.IndexWriter.reset(TEXT_INDEX_DIR)
+    if REVIEWS_COLUMNAR.exists():
+        shutil.rmtree(REVIEWS_COLUMNAR)
+    if "columnar" in REVIEWS_FORMATS:
+        colstore.write_meta(REVIEWS_COLUMNAR, REVIEW_COLUMNS, app_name_by_id)
+    if "csv" not in REVIEWS_FORMATS:
+        REVIEWS_OUT.unlink(missing_ok=True)
 
 
-def transform_apps():
-    apps_rows = []
-    app_name_by_id = {}
-
-    for obj in read_jsonl(APPS_IN):
-        app_id = obj.get("appId")
-        title = obj.get("title")
-        developer = obj.get("developer")
-        score = parse_float(obj.get("score"))
-        ratings = parse_int(obj.get("ratings"))
-        installs = parse_int(obj.get("installs"))
-        genre = obj.get("genre")
-        price = parse_float(obj.get("price"))
-
-        if app_id:
-            app_name_by_id[app_id] = title
-
-        apps_rows.append(
-            {
-                "appId": app_id,
-                "title": title,
-                "developer": developer,
-                "score": score,
-                "ratings": ratings,
-                "installs": installs,
-                "genre": genre,
-                "price": price,
-            }
-        )
-
-    with APPS_OUT.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
-                "appId",
-                "title",
-                "developer",
-                "score",
-                "ratings",
-                "installs",
-                "genre",
-                "price",
-            ],
-        )
-        writer.writeheader()
-        writer.writerows(apps_rows)
-
-    return app_name_by_id
-
-
-def transform_reviews(app_name_by_id):
-    reviews_rows = []
-    for obj in read_jsonl(REVIEWS_IN):
-        app_id = obj.get("appId")
-        reviews_rows.append(
-            {
-                "app_id": app_id,
-                "app_name": app_name_by_id.get(app_id),
-                "reviewId": obj.get("reviewId"),
-                "userName": obj.get("userName"),
-                "score": parse_int(obj.get("score")),
-                "content": obj.get("content"),
-                "thumbsUpCount": parse_int(obj.get("thumbsUpCount")),
-                "at": normalize_timestamp(obj.get("at")),
-            }
-        )
-
-    with REVIEWS_OUT.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
-                "app_id",
-                "app_name",
-                "reviewId",
-                "userName",
-                "score",
-                "content",
-                "thumbsUpCount",
-                "at",
-            ],
-        )
-        writer.writeheader()
-        writer.writerows(reviews_rows)
+def open_dedup_index(path):
+    if not DEDUP_REVIEWS:
+        return None
+    ReviewIdIndex.reset(path)
+    return ReviewIdIndex(path)
 
 
-def main():
+def close_dedup_index(dedup, path):
+    if dedup is None:
+        return 0
+    dropped = dedup.dropped
+    dedup.close()
+    ReviewIdIndex.reset(path)
+    return dropped
+
+
+def text_index_source():
+    # What the index's row IDs depend on: the raw reviews (checked to be
+    # only appended to) and the row selection.
+    raw = REVIEWS_LOG / rawlog.INDEX_NAME if rawlog.exists(REVIEWS_LOG) else REVIEWS_IN
+    return {
+        "path": str(raw),
+        "raw": textindex.file_prefix_signature(raw),
+        "selection": {
+            "apps": REVIEW_APPS,
+            "since": REVIEWS_SINCE,
+            "until": REVIEWS_UNTIL,
+            "dedup": DEDUP_REVIEWS,
+        },
+    }
+
+
+def open_text_index():
+    if not TEXT_INDEX:
+        return None
+    return textindex.IndexWriter.open(TEXT_INDEX_DIR, text_index_source())
+
+
+def transform_reviews(app_name_by_id, memory=None, write_csv=True):
+    # -> (written, duplicates dropped, quarantined)
+    reviews = read_reviews(REVIEW_APPS, REVIEWS_SINCE, REVIEWS_UNTIL)
+    quarantine = Quarantine(QUARANTINE_DIR / "reviews.jsonl")
+    batches = decode_reviews(reviews, app_name_by_id, quarantine)
+    csv_path = REVIEWS_OUT if write_csv and "csv" in REVIEWS_FORMATS else None
+    dedup = open_dedup_index(REVIEW_ID_INDEX)
+    text_index = open_text_index()
+    written = write_reviews(
+        batches,
+        csv_path,
+        columnar_writer(),
+        dedup=dedup,
+        memory=memory,
+        text_index=text_index,
+    )
+    if text_index is not None:
+        indexed = text_index.close()
+        metrics.count("reviews_indexed", indexed)
+        print(f"Indexed {indexed} new reviews in {TEXT_INDEX_DIR}")
+    quarantined = quarantine.close()
+    report_quarantine("reviews", quarantined)
+    return written, close_dedup_index(dedup, REVIEW_ID_INDEX), sum(quarantined.values())
+
+
+def transform_to_table(columns, write_csv=True):
+    # In-process run mode: also keeps `columns` of the typed review schema in
+    # memory and returns them in colstore.read_table's layout, so serve can
+    # use them without re-reading reviews.csv. With write_csv=False the
+    # reviews CSV is not written at all. `dropped` counts duplicate and
+    # quarantined reviews.
+    clear_quarantine()
     app_name_by_id = transform_apps()
-    transform_reviews(app_name_by_id)
-    print(f"Wrote {APPS_OUT}")
-    print(f"Wrote {REVIEWS_OUT}")
+    prepare_outputs(app_name_by_id)
+    if not write_csv:
+        REVIEWS_OUT.unlink(missing_ok=True)
+    memory = colstore.MemoryTable(REVIEW_COLUMNS, columns)
+    written, duplicates, quarantined = transform_reviews(app_name_by_id, memory, write_csv)
+    return memory.table(), app_name_by_id, written, duplicates + quarantined
+
+
+def read_lines_range(f, start, end):
+    f.seek(start)
+    pos = start
+    while pos < end:
+        line = f.readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line
+
+
+def read_jsonl_range(path, start, end):
+    with path.open("rb") as f:
+        for lines in batched(read_lines_range(f, start, end), BATCH_SIZE):
+            yield from rawlog.decode_lines(lines)
+
+
+def shard_ranges(path, shard_bytes):
+    size = path.stat().st_size
+    ranges = []
+    with path.open("rb") as f:
+        start = 0
+        while start < size:
+            end = min(start + shard_bytes, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def read_jsonl_shard(path, start, end, app_ids=None, since=None, until=None):
+    return select_reviews(read_jsonl_range(path, start, end), app_ids, since, until)
+
+
+def review_shards(shard_bytes, app_ids=None, since=None, until=None):
+    # One (reader, args) per shard; reader(*args) yields raw review objects.
+    if not rawlog.exists(REVIEWS_LOG):
+        return [
+            (read_jsonl_shard, (REVIEWS_IN, start, end, app_ids, since, until))
+            for start, end in shard_ranges(REVIEWS_IN, shard_bytes)
+        ]
+    entries, _ = rawlog.read_index(REVIEWS_LOG)
+    shards = [[]]
+    size = 0
+    for block in rawlog.select_blocks(entries, app_ids, since, until):
+        if size >= shard_bytes:
+            shards.append([])
+            size = 0
+        shards[-1].append(block)
+        size += block["raw_bytes"]
+    return [
+        (rawlog.read_blocks, (REVIEWS_LOG, blocks, since, until))
+        for blocks in shards
+        if blocks
+    ]
+
+
+_worker_app_names = {}
+
+
+def _init_worker(app_name_by_id):
+    # Sent once per worker process instead of once per shard.
+    global _worker_app_names
+    _worker_app_names = app_name_by_id
+
+
+def shard_text_index(index):
+    if not TEXT_INDEX:
+        return None
+    return TEXT_INDEX_DIR.with_name(f"{TEXT_INDEX_DIR.name}-{index:05d}")
+
+
+def shard_dedup_index(index):
+    return REVIEW_ID_INDEX.with_name(f"{REVIEW_ID_INDEX.name}-{index:05d}")
+
+
+def convert_shard(reader, args, index, out_path, header, seen=()):
+    # `seen`: reviewIds to drop as already kept by earlier shards. The
+    # shard's dedup index is left on disk for cross_shard_duplicates.
+    quarantine = Quarantine(QUARANTINE_DIR / f"reviews-{index:05d}.jsonl")
+    batches = decode_reviews(reader(*args), _worker_app_names, quarantine)
+    dedup = open_dedup_index(shard_dedup_index(index))
+    if dedup is not None and seen:
+        dedup.mark_seen(seen)
+        dedup.commit()
+    text_index = None
+    if TEXT_INDEX:
+        textindex.IndexWriter.reset(shard_text_index(index))
+        text_index = textindex.IndexWriter(shard_text_index(index))
+    if REVIEWS_COLUMNAR.exists():
+        for part in REVIEWS_COLUMNAR.glob(f"*/part-{index:05d}-*"):
+            shutil.rmtree(part)
+    written = write_reviews(
+        batches,
+        out_path,
+        columnar_writer(f"part-{index:05d}"),
+        header,
+        dedup,
+        text_index=text_index,
+    )
+    if text_index is not None:
+        text_index.close()
+    dropped = 0
+    if dedup is not None:
+        dropped = dedup.dropped
+        dedup.close()
+    return written, dropped, quarantine.close()
+
+
+def cross_shard_duplicates(count):
+    # -> {shard: reviewIds kept by an earlier shard}, merging the shard
+    # indexes into REVIEW_ID_INDEX in input order.
+    if not DEDUP_REVIEWS:
+        return {}
+    shared = open_dedup_index(REVIEW_ID_INDEX)
+    repeated = {}
+    for index in range(count):
+        seen = shared.absorb(shard_dedup_index(index))
+        if seen:
+            repeated[index] = seen
+    close_dedup_index(shared, REVIEW_ID_INDEX)
+    return repeated
+
+
+def clear_review_parts():
+    if REVIEWS_PARTS_DIR.exists():
+        shutil.rmtree(REVIEWS_PARTS_DIR)
+
+
+def transform_reviews_parallel(app_name_by_id):
+    shards = review_shards(SHARD_BYTES, REVIEW_APPS, REVIEWS_SINCE, REVIEWS_UNTIL)
+    write_csv_parts = "csv" in REVIEWS_FORMATS
+    keep_parts = SHARD_OUTPUT == "parts"
+    part_paths = [
+        REVIEWS_PARTS_DIR / f"reviews-{i:05d}.csv" if write_csv_parts else None
+        for i in range(len(shards))
+    ]
+    if write_csv_parts:
+        REVIEWS_PARTS_DIR.mkdir(parents=True)
+
+    with ProcessPoolExecutor(
+        max_workers=WORKERS, initializer=_init_worker, initargs=(app_name_by_id,)
+    ) as pool:
+        futures = [
+            pool.submit(convert_shard, reader, args, i, part, keep_parts)
+            for i, ((reader, args), part) in enumerate(zip(shards, part_paths))
+        ]
+        results = [fut.result() for fut in futures]
+        repeated = cross_shard_duplicates(len(shards))
+        futures = {
+            i: pool.submit(convert_shard, *shards[i], i, part_paths[i], keep_parts, seen)
+            for i, seen in repeated.items()
+        }
+        for i, fut in futures.items():
+            results[i] = fut.result()
+    for i in range(len(shards)):
+        ReviewIdIndex.reset(shard_dedup_index(i))
+    cross_shard = sum(len(seen) for seen in repeated.values())
+    metrics.count("cross_shard_duplicates", cross_shard)
+    written = sum(r[0] for r in results)
+    dropped = sum(r[1] for r in results)
+    quarantined = sum((r[2] for r in results), Counter())
+    report_quarantine("reviews", quarantined)
+    if TEXT_INDEX:
+        bases = [0]
+        for rows, _, _ in results[:-1]:
+            bases.append(bases[-1] + rows)
+        parts = [(shard_text_index(i), base) for i, base in enumerate(bases)]
+        textindex.adopt(TEXT_INDEX_DIR, parts[: len(results)], text_index_source())
+        metrics.count("reviews_indexed", written)
+        print(f"Indexed {written} reviews in {TEXT_INDEX_DIR}")
+
+    if not write_csv_parts:
+        return written, dropped, sum(quarantined.values())
+    if keep_parts:
+        REVIEWS_OUT.unlink(missing_ok=True)
+        return written, dropped, sum(quarantined.values())
+
+    with REVIEWS_OUT.open("w", newline="", encoding="utf-8") as out:
+        csv.DictWriter(out, fieldnames=REVIEW_FIELDS).writeheader()
+        for part in part_paths:
+            with part.open(encoding="utf-8", newline="") as f:
+                shutil.copyfileobj(f, out)
+    clear_review_parts()
+    return written, dropped, sum(quarantined.values())
+
+
+def main():
+    with metrics.stage("transform") as m:
+        with metrics.step("transform_apps"):
+            clear_quarantine()
+            app_name_by_id = transform_apps()
+            prepare_outputs(app_name_by_id)
+        with metrics.step("transform_reviews"):
+            if PARALLEL:
+                reviews_written, duplicates, quarantined = transform_reviews_parallel(
+                    app_name_by_id
+                )
+            else:
+                reviews_written, duplicates, quarantined = transform_reviews(
+                    app_name_by_id
+                )
+        m.rows_in = reviews_written + duplicates + quarantined
+        m.rows_out = reviews_written
+
+        print(f"Wrote {APPS_OUT}")
+        if "csv" in REVIEWS_FORMATS:
+            if PARALLEL and SHARD_OUTPUT == "parts":
+                print(f"Wrote {reviews_written} reviews to {REVIEWS_PARTS_DIR}")
+            else:
+                print(f"Wrote {reviews_written} reviews to {REVIEWS_OUT}")
+        if "columnar" in REVIEWS_FORMATS:
+            print(f"Wrote {reviews_written} reviews to {REVIEWS_COLUMNAR}")
+        if DEDUP_REVIEWS:
+            print(f"Dropped {duplicates} duplicate reviews")
 
 
 if __name__ == "__main__":
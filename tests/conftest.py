@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# The pipeline scripts import each other as top-level modules; the scraper
+# is the offline stub the benchmarks use.
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "bench" / "stub"))
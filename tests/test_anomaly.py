@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+import anomaly
+
+
+# Epoch day of 2026-01-01.
+DAY0 = 20454
+# 10 rated reviews a day averaging 4.4 / 4.6.
+STEADY = [44, 46] * 10
+
+
+def make_cube(reviews, score_sum, day0=DAY0):
+    # One row per app (app0, app1, ...); every review is scored.
+    reviews = np.atleast_2d(np.asarray(reviews, dtype=np.int32))
+    score_sum = np.atleast_2d(np.asarray(score_sum, dtype=np.int32))
+    return {
+        "app_ids": np.array([f"app{i}" for i in range(len(reviews))]),
+        "day0": np.int64(day0),
+        "reviews": reviews,
+        "score_count": reviews,
+        "score_sum": score_sum,
+    }
+
+
+def run(reviews, score_sum, state=None):
+    state = anomaly.empty_state() if state is None else state
+    return anomaly.update(state, make_cube(reviews, score_sum))
+
+
+def date(col):
+    return str(np.datetime64(DAY0 + col, "D"))
+
+
+def test_nothing_is_flagged_during_warmup():
+    days = anomaly.WARMUP_DAYS
+    sums = STEADY[: days - 2] + [10, 46, 44]
+    _, alerts = run([10] * len(sums), sums)
+    assert alerts.empty
+
+
+def test_rating_drop():
+    sums = STEADY + [20, 45]
+    state, alerts = run([10] * len(sums), sums)
+    assert alerts[["date", "app_id", "metric", "rule", "provisional"]].to_dict(
+        "records"
+    ) == [
+        {
+            "date": date(20),
+            "app_id": "app0",
+            "metric": "rating",
+            "rule": "z+cusum",
+            "provisional": False,
+        }
+    ]
+    row = alerts.iloc[0]
+    assert row["value"] == 2.0 and abs(row["expected"] - 4.5) < 0.1
+    assert row["z_score"] <= -anomaly.Z_THRESHOLD
+
+
+def test_volume_spike_needs_min_spike_reviews():
+    # Two apps, quiet (1 review a day) and busy (10): both see 9x reviews.
+    quiet = [1] * 20 + [9, 1]
+    busy = [10] * 20 + [90, 10]
+    _, alerts = run([quiet, busy], [[5 * n for n in quiet], [5 * n for n in busy]])
+    spikes = alerts[alerts["metric"] == "volume"]
+    assert spikes[["date", "app_id"]].values.tolist() == [[date(20), "app1"]]
+    assert spikes.iloc[0]["value"] == 90.0
+    assert anomaly.MIN_SPIKE_REVIEWS > 9
+
+
+def test_cusum_alert_starts_over():
+    # A small sustained drop (4.5 -> 4.3) never crosses the z threshold.
+    sums = STEADY + [43] * 15 + [45]
+    _, alerts = run([10] * len(sums), sums)
+    assert alerts[["date", "metric", "rule"]].values.tolist() == [
+        [date(26), "rating", "cusum"]
+    ]
+    assert alerts.iloc[0]["cusum"] > anomaly.CUSUM_H
+    # Up to the alert's day (folded) and one more.
+    state, _ = run([10] * 28, sums[:28])
+    assert state["rating"]["cusum"].tolist() == [0.0]
+
+
+def test_newest_day_is_provisional_until_a_later_run():
+    sums = STEADY + [20]
+    state, alerts = run([10] * len(sums), sums)
+    assert alerts[["date", "provisional"]].values.tolist() == [[date(20), True]]
+    # Checked, not folded.
+    assert state["last_day"].tolist() == [DAY0 + 19]
+    assert state["rating"]["n"].tolist() == [20]
+
+    more = sums + [45]
+    state, later = run([10] * len(more), more, state)
+    assert later[["date", "provisional"]].values.tolist() == [[date(20), False]]
+    assert state["last_day"].tolist() == [DAY0 + 20]
+    assert state["rating"]["n"].tolist() == [21]
+    history = anomaly.merge_alerts(
+        alerts.assign(app_name="App"), later.assign(app_name="App")
+    )
+    assert history[["date", "provisional"]].values.tolist() == [[date(20), False]]
+
+
+def test_folded_days_are_not_revisited():
+    sums = STEADY + [45]
+    state, _ = run([10] * len(sums), sums)
+    n = state["rating"]["n"].copy()
+    state, alerts = run([10] * len(sums), sums, state)
+    assert alerts.empty and state["rating"]["n"].tolist() == n.tolist()
+
+
+def test_align_adds_new_apps_and_keeps_missing_ones():
+    state = anomaly.empty_state(["a", "c"])
+    state["last_day"][:] = [5, 7]
+    state["rating"]["n"][:] = [3, 4]
+    out, rows = anomaly.align(state, np.array(["b", "c"]))
+    assert out["app_ids"].tolist() == ["a", "b", "c"]
+    assert rows.tolist() == [1, 2]
+    assert out["last_day"].tolist() == [5, -1, 7]
+    assert out["rating"]["n"].tolist() == [3, 0, 4]
+
+
+def test_save_load_round_trip(tmp_path):
+    sums = STEADY + [45]
+    state, _ = run([[10] * len(sums)] * 2, [sums, sums[::-1]])
+    anomaly.save(state, tmp_path / "state.json")
+    loaded = anomaly.load(tmp_path / "state.json")
+    assert loaded["app_ids"].tolist() == state["app_ids"].tolist()
+    assert loaded["last_day"].tolist() == state["last_day"].tolist()
+    for metric in anomaly.METRICS:
+        for stat in anomaly.STATS:
+            assert loaded[metric][stat].dtype == state[metric][stat].dtype
+            np.testing.assert_array_equal(loaded[metric][stat], state[metric][stat])
+    assert anomaly.load(tmp_path / "missing.json") is None
+
+
+def test_empty_cube():
+    state, alerts = run(np.zeros((0, 0)), np.zeros((0, 0)))
+    assert alerts.empty and isinstance(alerts, pd.DataFrame)
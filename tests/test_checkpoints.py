@@ -0,0 +1,39 @@
+from google_play_scraper import Sort, _ContinuationToken
+
+from checkpoints import token_from_state, token_to_state
+
+
+def test_token_round_trip():
+    token = _ContinuationToken("abc", "en", "us", Sort.NEWEST, 200, None, None)
+    state = token_to_state(token)
+    assert state == {
+        "fields": {
+            "token": "abc",
+            "lang": "en",
+            "country": "us",
+            "sort": Sort.NEWEST,
+            "count": 200,
+            "filter_score_with": None,
+            "filter_device_with": None,
+        }
+    }
+    rebuilt = token_from_state(state)
+    assert type(rebuilt) is _ContinuationToken
+    assert vars(rebuilt) == vars(token)
+
+
+def test_class_named_in_state_is_ignored():
+    state = {
+        "class": "os:system",
+        "fields": {"token": "abc", "count": 100, "__class__": "x", "extra": 1},
+    }
+    token = token_from_state(state)
+    assert type(token) is _ContinuationToken
+    assert token.token == "abc" and token.count == 100
+    assert not hasattr(token, "extra")
+
+
+def test_exhausted_token_is_not_kept():
+    assert token_to_state(None) is None
+    assert token_to_state(_ContinuationToken(None, "en", "us", 2, 200, None, None)) is None
+    assert token_from_state(None) is None
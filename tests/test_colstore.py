@@ -0,0 +1,81 @@
+import numpy as np
+
+import colstore
+
+
+SCHEMA = {"rid": "int64", "score": "int8", "at": "int64", "content": "str"}
+APPS = ["b.app", None, "a/app", "ä app"]
+
+
+def rows(n):
+    for i in range(n):
+        yield APPS[i % 7 % len(APPS)], {
+            "rid": i,
+            "score": None if i % 5 == 0 else 1 + i % 5,
+            "at": None if i % 3 == 0 else 1_700_000_000 + i,
+            "content": None if i % 4 == 0 else f"rëview {i}" * (i % 3),
+        }
+
+
+def by_rid(table, columns):
+    # Both tables hold the same rows, but in a different order.
+    order = np.argsort(table["rid"])
+    apps = [None] + table["app_ids"]
+    codes = table["app_code"][order]
+    return [apps[c + 1] for c in codes], {name: table[name][order] for name in columns}
+
+
+def test_write_and_read_back(tmp_path):
+    writer = colstore.PartitionedWriter(tmp_path, SCHEMA, part_rows=4)
+    for app_id, row in rows(50):
+        writer.add(app_id, row)
+    writer.flush()
+    colstore.write_meta(tmp_path, SCHEMA, {})
+
+    table = colstore.read_table(tmp_path, list(SCHEMA))
+    assert table["app_ids"] == sorted(a for a in APPS if a is not None)
+    apps, got = by_rid(table, SCHEMA)
+    expected = list(rows(50))
+    assert apps == [app_id for app_id, _ in expected]
+    assert got["content"].tolist() == [r["content"] for _, r in expected]
+    assert got["score"].tolist() == [
+        colstore.missing_value(np.int8) if r["score"] is None else r["score"]
+        for _, r in expected
+    ]
+    assert np.isnat(got["at"].astype("datetime64[s]")).sum() == 17
+
+    # Only the selected partitions and columns.
+    table = colstore.read_table(tmp_path, ["score"], app_ids=["a/app", None])
+    assert table["app_ids"] == ["a/app"]
+    assert set(table) == {"app_ids", "app_code", "score"}
+    assert sorted(set(table["app_code"].tolist())) == [-1, 0]
+
+
+def test_memory_table_matches_the_written_table(tmp_path):
+    columns = ["rid", "score", "at"]
+    writer = colstore.PartitionedWriter(tmp_path, SCHEMA, part_rows=4)
+    # Small chunks, so codes span several of them before the remap.
+    memory = colstore.MemoryTable(SCHEMA, columns, chunk_rows=3)
+    for app_id, row in rows(50):
+        writer.add(app_id, row)
+        memory.add(app_id, row)
+    writer.flush()
+    colstore.write_meta(tmp_path, SCHEMA, {})
+
+    written = colstore.read_table(tmp_path, columns)
+    in_memory = memory.table()
+    assert in_memory["app_ids"] == written["app_ids"]
+    assert set(in_memory) == set(written)
+    got, expected = by_rid(in_memory, columns), by_rid(written, columns)
+    assert got[0] == expected[0]
+    for name in columns:
+        assert got[1][name].dtype == expected[1][name].dtype
+        np.testing.assert_array_equal(got[1][name], expected[1][name])
+
+
+def test_empty_tables(tmp_path):
+    colstore.write_meta(tmp_path, SCHEMA, {})
+    table = colstore.read_table(tmp_path, ["score", "content"])
+    assert table["app_ids"] == [] and len(table["app_code"]) == 0
+    memory = colstore.MemoryTable(SCHEMA, ["score"]).table()
+    assert memory["app_ids"] == [] and memory["score"].dtype == np.int8
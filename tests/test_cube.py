@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+import cube
+
+
+# Epoch day 20454 is Thursday 2026-01-01.
+DAY0 = 20454
+
+
+def app_daily(rows):
+    # rows: (app_id, day offset, reviews, score_count, score_sum)
+    df = pd.DataFrame(rows, columns=["app_id", "day", *cube.FIELDS])
+    df["day"] += DAY0
+    return df.set_index(["app_id", "day"])
+
+
+def test_build_is_dense_over_apps_and_days():
+    rows = [("b", 0, 2, 2, 9), ("a", 3, 1, 0, 0), (None, 1, 4, 4, 12)]
+    c = cube.build(app_daily(rows))
+    assert c["app_ids"].tolist() == ["", "a", "b"]
+    assert int(c["day0"]) == DAY0
+    assert c["reviews"].tolist() == [[0, 4, 0, 0], [0, 0, 0, 1], [2, 0, 0, 0]]
+    assert cube.dates(c)[[0, -1]].astype(str).tolist() == ["2026-01-01", "2026-01-04"]
+
+
+def test_rolling_windows():
+    days = range(40)
+    c = cube.build(app_daily([("a", d, d + 1, d % 2, 4 * (d % 2)) for d in days]))
+    reviews = np.arange(1, 41)
+    expected_7d = [reviews[max(0, d - 6) : d + 1].sum() for d in days]
+    expected_30d = [reviews[max(0, d - 29) : d + 1].sum() for d in days]
+    assert c["reviews_7d"][0].tolist() == expected_7d
+    assert c["reviews_30d"][0].tolist() == expected_30d
+    # Day 0 has no scores; day 1 onwards always has one in the window.
+    assert np.isnan(c["rating_7d"][0, 0])
+    assert np.allclose(c["rating_7d"][0, 1:], 4.0)
+
+
+def test_week_rollup_starts_on_monday():
+    # Thu 1 Jan .. Mon 12 Jan 2026.
+    c = cube.build(app_daily([("a", d, 1, 1, 5 if d < 4 else 3) for d in range(12)]))
+    week = cube.rollup(c, "week")
+    assert week["labels"].tolist() == ["2025-12-29", "2026-01-05", "2026-01-12"]
+    assert week["reviews"].tolist() == [[4, 7, 1]]
+    assert week["rating"].tolist() == [[5.0, 3.0, 3.0]]
+
+
+def test_month_rollup():
+    rows = [("a", 0, 2, 2, 8), ("a", 31, 3, 1, 1), ("b", 40, 1, 1, 5)]
+    c = cube.build(app_daily(rows))
+    month = cube.rollup(c, "month")
+    assert month["labels"].tolist() == ["2026-01", "2026-02"]
+    assert month["reviews"].tolist() == [[2, 3], [0, 1]]
+    assert np.isnan(month["rating"][1, 0]) and month["rating"][0, 1] == 1.0
+
+
+def test_app_series_and_save_load(tmp_path):
+    c = cube.build(app_daily([("a", 0, 2, 2, 8), ("b", 2, 1, 1, 5)]))
+    cube.save(c, tmp_path / "cube.npz")
+    loaded = cube.load(tmp_path / "cube.npz")
+    assert sorted(loaded) == sorted(c)
+    for name in c:
+        np.testing.assert_array_equal(loaded[name], c[name])
+    series = cube.app_series(loaded, "b")
+    assert series["date"].tolist() == ["2026-01-01", "2026-01-02", "2026-01-03"]
+    assert series["reviews"].tolist() == [0, 0, 1]
+    assert series["reviews_7d"].tolist() == [0, 0, 1]
+    assert cube.app_series(loaded, "zzz") is None
+    assert not list(tmp_path.glob("*.tmp*"))
+
+
+def test_empty():
+    c = cube.build(app_daily([]))
+    assert c["reviews"].shape == (0, 0)
+    assert cube.rollup(c, "week")["labels"].tolist() == []
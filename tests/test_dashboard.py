@@ -0,0 +1,68 @@
+import pytest
+
+import dashboard
+
+
+def app_rows(thumbs=1.0):
+    rows = []
+    for i in range(4):
+        row = {
+            "app_id": f"app{i}",
+            "app_name": f"App {i}",
+            "reviews_count": str(10 * (i + 1)),
+            "avg_rating": str(3 + i / 4),
+            "avg_thumbs_up": str(thumbs * i),
+            "avg_review_length": "50",
+            "rating_std_dev": "1",
+            "review_velocity": "",
+            "avg_sentiment": "0.2" if i else "",
+            "negative_review_pct": "10",
+        }
+        rows.append(dashboard.coerce_row(row, dashboard.APP_KPI_FIELDS))
+    return rows
+
+
+DAILY = [
+    dashboard.coerce_row(
+        {"date": f"2026-01-0{d}", "daily_reviews": "3", "daily_avg_rating": "4"},
+        dashboard.DAILY_KPI_FIELDS,
+    )
+    for d in range(1, 5)
+]
+
+
+@pytest.fixture
+def out(tmp_path, monkeypatch):
+    monkeypatch.setattr(dashboard, "OUT_IMG", tmp_path / "dashboard.png")
+    monkeypatch.setattr(dashboard, "PANEL_DIR", tmp_path / "panels")
+    monkeypatch.setattr(dashboard, "WORKERS", 1)
+    monkeypatch.setattr(dashboard, "DPI", 20)
+    return tmp_path
+
+
+def test_only_changed_panels_are_redrawn(out):
+    assert dashboard.render(app_rows(), DAILY) == list(dashboard.PANELS)
+    stamp = dashboard.OUT_IMG.stat().st_mtime_ns
+    assert dashboard.render(app_rows(), DAILY) == []
+    assert dashboard.OUT_IMG.stat().st_mtime_ns == stamp
+
+    assert dashboard.render(app_rows(thumbs=2.0), DAILY) == ["engagement"]
+    # Replaced panels are removed: one per panel, plus the title.
+    assert len(list(dashboard.PANEL_DIR.glob("*.png"))) == len(dashboard.PANELS) + 1
+    assert dashboard.render(app_rows(thumbs=2.0), DAILY) == []
+
+
+def test_missing_outputs_are_rebuilt_from_cached_panels(out):
+    dashboard.render(app_rows(), DAILY)
+    size = dashboard.Image.open(dashboard.OUT_IMG).size
+    dashboard.OUT_IMG.unlink()
+    dashboard.thumbnail_path(320).unlink()
+    assert dashboard.render(app_rows(), DAILY) == []
+    assert dashboard.Image.open(dashboard.OUT_IMG).size == size
+    assert dashboard.Image.open(dashboard.thumbnail_path(320)).width == 320
+
+
+def test_code_change_redraws_everything(out, monkeypatch):
+    dashboard.render(app_rows(), DAILY)
+    monkeypatch.setattr(dashboard, "code_digest", lambda: "changed")
+    assert dashboard.render(app_rows(), DAILY) == list(dashboard.PANELS)
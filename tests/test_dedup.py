@@ -0,0 +1,91 @@
+import dedup
+from dedup import ReviewIdIndex
+
+
+def rows(*ids):
+    return [{"reviewId": review_id} for review_id in ids]
+
+
+def open_index(tmp_path):
+    return ReviewIdIndex(tmp_path / "ids", capacity=1000)
+
+
+def test_staged_ids_are_dropped_before_commit(tmp_path):
+    index = open_index(tmp_path)
+    assert index.filter_new(rows("a", "b")) == rows("a", "b")
+    assert index.filter_new(rows("b", "c")) == rows("c")
+    index.commit()
+    assert index.filter_new(rows("a", "d")) == rows("d")
+    index.close()
+
+
+def test_rollback_forgets_staged_ids(tmp_path):
+    index = open_index(tmp_path)
+    index.filter_new(rows("a"))
+    index.commit()
+    index.filter_new(rows("b", "c"))
+    index.rollback()
+    positions = index.bloom.positions(["b", "c"])
+    assert not index.bloom.contains(positions).any()
+    assert index.filter_new(rows("a", "b", "c")) == rows("b", "c")
+    index.close()
+
+
+def test_close_does_not_commit(tmp_path):
+    index = open_index(tmp_path)
+    index.filter_new(rows("a"))
+    index.commit()
+    index.filter_new(rows("b"))
+    index.close()
+    index = open_index(tmp_path)
+    assert index.filter_new(rows("a", "b")) == rows("b")
+    assert index.disk_lookups == 1
+    index.close()
+
+
+def test_filter_is_rebuilt_past_its_capacity(tmp_path):
+    index = ReviewIdIndex(tmp_path / "ids", capacity=10)
+    index.filter_new(rows(*[f"r{i}" for i in range(8)]))
+    index.commit()
+    assert index.capacity == 10
+    index.filter_new(rows(*[f"r{i}" for i in range(5, 15)]))
+    index.commit()
+    assert (index.count, index.capacity) == (15, 20)
+    ids = [f"r{i}" for i in range(15)]
+    assert index.bloom.contains(index.bloom.positions(ids)).all()
+    index.close()
+
+    # The count and the grown capacity are kept.
+    index = ReviewIdIndex(tmp_path / "ids", capacity=10)
+    assert (index.count, index.capacity) == (15, 20)
+    assert index.filter_new(rows("r3", "r20")) == rows("r20")
+    assert index.disk_lookups == 1
+    index.close()
+
+
+def test_missing_filter_is_rebuilt(tmp_path):
+    index = open_index(tmp_path)
+    index.filter_new(rows("a", "b"))
+    index.commit()
+    index.close()
+    (tmp_path / "ids.bloom").unlink()
+    index = open_index(tmp_path)
+    assert index.filter_new(rows("a", "b", "c")) == rows("c")
+    index.close()
+
+
+def test_absorb(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "ABSORB_BATCH", 3)
+    shared = ReviewIdIndex(tmp_path / "shared", capacity=10)
+    shared.filter_new(rows("a", "b"))
+    shared.commit()
+    shard = ReviewIdIndex(tmp_path / "shard", capacity=10)
+    shard.filter_new(rows(*"bcdefghijk"))
+    shard.commit()
+    shard.close()
+
+    assert shared.absorb(tmp_path / "shard") == ["b"]
+    # 11 IDs: the filter grew.
+    assert (shared.count, shared.capacity) == (11, 20)
+    assert shared.filter_new(rows(*"abcdefghijkl")) == rows("l")
+    shared.close()
@@ -0,0 +1,173 @@
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from checkpoints import CheckpointStore
+import ingest
+from responsecache import ResponseCache
+
+
+NOW = datetime(2026, 1, 1)
+# Newest first, one review a day.
+REVIEWS = [
+    {"reviewId": f"r{i}", "at": NOW - timedelta(days=i), "score": 1 + i % 5}
+    for i in range(10)
+]
+
+
+class Token:
+    def __init__(self, token):
+        self.token = token
+
+
+def fake_reviews(app_id, lang="en", country="us", sort=None, count=100,
+                 continuation_token=None, **kwargs):
+    # Like the real scraper: most relevant first unless NEWEST is asked for.
+    rows = list(REVIEWS)
+    if sort != ingest.Sort.NEWEST:
+        rows = rows[1::2] + rows[0::2]
+    if continuation_token is not None and continuation_token.token is None:
+        return [], continuation_token
+    start = int(continuation_token.token) if continuation_token else 0
+    end = min(start + count, len(rows))
+    return [dict(r) for r in rows[start:end]], Token(str(end) if end < len(rows) else None)
+
+
+def fetched_ids(monkeypatch, watermark):
+    monkeypatch.setattr(ingest, "reviews", fake_reviews)
+    monkeypatch.setattr(ingest, "MAX_REVIEWS_PER_APP", None)
+    monkeypatch.setattr(ingest, "REVIEWS_PER_PAGE", 3)
+    pages = ingest.iter_review_pages("app", watermark=watermark)
+    return [r["reviewId"] for batch, _ in pages for r in batch]
+
+
+def test_watermark_keeps_every_newer_review(monkeypatch):
+    # r0..r3 are newer than the watermark, whatever order relevance puts
+    # them in.
+    assert fetched_ids(monkeypatch, NOW - timedelta(days=3, hours=12)) == [
+        "r0", "r1", "r2", "r3"
+    ]
+
+
+def test_full_history_in_newest_order(monkeypatch):
+    assert fetched_ids(monkeypatch, None) == [r["reviewId"] for r in REVIEWS]
+
+
+def test_cached_pages_are_newest_first(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest, "responses", ResponseCache(tmp_path / "cache.sqlite"))
+    try:
+        first = fetched_ids(monkeypatch, None)
+        monkeypatch.setattr(ingest, "reviews", None)  # served from the cache
+        second = [
+            r["reviewId"]
+            for batch, _ in ingest.iter_review_pages("app")
+            for r in batch
+        ]
+    finally:
+        ingest.responses.close()
+    assert first == second == [r["reviewId"] for r in REVIEWS]
+
+
+class ListLog:
+    def __init__(self):
+        self.rows = []
+
+    def append(self, rows):
+        self.rows += rows
+        return len(rows)
+
+
+def test_ordered_writer_bounds_pages_of_later_apps(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest, "APPS_OUT", tmp_path / "apps.jsonl")
+    log = ListLog()
+    writer = ingest.OrderedAppWriter(["a", "b"], log, max_buffered=2)
+    writer.set_meta("b", {"appId": "b"})
+
+    def produce_b():
+        for i in range(5):
+            writer.add_page("b", [{"reviewId": f"b{i}", "appId": "b"}])
+        writer.finish_reviews("b")
+
+    producer = threading.Thread(target=produce_b)
+    producer.start()
+    producer.join(timeout=0.5)
+    # Stuck behind "a" once two pages wait.
+    assert producer.is_alive() and writer.buffered == 2
+    writer.set_meta("a", {"appId": "a"})
+    for i in range(3):
+        # The head app is never held back.
+        writer.add_page("a", [{"reviewId": f"a{i}", "appId": "a"}])
+    writer.finish_reviews("a")
+    producer.join(timeout=5)
+    assert not producer.is_alive()
+    assert [r["reviewId"] for r in log.rows] == ["a0", "a1", "a2"] + [
+        f"b{i}" for i in range(5)
+    ]
+    assert writer.buffered == 0
+
+
+def test_reviews_without_a_date_dont_stop_paging(monkeypatch):
+    undated = dict(REVIEWS[1], at=None)
+    rows = [REVIEWS[0], undated] + REVIEWS[2:]
+    monkeypatch.setattr(sys.modules[__name__], "REVIEWS", rows)
+    assert fetched_ids(monkeypatch, NOW - timedelta(days=3, hours=12)) == [
+        "r0", "r1", "r2", "r3"
+    ]
+
+
+def test_capped_pass_is_continued_before_the_watermark_moves(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest, "reviews", fake_reviews)
+    monkeypatch.setattr(ingest, "cached_app", lambda app_id, *args: {"appId": app_id})
+    monkeypatch.setattr(ingest, "APPS_OUT", tmp_path / "apps.jsonl")
+    monkeypatch.setattr(ingest, "SLEEP_SECONDS", 0)
+    monkeypatch.setattr(ingest, "REVIEWS_PER_PAGE", 2)
+    store = CheckpointStore(tmp_path / "checkpoints.json")
+    log = ListLog()
+
+    def run_pass(cap):
+        monkeypatch.setattr(ingest, "MAX_REVIEWS_PER_APP", cap)
+        store.start_run(["app"])
+        before = len(log.rows)
+        ingest.run_sequential(["app"], log, store)
+        return [r["reviewId"] for r in log.rows[before:]]
+
+    # The four oldest reviews, then six newer ones arrive.
+    module = sys.modules[__name__]
+    every = REVIEWS
+    monkeypatch.setattr(module, "REVIEWS", every[6:])
+    assert run_pass(None) == ["r6", "r7", "r8", "r9"]
+    watermark = every[6]["at"].isoformat()
+    monkeypatch.setattr(module, "REVIEWS", every)
+    assert run_pass(4) == ["r0", "r1", "r2", "r3"]
+    assert store.data["apps"]["app"]["watermark"] == watermark
+    assert run_pass(4) == ["r4", "r5"]
+    assert store.data["apps"]["app"]["watermark"] == NOW.isoformat()
+    assert "backfill" not in store.data["apps"]["app"]
+    assert run_pass(4) == []
+
+
+def test_app_is_refetched_when_reviews_show_a_new_version(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest, "responses", ResponseCache(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(ingest, "reviews", fake_reviews)
+    monkeypatch.setattr(ingest, "REVIEWS_PER_PAGE", 3)
+    fetched = []
+
+    def fake_app(app_id, **kwargs):
+        fetched.append(app_id)
+        return {"appId": app_id, "version": str(len(fetched))}
+
+    monkeypatch.setattr(ingest, "gp_app", fake_app)
+    reviews = [dict(r, appVersion="1.9") for r in REVIEWS]
+    monkeypatch.setattr(sys.modules[__name__], "REVIEWS", reviews)
+    try:
+        assert ingest.cached_app("app", "en", "us")["version"] == "1"
+        assert ingest.cached_app("app", "en", "us")["version"] == "1"
+        # The signal's reviews page expired and a newer version shows up.
+        reviews[1]["appVersion"] = "1.10"
+        ingest.responses.db.execute(
+            "UPDATE responses SET fetched_at = 0 WHERE kind = 'reviews'"
+        )
+        assert ingest.cached_app("app", "en", "us")["version"] == "2"
+        assert fetched == ["app", "app"]
+    finally:
+        ingest.responses.close()
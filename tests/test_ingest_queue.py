@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import ingest
+import ingest_queue
+import rawlog
+
+
+NOW = datetime(2026, 1, 1)
+ITER_REVIEW_PAGES = ingest.iter_review_pages
+PAGES = [
+    [
+        {"reviewId": f"r{i}", "at": NOW - timedelta(days=i), "score": 5}
+        for i in range(start, start + 3)
+    ]
+    for start in (0, 3, 6)
+]
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_queue, "QUEUE_DB", tmp_path / "queue.sqlite")
+    monkeypatch.setattr(ingest_queue, "MARKETS_DIR", tmp_path / "markets")
+    monkeypatch.setattr(ingest_queue, "BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(
+        ingest, "cached_app", lambda app_id, *args: {"appId": app_id, "title": "App"}
+    )
+
+    def pages(app_id, call, **kwargs):
+        for page in PAGES:
+            yield [dict(r, appId=app_id) for r in page], None
+
+    monkeypatch.setattr(ingest, "iter_review_pages", pages)
+    queue = ingest_queue.open_queue()
+    queue.enqueue([ingest_queue.app_job("com.app", "en", "us", None, 0)])
+    yield queue
+    queue.close()
+
+
+def market_rows(name):
+    root = ingest_queue.MARKETS_DIR / "en-us"
+    if name == "apps":
+        return (root / "apps.jsonl").read_text().splitlines()
+    return [r["reviewId"] for r in rawlog.read(root / "reviews_log")]
+
+
+def test_retried_app_job_writes_once(queue, monkeypatch):
+    job = queue.lease("w1")
+    ack = queue.ack
+
+    def crash(*args):
+        raise RuntimeError("worker died before the ack")
+
+    monkeypatch.setattr(queue, "ack", crash)
+    with pytest.raises(RuntimeError):
+        ingest_queue.run_app(queue, job, "w1", None)
+    queue.fail(job, "w1", "crash")
+    monkeypatch.setattr(queue, "ack", ack)
+
+    job = queue.lease("w2")
+    assert ingest_queue.run_app(queue, job, "w2", None) == "0 reviews"
+    assert len(market_rows("apps")) == 1
+    assert market_rows("reviews") == [f"r{i}" for i in range(9)]
+    assert queue.counts()["done"] == 1
+    assert not queue.db.execute("SELECT * FROM meta_writes").fetchall()
+
+
+def test_lost_lease_writes_nothing(queue):
+    job = queue.lease("w1")
+    queue.db.execute("UPDATE jobs SET lease_until = 0")
+    assert ingest_queue.run_app(queue, job, "w1", None) == "lease lost"
+    assert not (ingest_queue.MARKETS_DIR / "en-us" / "apps.jsonl").exists()
+
+
+def test_capped_job_is_continued_by_the_next_one(queue, monkeypatch):
+    reviews = [r for page in PAGES for r in page]
+    feed = reviews[6:]
+
+    def fake_reviews(app_id, count=100, continuation_token=None, **kwargs):
+        if continuation_token is not None and continuation_token.token is None:
+            return [], continuation_token
+        start = int(continuation_token.token) if continuation_token else 0
+        end = min(start + count, len(feed))
+        token = SimpleNamespace(token=str(end) if end < len(feed) else None)
+        return [dict(r) for r in feed[start:end]], token
+
+    monkeypatch.setattr(ingest, "iter_review_pages", ITER_REVIEW_PAGES)
+    monkeypatch.setattr(ingest, "reviews", fake_reviews)
+    monkeypatch.setattr(ingest, "REVIEWS_PER_PAGE", 2)
+    monkeypatch.setattr(ingest, "MAX_REVIEWS_PER_APP", 4)
+
+    def run_job():
+        job = queue.lease("w1")
+        result = ingest_queue.run_app(queue, job, "w1", ingest.direct_call)
+        queue.enqueue([ingest_queue.app_job("com.app", "en", "us", None, 0)])
+        return result
+
+    assert run_job() == "3 reviews"
+    feed = reviews
+    assert run_job() == "4 reviews"
+    assert run_job() == "2 reviews"
+    assert run_job() == "0 reviews"
+    assert market_rows("reviews") == ["r6", "r7", "r8"] + [f"r{i}" for i in range(6)]
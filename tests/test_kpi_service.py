@@ -0,0 +1,147 @@
+import json
+
+import pandas as pd
+import pytest
+
+import cube
+import kpi_service
+
+
+APPS = pd.DataFrame(
+    {
+        "app_id": ["a", "b", "c"],
+        "app_name": ["App A", "App B", "App C"],
+        "reviews_count": [10, 30, 20],
+        "avg_rating": [4.5, None, 3.0],
+    }
+)
+DAILY = pd.DataFrame(
+    {"date": ["2026-01-03", "2026-01-01", "2026-01-02"], "reviews_count": [3, 1, 2]}
+)
+# Epoch day 20454 is Thursday 2026-01-01.
+APP_DAILY = pd.DataFrame(
+    {
+        "app_id": ["a", "a", "b"],
+        "day": [20454, 20459, 20454],
+        "reviews": [2, 3, 1],
+        "score_count": [2, 3, 1],
+        "score_sum": [8, 6, 5],
+    }
+).set_index(["app_id", "day"])
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(kpi_service, "RELOAD_CHECK_SECONDS", 0)
+    APPS.to_csv(tmp_path / "app_kpis.csv", index=False)
+    DAILY.to_csv(tmp_path / "daily_kpis.csv", index=False)
+    cube.save(cube.build(APP_DAILY), tmp_path / "kpi_cube.npz")
+    store = kpi_service.KpiStore(
+        tmp_path / "app_kpis.csv", tmp_path / "daily_kpis.csv", tmp_path / "kpi_cube.npz"
+    )
+    return kpi_service.KpiService(store)
+
+
+def get(service, target, status=200):
+    code, body = service.handle(target)
+    assert code == status, body
+    return json.loads(body)
+
+
+def rewrite_apps(service, df):
+    df.to_csv(service.store.app_path, index=False)
+    service.next_check = 0
+
+
+def test_top(service):
+    top = get(service, "/top?metric=reviews_count&k=2")
+    assert [a["app_id"] for a in top["apps"]] == ["b", "c"]
+    top = get(service, "/top?metric=avg_rating&order=asc&k=5")
+    # Missing values go last either way.
+    assert [a["app_id"] for a in top["apps"]] == ["c", "a", "b"]
+    assert get(service, "/top?k=-3")["apps"] == []
+    # A metric the file lacks has no values, so file order.
+    assert [a["app_id"] for a in get(service, "/top?metric=avg_sentiment")["apps"]] == [
+        "a", "b", "c"
+    ]
+    assert "error" in get(service, "/top?metric=nope", status=400)
+    assert "error" in get(service, "/top?k=x", status=400)
+
+
+def test_apps(service):
+    assert get(service, "/apps/b") == {
+        "app_id": "b", "app_name": "App B", "reviews_count": 30, "avg_rating": None
+    }
+    get(service, "/apps/zzz", status=404)
+    get(service, "/nowhere", status=404)
+
+
+def test_daily(service):
+    days = get(service, "/daily")["days"]
+    assert [d["date"] for d in days] == ["2026-01-01", "2026-01-02", "2026-01-03"]
+    days = get(service, "/daily?start=2026-01-02&end=2026-01-02")["days"]
+    assert days == [{"date": "2026-01-02", "reviews_count": 2}]
+    assert get(service, "/daily?start=2026-02-01")["days"] == []
+
+
+def test_trend(service):
+    day = get(service, "/trend?app=a")["series"]
+    assert [d["reviews"] for d in day] == [2, 0, 0, 0, 0, 3]
+    assert day[-1]["reviews_7d"] == 5 and day[-1]["rating_7d"] == 2.8
+    week = get(service, "/trend?app=a&freq=week")["series"]
+    # Mondays: Thursday 1 January falls in the week of 29 December.
+    assert [(w["date"], w["reviews"]) for w in week] == [
+        ("2025-12-29", 2), ("2026-01-05", 3)
+    ]
+    month = get(service, "/trend?app=b&freq=month")["series"]
+    assert month == [{"date": "2026-01", "reviews": 1, "rating": 5.0}]
+    get(service, "/trend?app=zzz", status=404)
+    get(service, "/trend?app=a&freq=year", status=400)
+    get(service, "/trend", status=400)
+
+
+def test_reload_drops_cached_responses(service):
+    assert get(service, "/apps/a")["reviews_count"] == 10
+    assert service.cache.hits == 0 and get(service, "/apps/a")
+    assert service.cache.hits == 1
+    rewrite_apps(service, APPS.assign(reviews_count=[11, 30, 20]))
+    assert get(service, "/apps/a")["reviews_count"] == 11
+    assert get(service, "/health")["reloads"] == 1
+
+
+def test_failed_reload_keeps_serving(service):
+    # Cut off inside a quoted field.
+    service.store.app_path.write_text('app_id,app_name\n"a,App')
+    service.next_check = 0
+    assert get(service, "/apps/a")["reviews_count"] == 10
+    health = get(service, "/health")
+    assert health["reloads"] == 0 and health["reload_errors"] >= 1
+    assert "ParserError" in health["reload_error"]
+    # Retried on the next check.
+    rewrite_apps(service, APPS.assign(reviews_count=[12, 30, 20]))
+    assert get(service, "/apps/a")["reviews_count"] == 12
+    assert get(service, "/health")["reload_error"] is None
+
+
+def test_request_on_the_old_store_is_not_cached_for_the_new(service, monkeypatch):
+    query = service.query
+
+    def reload_midway(target, store=None):
+        # The files change and a reload completes while this request is
+        # still building its response from the old store.
+        rewrite_apps(service, APPS.assign(reviews_count=[13, 30, 20]))
+        service.refresh()
+        return query(target, store)
+
+    monkeypatch.setattr(service, "query", reload_midway)
+    assert get(service, "/apps/a")["reviews_count"] == 10
+    monkeypatch.setattr(service, "query", query)
+    assert get(service, "/apps/a")["reviews_count"] == 13
+
+
+def test_unexpected_error_is_a_response(service, monkeypatch):
+    def broken(*args):
+        raise KeyError("x")
+
+    monkeypatch.setattr(service, "query", broken)
+    assert get(service, "/apps/a", status=500) == {"error": "KeyError: 'x'"}
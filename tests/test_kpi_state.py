@@ -0,0 +1,20 @@
+import warnings
+
+import pandas as pd
+
+import kpi_state
+
+
+def test_median_from_counts_with_categorical_app_ids():
+    app_ids = pd.Categorical(["a", "a", "a", "b"], categories=["a", "b", "unused"])
+    counts = pd.Series(
+        [1, 1, 3, 2],
+        index=pd.MultiIndex.from_arrays(
+            [app_ids, [0, 4, 7, 9]], names=["app_id", "value"]
+        ),
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        median = kpi_state.median_from_counts(counts)
+    # a: 0, 4, 7, 7, 7 -> 7; b: 9, 9 -> 9. No row for the unused category.
+    assert median.to_dict() == {"a": 7, "b": 9}
@@ -0,0 +1,123 @@
+import json
+import re
+import time
+
+import numpy as np
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def out(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", tmp_path)
+    monkeypatch.setattr(metrics, "FORMAT", "both")
+    monkeypatch.setattr(metrics, "PROFILE", False)
+    return tmp_path
+
+
+def failing():
+    raise ValueError("boom")
+
+
+def run_stage():
+    with metrics.stage("demo") as m:
+        with metrics.step("load"):
+            m.rows_in = 100
+        with metrics.step("load"):
+            pass
+        metrics.count("hits", 3)
+        metrics.count("hits")
+        for value in (0.001, 0.01, 0.2, 60):
+            metrics.observe("request_seconds", value, call="reviews")
+        metrics.observe("request_seconds", 0.3, call="app")
+        with pytest.raises(ValueError):
+            metrics.timed_call("call_seconds", failing)
+        m.rows_out = 10
+    return m
+
+
+def test_json_output(out):
+    m = run_stage()
+    data = json.loads((out / "demo.json").read_text())
+    assert data["rows_in"] == 100 and data["rows_out"] == 10
+    assert data["rows_per_sec"] == pytest.approx(100 / m.seconds, rel=0.01)
+    assert list(data["steps"]) == ["load"]
+    assert data["counters"] == {"hits": 4}
+    hists = {(h["name"], h["labels"].get("call")): h for h in data["histograms"]}
+    assert set(hists) == {
+        ("request_seconds", "reviews"),
+        ("request_seconds", "app"),
+        ("call_seconds", "failing"),
+    }
+    reviews = hists["request_seconds", "reviews"]
+    assert reviews["count"] == 4 and reviews["max"] == 60
+    # A value on a bucket bound counts in that bucket; 60 is past the last.
+    assert reviews["buckets"]["0.01"] == 1 and reviews["buckets"]["+Inf"] == 1
+    assert (reviews["p50"], reviews["p99"]) == (0.01, 60)
+    # Nothing is recorded outside a stage() block.
+    metrics.count("hits")
+    assert m.counters == {"hits": 4}
+
+
+def test_prometheus_output(out):
+    run_stage()
+    text = (out / "demo.prom").read_text()
+    samples = {}
+    types = []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            types.append(line.split()[2])
+            continue
+        name, value = re.fullmatch(r"(\S+) (\S+)", line).groups()
+        samples[name] = float(value)
+    assert len(types) == len(set(types))
+    assert samples['pipeline_stage_rows_in{stage="demo"}'] == 100
+    assert samples['pipeline_count{stage="demo",name="hits"}'] == 4
+    labels = 'stage="demo",call="reviews"'
+    buckets = [
+        samples[f'pipeline_request_seconds_bucket{{{labels},le="{bound}"}}']
+        for bound in metrics.LATENCY_BUCKETS + ["+Inf"]
+    ]
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == samples[f"pipeline_request_seconds_count{{{labels}}}"] == 4
+    assert samples[f"pipeline_request_seconds_sum{{{labels}}}"] == pytest.approx(60.211)
+    # A histogram's label sets share one TYPE line and follow it directly.
+    lines = text.splitlines()
+    rows = [i for i, line in enumerate(lines) if "pipeline_request_seconds" in line]
+    assert rows == list(range(rows[0], rows[-1] + 1))
+    assert lines[rows[0]] == "# TYPE pipeline_request_seconds histogram"
+
+
+def test_off_writes_nothing(out, monkeypatch):
+    monkeypatch.setattr(metrics, "FORMAT", "off")
+    run_stage()
+    assert not list(out.iterdir())
+
+
+def test_peak_rss_is_per_stage(out):
+    if metrics.rss_mb() is None:
+        pytest.skip("no /proc to sample RSS from")
+    with metrics.stage("big") as big:
+        block = np.ones(200 * 1024 * 1024 // 8)
+        time.sleep(3 * metrics.RSS_SAMPLE_SECONDS)
+        del block
+    with metrics.stage("small") as small:
+        pass
+    assert big.to_dict()["peak_rss_scope"] == "stage"
+    # The process-wide peak includes the first stage's block.
+    assert big.peak_rss - small.peak_rss > 150
+    assert small.peak_rss < metrics.peak_rss_mb() - 150
+    assert 'pipeline_stage_peak_rss_mb{stage="small",scope="stage"}' in (
+        out / "small.prom"
+    ).read_text()
+
+
+def test_peak_rss_falls_back_to_the_process(out, monkeypatch):
+    monkeypatch.setattr(metrics, "rss_mb", lambda: None)
+    with metrics.stage("demo") as m:
+        pass
+    data = m.to_dict()
+    assert data["peak_rss_scope"] == "process"
+    assert data["peak_rss_mb"] == round(metrics.peak_rss_mb(), 1)
+    assert m.summary().endswith("MB (process)")
@@ -0,0 +1,78 @@
+import pipeline
+from pipeline import Stage
+
+
+# Counts its runs in state.json, which it also reads.
+SCRIPT = """
+import json
+from pathlib import Path
+
+state = Path("state.json")
+runs = json.loads(state.read_text())["runs"] + 1 if state.exists() else 1
+state.write_text(json.dumps({"runs": runs}))
+Path("out.csv").write_text("x\\n")
+"""
+
+
+def run(stage):
+    ran, skipped, failed = pipeline.run_pipeline([stage])
+    assert not failed
+    return ran
+
+
+def test_own_state_and_optional_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "script.py").write_text(SCRIPT)
+    stage = Stage(
+        "count",
+        code=[str(tmp_path / "script.py")],
+        inputs=["state.json"],
+        outputs=["out.csv"],
+        optional=["state.json", "extra.csv"],
+    )
+    assert run(stage) == ["count"]
+    # Its own state changed, but nothing else did.
+    assert run(stage) == []
+    (tmp_path / "state.json").write_text('{"runs": 10}')
+    assert run(stage) == ["count"]
+    assert run(stage) == []
+    # An optional output that appeared since.
+    (tmp_path / "extra.csv").write_text("stale\n")
+    assert run(stage) == ["count"]
+    assert (tmp_path / "state.json").read_text() == '{"runs": 12}'
+
+
+def test_source_stage_accepts_either_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "fetch.py").write_text("raise SystemExit(1)\n")
+    (tmp_path / "apps.jsonl").write_text("")
+    stage = Stage(
+        "fetch",
+        code=[str(tmp_path / "fetch.py")],
+        outputs=["apps.jsonl"],
+        one_of=["reviews_log", "reviews.jsonl"],
+        source=True,
+    )
+    assert pipeline.run_pipeline([stage], dry_run=True)[0] == ["fetch"]
+    (tmp_path / "reviews.jsonl").write_text("")
+    assert pipeline.run_pipeline([stage])[:2] == ([], ["fetch"])
+    assert pipeline.run_pipeline([stage], refresh=True)[2] == ["fetch"]
+
+
+def test_stages_run_in_dependency_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, body in [("a", ""), ("b", "raise SystemExit(3)"), ("c", "")]:
+        (tmp_path / f"{name}.py").write_text(
+            f"from pathlib import Path\nPath('{name}.out').write_text('x')\n{body}\n"
+        )
+
+    def stage(name, deps):
+        return Stage(
+            name, code=[str(tmp_path / f"{name}.py")], outputs=[f"{name}.out"], deps=deps
+        )
+
+    # Listed out of order; c needs the failing b.
+    stages = [stage("c", ["b"]), stage("b", ["a"]), stage("a", [])]
+    ran, skipped, failed = pipeline.run_pipeline(stages)
+    assert (ran, skipped, failed) == (["a"], [], ["b", "c"])
+    assert not (tmp_path / "c.out").exists()
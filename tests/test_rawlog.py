@@ -0,0 +1,86 @@
+import json
+from datetime import datetime
+
+import rawlog
+
+
+def review(i, app, day):
+    return {"reviewId": f"r{i}", "appId": app, "at": datetime(2026, 1, day, 12)}
+
+
+ROWS = [review(0, "a", 1), review(1, "a", 2), review(2, "b", 5), review(3, "a", 9)]
+
+
+def ids(rows):
+    return [r["reviewId"] for r in rows]
+
+
+def test_round_trip_one_block_per_app_run(tmp_path):
+    root = tmp_path / "log"
+    with rawlog.RawLog(root) as log:
+        assert log.append(ROWS) == 4
+        assert log.append([review(4, None, 3)]) == 1
+    rows = list(rawlog.read(root))
+    assert ids(rows) == ["r0", "r1", "r2", "r3", "r4"]
+    # Datetimes are stored as strings.
+    assert rows[0]["at"] == "2026-01-01 12:00:00"
+    entries, _ = rawlog.read_index(root)
+    assert [(e["app"], e["rows"]) for e in entries] == [
+        ("a", 2), ("b", 1), ("a", 1), (None, 1)
+    ]
+    assert entries[0]["min_at"] == "2026-01-01 12:00:00"
+    assert entries[0]["max_at"] == "2026-01-02 12:00:00"
+
+
+def test_block_selection(tmp_path):
+    root = tmp_path / "log"
+    with rawlog.RawLog(root) as log:
+        log.append(ROWS)
+    assert ids(rawlog.read(root, app_ids=["a"])) == ["r0", "r1", "r3"]
+    assert ids(rawlog.read(root, start="2026-01-02", end="2026-01-06")) == ["r1", "r2"]
+    assert ids(rawlog.read(root, app_ids=["b"], end="2026-01-05")) == []
+    entries, _ = rawlog.read_index(root)
+    blocks = rawlog.select_blocks(entries, start="2026-01-03")
+    assert [e["app"] for e in blocks] == ["b", "a"]
+
+
+def test_segments_rotate(tmp_path):
+    root = tmp_path / "log"
+    with rawlog.RawLog(root, segment_bytes=1) as log:
+        log.append(ROWS)
+    entries, _ = rawlog.read_index(root)
+    assert [e["segment"] for e in entries] == [0, 1, 2]
+    assert ids(rawlog.read(root)) == ["r0", "r1", "r2", "r3"]
+    assert ids(rawlog.read(root, app_ids=["b"])) == ["r2"]
+
+
+def test_recover_cuts_unindexed_bytes(tmp_path):
+    root = tmp_path / "log"
+    with rawlog.RawLog(root, segment_bytes=200) as log:
+        log.append(ROWS[:2])
+    size = (root / rawlog.segment_name(0)).stat().st_size
+    # An append that died after writing its data: a block without an index
+    # line, a half-written index line and a segment nobody points to.
+    with (root / rawlog.segment_name(0)).open("ab") as f:
+        f.write(b"\x1f\x8b partial block")
+    with (root / rawlog.INDEX_NAME).open("ab") as f:
+        f.write(json.dumps({"segment": 0})[:5].encode())
+    (root / rawlog.segment_name(1)).write_bytes(b"orphan")
+
+    with rawlog.RawLog(root, segment_bytes=200) as log:
+        assert (root / rawlog.segment_name(0)).stat().st_size == size
+        assert not (root / rawlog.segment_name(1)).exists()
+        log.append(ROWS[2:])
+    assert ids(rawlog.read(root)) == ["r0", "r1", "r2", "r3"]
+    lines = (root / rawlog.INDEX_NAME).read_text().splitlines()
+    assert all(json.loads(line) for line in lines)
+
+
+def test_import_jsonl(tmp_path):
+    src = tmp_path / "reviews.jsonl"
+    src.write_text(
+        "".join(json.dumps(r, default=str) + "\n" for r in ROWS) + "\n", encoding="utf-8"
+    )
+    assert rawlog.import_jsonl(src, tmp_path / "log", block_rows=3) == 4
+    assert ids(rawlog.read(tmp_path / "log")) == ids(ROWS)
+    assert rawlog.exists(tmp_path / "log")
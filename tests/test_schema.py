@@ -0,0 +1,112 @@
+import json
+
+import schema
+from schema import Decoder, Field
+
+
+DECODER = Decoder(
+    {
+        "id": Field("str", source="reviewId", required=True),
+        "score": Field("int", min=1, max=5),
+        "rating": Field("float", min=0, max=5),
+        "installs": Field("count", min=0),
+        "at": Field("timestamp"),
+    }
+)
+
+
+def reasons(objs):
+    rows, rejects = DECODER.decode(objs)
+    return rows, [reason for _, reason in rejects]
+
+
+def test_valid_rows_are_converted():
+    rows, rejected = reasons(
+        [
+            {"reviewId": "a", "score": 5, "rating": 4.5, "installs": "1,000+", "at": "2026-01-02T03:04:05"},
+            {"reviewId": "b", "score": "3", "rating": 4, "installs": 10.0, "at": None},
+            {"reviewId": 7, "rating": "", "at": "2026-01-02T03:04:05+02:00"},
+        ]
+    )
+    assert rejected == []
+    assert rows == [
+        {"id": "a", "score": 5, "rating": 4.5, "installs": 1000, "at": "2026-01-02 03:04:05"},
+        {"id": "b", "score": 3, "rating": 4.0, "installs": 10, "at": None},
+        {"id": "7", "score": None, "rating": None, "installs": None, "at": "2026-01-02 01:04:05"},
+    ]
+
+
+def test_reject_reasons():
+    rows, rejected = reasons(
+        [
+            {"reviewId": "ok", "score": 1},
+            {"score": 1},
+            {"reviewId": "", "score": 1},
+            {"reviewId": "x", "score": "five"},
+            {"reviewId": "x", "score": 2.5},
+            {"reviewId": "x", "score": True},
+            {"reviewId": "x", "score": 9},
+            {"reviewId": "x", "installs": -1},
+            {"reviewId": "x", "at": 1767225600},
+            {"reviewId": ["x"]},
+            "not json object",
+            # The first failing column is reported.
+            {"score": "five", "at": "never"},
+        ]
+    )
+    assert [row["id"] for row in rows] == ["ok"]
+    assert rejected == [
+        "id: missing",
+        "id: missing",
+        "score: not an integer",
+        "score: not an integer",
+        "score: not an integer",
+        "score: out of range",
+        "installs: out of range",
+        "at: not a timestamp",
+        "id: not a string",
+        "not an object",
+        "id: missing",
+    ]
+
+
+def test_nan_and_infinity_are_rejected():
+    objs = json.loads(
+        '[{"reviewId": "a", "rating": NaN}, {"reviewId": "b", "rating": Infinity},'
+        ' {"reviewId": "c", "rating": 4.5}, {"reviewId": "d", "rating": "-Infinity"},'
+        ' {"reviewId": "e", "rating": null}]'
+    )
+    rows, rejected = reasons(objs)
+    assert [row["id"] for row in rows] == ["c", "e"]
+    assert rejected == ["rating: not a number"] * 3
+    # The same without strings in the column (the all-float fast path).
+    rows, rejected = reasons(objs[:3])
+    assert [row["id"] for row in rows] == ["c"]
+    assert rejected == ["rating: not a number"] * 2
+
+
+def test_timestamp_bisection_finds_each_bad_value():
+    values = [f"2026-01-{1 + i % 28:02d}T00:00:00" for i in range(100)]
+    bad = [0, 1, 37, 64, 99]
+    for i in bad:
+        values[i] = f"day {i}"
+    values[50] = None
+    out, problems = schema.decode_timestamp(values)
+    assert sorted(problems) == [(i, "not a timestamp") for i in bad]
+    for i, value in enumerate(out):
+        if i in bad or i == 50:
+            assert value is None
+        else:
+            assert value == values[i].replace("T", " ")
+
+
+def test_timestamp_batch_without_bad_values_is_parsed_once(monkeypatch):
+    calls = []
+    parse = schema.parse_timestamps
+    monkeypatch.setattr(schema, "parse_timestamps", lambda v: calls.append(len(v)) or parse(v))
+    out, problems = schema.decode_timestamp(["2026-01-01T00:00:00"] * 10)
+    assert problems == [] and calls == [10]
+    calls.clear()
+    schema.decode_timestamp(["2026-01-01T00:00:00"] * 7 + ["bad"])
+    # Halves down to the bad value: [8] -> [4, 4] -> [2, 2] -> [1, 1].
+    assert calls == [8, 4, 4, 2, 2, 1, 1]
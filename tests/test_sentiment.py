@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sentiment
+
+
+def scores(*contents):
+    codes, uniques, review = sentiment.tokenize_batch(list(contents))
+    return sentiment.sentiment_scores(codes, uniques, review, len(contents)).tolist()
+
+
+def test_scores():
+    good, very_good, not_good, empty, missing, crash = scores(
+        "Good app", "VERY good app", "not good at all", "", None, "It crashes. Bugs!"
+    )
+    assert 0 < good < very_good < 1
+    assert not_good < 0 and crash < 0
+    assert empty == missing == 0
+    # Curly apostrophes count as negators too.
+    assert scores("don’t love it")[0] < 0
+    # A review's negator doesn't reach into the next review.
+    assert scores("not", "good")[1] == pytest.approx(good)
+
+
+def test_complaint_counts():
+    codes, uniques, review = sentiment.tokenize_batch(
+        [
+            "sync keeps failing, sync keeps failing",
+            "sync keeps failing",
+            "app is not syncing",
+        ]
+    )
+    counts = sentiment.complaint_counts(
+        codes, uniques, review, ["a", "a", "b"], [1, 5, 2]
+    )
+    got = {(r.app_id, r.ngram): r.count for r in counts.itertuples()}
+    # The score-5 review doesn't count; phrases can't start or end with a
+    # stopword, nor end with a negator.
+    assert got == {
+        ("a", "sync keeps"): 2,
+        ("a", "keeps failing"): 2,
+        ("a", "failing sync"): 1,
+        ("a", "sync keeps failing"): 2,
+        ("a", "keeps failing sync"): 1,
+        ("a", "failing sync keeps"): 1,
+        ("b", "not syncing"): 1,
+    }
+
+
+@pytest.fixture
+def reviews(tmp_path, monkeypatch):
+    monkeypatch.setattr(sentiment, "REVIEWS_IN", tmp_path / "reviews.csv")
+    monkeypatch.setattr(sentiment, "REVIEWS_PARTS_DIR", tmp_path / "parts")
+    monkeypatch.setattr(sentiment, "REVIEWS_COLUMNAR", tmp_path / "columnar")
+    monkeypatch.setattr(sentiment, "CACHE", tmp_path / "cache.sqlite")
+    monkeypatch.setattr(sentiment, "WORKERS", 1)
+    monkeypatch.setattr(sentiment, "BATCH_ROWS", 7)
+    rng = np.random.default_rng(0)
+    texts = [
+        "love it, great notes",
+        "crashes every time, sync keeps failing",
+        "not bad",
+        "sync keeps failing again",
+        "too slow, lost my notes",
+        "",
+    ]
+    df = pd.DataFrame(
+        {
+            "reviewId": [f"r{i}" for i in range(60)],
+            "app_id": rng.choice(["a", "b", "c"], 60),
+            "score": rng.integers(1, 6, 60),
+            "content": [texts[i % len(texts)] for i in range(60)],
+        }
+    )
+
+    def write(rows):
+        rows.to_csv(sentiment.REVIEWS_IN, index=False)
+
+    return df, write
+
+
+def fresh(df, write):
+    # The same input scored with an empty cache.
+    write(df)
+    sentiment.SentimentCache.reset(sentiment.CACHE)
+    return sentiment.compute_sentiment()
+
+
+def test_incremental_runs_match_a_fresh_run(reviews, monkeypatch):
+    df, write = reviews
+    write(df.iloc[:40])
+    sentiment.compute_sentiment()
+    counted = {}
+    monkeypatch.setattr(sentiment.metrics, "count", counted.__setitem__)
+
+    write(df)
+    result, complaints = sentiment.compute_sentiment()
+    assert counted == {"reviews_scored": 20, "sentiment_cache_hits": 40}
+    assert result["reviews_scored"].sum() == 60
+    expected = fresh(df, write)
+    pd.testing.assert_frame_equal(result, expected[0])
+    pd.testing.assert_frame_equal(complaints, expected[1])
+
+
+def test_removed_reviews_rebuild_the_cache(reviews, monkeypatch):
+    df, write = reviews
+    write(df)
+    sentiment.compute_sentiment()
+    counted = {}
+    monkeypatch.setattr(sentiment.metrics, "count", counted.__setitem__)
+
+    write(df.iloc[20:])
+    result, complaints = sentiment.compute_sentiment()
+    # Rescored from scratch, so the complaint counts drop with the reviews.
+    assert counted == {"reviews_scored": 40, "sentiment_cache_hits": 0}
+    expected = fresh(df.iloc[20:], write)
+    pd.testing.assert_frame_equal(result, expected[0])
+    pd.testing.assert_frame_equal(complaints, expected[1])
@@ -0,0 +1,52 @@
+import json
+
+import pandas as pd
+import pytest
+
+import serve
+import transform
+
+
+# Review text that pandas would read as missing by default.
+CONTENTS = ["NA", "null", "N/A", "", "  ", "nan", " works fine ", None]
+
+
+@pytest.fixture
+def processed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw_dir = tmp_path / "data" / "raw"
+    raw_dir.mkdir(parents=True)
+    (tmp_path / "data" / "processed").mkdir()
+    with (raw_dir / "apps.jsonl").open("w") as f:
+        for i in range(2):
+            f.write(json.dumps({"appId": f"app{i}", "title": f"App {i}"}) + "\n")
+    with (raw_dir / "reviews.jsonl").open("w") as f:
+        for i in range(24):
+            review = {
+                "appId": f"app{i % 2}",
+                "reviewId": f"r{i}",
+                "score": 1 + i % 5,
+                "thumbsUpCount": i % 3,
+                "content": CONTENTS[i % len(CONTENTS)],
+                "at": f"2026-01-{1 + i % 5:02d}T10:00:00",
+            }
+            f.write(json.dumps(review) + "\n")
+    monkeypatch.setattr(transform, "TEXT_INDEX", False)
+    monkeypatch.setattr(transform, "REVIEWS_FORMATS", ("csv", "columnar"))
+    names = transform.transform_apps()
+    transform.prepare_outputs(names)
+    transform.transform_reviews(names)
+    return tmp_path
+
+
+def test_csv_and_columnar_kpis_match(processed):
+    from_csv, names = serve.load_reviews_csv()
+    from_columns, _ = serve.load_reviews_columnar()
+    assert sorted(set(from_csv["content_length"])) == [0, 2, 3, 4, 10]
+    pd.testing.assert_frame_equal(
+        serve.compute_app_kpis(from_csv, names),
+        serve.compute_app_kpis(from_columns, names),
+    )
+    pd.testing.assert_frame_equal(
+        serve.compute_daily_kpis(from_csv), serve.compute_daily_kpis(from_columns)
+    )
@@ -0,0 +1,68 @@
+import numpy as np
+
+import sketches
+
+
+QS = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def rank_error(values, estimates):
+    # How far each estimate's rank is from its q (ties count as exact).
+    values = np.sort(values)
+    lo = np.searchsorted(values, estimates, side="left") / len(values)
+    hi = np.searchsorted(values, estimates, side="right") / len(values)
+    return np.maximum(np.maximum(lo - QS, QS - hi), 0).max()
+
+
+def test_kll_rank_error_in_batches():
+    values = np.random.default_rng(0).uniform(0, 1, 300_000)
+    kll = sketches.KllSketch()
+    for batch in np.array_split(values, 300):
+        kll.update(batch)
+    assert kll.n == len(values)
+    assert kll.size() <= kll.max_size() < 4 * kll.k
+    assert rank_error(values, kll.quantiles(QS)) < 0.008
+
+
+def test_kll_merge_matches_one_pass():
+    values = np.random.default_rng(1).exponential(10, 200_000).round()
+    parts = [sketches.KllSketch() for _ in range(4)]
+    for i, batch in enumerate(np.array_split(values, 100)):
+        parts[i % 4].update(batch)
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    assert merged.n == len(values)
+    assert rank_error(values, merged.quantiles(QS)) < 0.008
+
+
+def test_kll_small_inputs_are_exact():
+    kll = sketches.KllSketch()
+    kll.update([5, 1, np.nan, 3, 2, 4])
+    assert kll.quantiles([0, 0.5, 1]) == [1.0, 3.0, 5.0]
+    assert sketches.KllSketch().quantiles([0.5]) == [None]
+
+
+def test_leading_zeros():
+    words = np.array([0, 1, 2**31, 2**32, 2**63, 2**64 - 1], dtype=np.uint64)
+    expected = [64 - int(w).bit_length() for w in words]
+    assert sketches.leading_zeros(words).tolist() == expected
+
+
+def test_hll_error():
+    for n, tolerance in [(100, 0.01), (1000, 0.02), (200_000, 0.05)]:
+        hll = sketches.HyperLogLog()
+        ids = [f"user{i}" for i in range(n)]
+        hll.add_hashes(sketches.hash_values(ids))
+        # Repeats don't count.
+        hll.add_hashes(sketches.hash_values(ids[: n // 2]))
+        assert abs(hll.count() - n) <= tolerance * n
+
+
+def test_hll_merge_is_union():
+    ids = [f"user{i}" for i in range(50_000)]
+    a, b, both = sketches.HyperLogLog(), sketches.HyperLogLog(), sketches.HyperLogLog()
+    a.add_hashes(sketches.hash_values(ids[:30_000]))
+    b.add_hashes(sketches.hash_values(ids[20_000:]))
+    both.add_hashes(sketches.hash_values(ids))
+    assert a.merge(b).registers.tolist() == both.registers.tolist()
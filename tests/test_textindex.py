@@ -0,0 +1,144 @@
+import random
+
+import numpy as np
+import pytest
+
+import textindex
+
+
+WORDS = ["sync", "crash", "notes", "meeting", "speaker", "labels", "zoom", "ok"]
+QUERIES = [
+    "sync",
+    "sync crash",
+    '"speaker labels"',
+    '"labels speaker"',
+    "notes -zoom",
+    '-"meeting notes" sync',
+    "crash OR zoom",
+    '"meeting notes" OR speaker -ok',
+    "missing",
+    "-sync",
+]
+
+
+def corpus(n, seed=0):
+    rng = random.Random(seed)
+    contents = [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randrange(0, 8))).title()
+        for _ in range(n)
+    ]
+    contents[::17] = [None] * len(contents[::17])
+    app_ids = [rng.choice(["a", "b", None]) for _ in range(n)]
+    scores = [rng.choice([1, 2, 3, 4, 5, None]) for _ in range(n)]
+    return contents, app_ids, scores
+
+
+def brute_force(contents, query):
+    def has(tokens, terms):
+        k = len(terms)
+        return any(tuple(tokens[i : i + k]) == terms for i in range(len(tokens)))
+
+    rows = []
+    for row, content in enumerate(contents):
+        tokens = textindex.tokenize(content)
+        if any(
+            all(has(tokens, terms) != negate for negate, terms in group)
+            for group in textindex.parse_query(query)
+        ):
+            rows.append(row)
+    return rows
+
+
+def build(root, contents, app_ids, scores, runs=1):
+    # `runs` incremental runs over growing prefixes of the rows.
+    for i in range(1, runs + 1):
+        meta = textindex.read_meta(root)
+        skip, segments = (meta["rows"], meta["segments"]) if meta else (0, [])
+        writer = textindex.IndexWriter(root, skip=skip, segments=segments)
+        end = len(contents) * i // runs
+        for start in range(0, end, 7):
+            stop = min(start + 7, end)
+            writer.add(contents[start:stop], app_ids[start:stop], scores[start:stop])
+        writer.close()
+    return textindex.ReviewIndex(root)
+
+
+def test_varint_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 2**35, 2**64 - 1], dtype=np.uint64)
+    blob, sizes = textindex.varint_encode(values)
+    assert sizes.tolist() == [1, 1, 1, 2, 2, 6, 10]
+    assert len(blob) == sizes.sum()
+    assert textindex.varint_decode(blob).tolist() == values.tolist()
+    assert textindex.varint_decode(textindex.varint_encode([])[0]).tolist() == []
+
+
+def test_parse_query():
+    assert textindex.parse_query('Sync "Speaker Labels" -zoom -"a b" OR x') == [
+        [(False, ("sync",)), (False, ("speaker", "labels")), (True, ("zoom",)),
+         (True, ("a", "b"))],
+        [(False, ("x",))],
+    ]
+    # Nothing to search for: empty groups and phrases are dropped.
+    assert textindex.parse_query('OR "" - !') == []
+
+
+@pytest.mark.parametrize("segment_rows", [1000, 40])
+def test_search_matches_brute_force(tmp_path, monkeypatch, segment_rows):
+    monkeypatch.setattr(textindex, "SEGMENT_ROWS", segment_rows)
+    contents, app_ids, scores = corpus(300)
+    index = build(tmp_path / "index", contents, app_ids, scores)
+    assert index.rows == 300
+    assert len(index.segments) == -(-300 // segment_rows)
+    for query in QUERIES:
+        assert index.search(query).tolist() == brute_force(contents, query), query
+
+
+def test_filters_and_facets(tmp_path):
+    contents, app_ids, scores = corpus(300, seed=1)
+    index = build(tmp_path / "index", contents, app_ids, scores)
+    rows = index.search("sync", app_ids=["a"], min_score=2, max_score=4)
+    expected = [
+        r
+        for r in brute_force(contents, "sync")
+        if app_ids[r] == "a" and scores[r] is not None and 2 <= scores[r] <= 4
+    ]
+    assert rows.tolist() == expected
+    rows = index.search("crash")
+    apps, by_score = index.facets(rows)
+    hits = brute_force(contents, "crash")
+    for app_id in ("a", "b", None):
+        assert apps.get(app_id, 0) == sum(app_ids[r] == app_id for r in hits)
+    for score in (1, 2, 3, 4, 5, None):
+        assert by_score.get(score, 0) == sum(scores[r] == score for r in hits)
+    assert list(apps.values()) == sorted(apps.values(), reverse=True)
+
+
+def test_incremental_runs_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(textindex, "SEGMENT_ROWS", 100)
+    contents, app_ids, scores = corpus(300, seed=2)
+    root = tmp_path / "index"
+    index = build(root, contents, app_ids, scores, runs=12)
+    # 12 segments of 25 rows would be left without merging.
+    assert [seg.rows for seg in index.segments] == [100, 100, 100]
+    assert sorted(p.name for p in root.glob("seg-*")) == textindex.read_meta(root)[
+        "segments"
+    ]
+    for query in QUERIES:
+        assert index.search(query).tolist() == brute_force(contents, query), query
+    rows = index.search("notes", app_ids=["b"], max_score=3)
+    assert rows.tolist() == [
+        r
+        for r in brute_force(contents, "notes")
+        if app_ids[r] == "b" and scores[r] is not None and scores[r] <= 3
+    ]
+    apps, by_score = index.facets(index.search("zoom"))
+    hits = brute_force(contents, "zoom")
+    assert apps.get(None, 0) == sum(app_ids[r] is None for r in hits)
+    assert by_score.get(None, 0) == sum(scores[r] is None for r in hits)
+
+
+def test_few_small_segments_are_left_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(textindex, "SEGMENT_ROWS", 100)
+    contents, app_ids, scores = corpus(60, seed=3)
+    index = build(tmp_path / "index", contents, app_ids, scores, runs=3)
+    assert [seg.rows for seg in index.segments] == [20, 20, 20]
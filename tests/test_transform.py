@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+import transform
+
+
+APPS = [{"appId": f"app{i}", "title": f"App {i}"} for i in range(3)]
+# r5 shows up again in a later shard, r7 twice in the same one.
+IDS = [f"r{i}" for i in range(40)] + ["r5", "r41", "r7", "r7", "r42"] + ["r12"] * 3
+
+
+@pytest.fixture
+def raw(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw_dir = tmp_path / "data" / "raw"
+    raw_dir.mkdir(parents=True)
+    (tmp_path / "data" / "processed").mkdir()
+    with (raw_dir / "apps.jsonl").open("w") as f:
+        f.writelines(json.dumps(app) + "\n" for app in APPS)
+    with (raw_dir / "reviews.jsonl").open("w") as f:
+        for i, review_id in enumerate(IDS):
+            review = {
+                "appId": f"app{i % 3}",
+                "reviewId": review_id,
+                "score": 1 + i % 5,
+                "content": f"review number {i}",
+                "at": f"2026-01-{1 + i % 28:02d}T10:00:00",
+            }
+            f.write(json.dumps(review) + "\n")
+    monkeypatch.setattr(transform, "TEXT_INDEX", False)
+    # A few rows per shard.
+    monkeypatch.setattr(transform, "SHARD_BYTES", 600)
+    monkeypatch.setattr(transform, "WORKERS", 2)
+    return tmp_path
+
+
+def run(parallel):
+    transform.clear_quarantine()
+    names = transform.transform_apps()
+    transform.prepare_outputs(names)
+    if parallel:
+        result = transform.transform_reviews_parallel(names)
+    else:
+        result = transform.transform_reviews(names)
+    return result, transform.REVIEWS_OUT.read_text()
+
+
+def test_parallel_drops_duplicates_across_shards(raw):
+    assert len(transform.shard_ranges(transform.REVIEWS_IN, transform.SHARD_BYTES)) > 3
+    sequential = run(parallel=False)
+    parallel = run(parallel=True)
+    assert sequential[0] == (42, 6, 0)
+    assert parallel == sequential
+    assert not list((raw / "data" / "processed").glob("review_ids*"))